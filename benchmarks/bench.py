@@ -0,0 +1,270 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from standins import StandInServer, add_profile_arguments, profiles_from_args, synthetic_text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+APPS = ('v1', 'v2')
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """Peak resident set size of a process so far (Linux only)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class AppProcess:
+    """One of the apps running in a subprocess against the stand-ins"""
+
+    def __init__(self, name: str, upstream: str, workdir: str, env: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.env = dict(os.environ)
+        if name == 'v1':
+            self.env.update(
+                RESEARCH_AGENT_ARXIV_API_URL=f'{upstream}/api/query',
+                # Keep the app's polite spacing out of the numbers unless asked for
+                RESEARCH_AGENT_ARXIV_INTERVAL=self.env.get('RESEARCH_AGENT_ARXIV_INTERVAL', '0'),
+                RESEARCH_AGENT_SEARCH_CACHE='',
+                RESEARCH_AGENT_EMBEDDING_STORE=os.path.join(workdir, 'embedding_store'),
+                RESEARCH_AGENT_ANN_INDEX=os.path.join(workdir, 'ann_index'),
+                RESEARCH_AGENT_BM25_INDEX=os.path.join(workdir, 'bm25_index'),
+                RESEARCH_AGENT_IDF_TABLE='',
+            )
+        else:
+            self.env.update(
+                SEMANTIC_SCHOLAR_API_URL=f'{upstream}/graph/v1',
+                OPENAI_BASE_URL=f'{upstream}/v1',
+                RELATED_WORK_SCORE_CACHE='',
+                RELATED_WORK_SEARCH_CACHE='',
+                SEMANTIC_SCHOLAR_RATE=self.env.get('SEMANTIC_SCHOLAR_RATE', '1000'),
+                SEMANTIC_SCHOLAR_BURST=self.env.get('SEMANTIC_SCHOLAR_BURST', '1000'),
+                OPENAI_RATE=self.env.get('OPENAI_RATE', '1000'),
+                OPENAI_BURST=self.env.get('OPENAI_BURST', '1000'),
+            )
+        self.env.update(env or {})
+        self.process = None
+
+    def start(self, timeout: float = 300) -> float:
+        """Start the app's threaded dev server and wait until it is ready; returns seconds taken"""
+        started = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', f'from app import app; app.run(host="127.0.0.1", port={self.port}, '
+                                   f'threaded=True)'],
+            cwd=os.path.join(ROOT, self.name), env=self.env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        probe = f'{self.url}/api/ready' if self.name == 'v1' else f'{self.url}/'
+        while time.perf_counter() - started < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'{self.name} exited with code {self.process.returncode} during startup')
+            try:
+                if requests.get(probe, timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f'{self.name} not ready after {timeout}s')
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def v1_request(url: str, n: int) -> Callable[[requests.Session], bool]:
+    # Distinct abstracts, so the result cache never answers for the pipeline
+    abstract = synthetic_text(f'v1-{n}', 150)
+
+    def send(session: requests.Session) -> bool:
+        response = session.post(f'{url}/api/search', json={'abstract': abstract}, timeout=300)
+        return response.status_code == 200 and response.json().get('success', False)
+    return send
+
+
+def v2_request(url: str, n: int) -> Callable[[requests.Session], bool]:
+    abstract = synthetic_text(f'v2-{n}', 150)
+
+    def send(session: requests.Session) -> bool:
+        response = session.post(f'{url}/related-work', json={'abstract': abstract, 'openai_api_key': 'stand-in'},
+                                timeout=600)
+        return response.status_code == 200
+    return send
+
+
+def run_level(app: AppProcess, standins: StandInServer, concurrency: int, requests_per_level: int,
+              offset: int) -> Dict:
+    """Send ``requests_per_level`` requests, ``concurrency`` at a time, and summarize them"""
+    make_request = v1_request if app.name == 'v1' else v2_request
+    local = threading.local()
+
+    def timed(n: int) -> Tuple[float, bool]:
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        send = make_request(app.url, offset + n)
+        started = time.perf_counter()
+        try:
+            ok = send(session)
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    calls_before = standins.stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, range(requests_per_level)))
+    elapsed = time.perf_counter() - started
+    calls_after = standins.stats()
+
+    latencies = [seconds * 1000 for seconds, ok in outcomes if ok]
+    return {
+        'app': app.name,
+        'concurrency': concurrency,
+        'requests': len(outcomes),
+        'ok': len(latencies),
+        'errors': len(outcomes) - len(latencies),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': _round(percentile(latencies, 50)),
+            'p95': _round(percentile(latencies, 95)),
+            'p99': _round(percentile(latencies, 99)),
+            'mean': _round(sum(latencies) / len(latencies)) if latencies else None,
+            'max': _round(max(latencies)) if latencies else None,
+        },
+        'upstream_calls': {
+            service: {key: calls_after[service][key] - calls_before[service][key] for key in counts}
+            for service, counts in calls_after.items()
+            if calls_after[service]['calls'] != calls_before[service]['calls']
+        },
+        'peak_rss_mb': peak_rss_mb(app.process.pid),
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+def benchmark(apps: List[str], concurrency: List[int], requests_per_level: int, standins: StandInServer,
+              warmup: int = 1) -> Dict:
+    report = {'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': [], 'startup_seconds': {}}
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    try:
+        for name in apps:
+            app = AppProcess(name, standins.url, os.path.join(workdir, name))
+            report['startup_seconds'][name] = round(app.start(), 2)
+            try:
+                # Warm-up requests load lazy state (models, connections) before anything is timed
+                if warmup:
+                    run_level(app, standins, 1, warmup, offset=-warmup)
+                offset = 0
+                for level in concurrency:
+                    result = run_level(app, standins, level, requests_per_level, offset)
+                    offset += requests_per_level
+                    latency = result['latency_ms']
+                    print(f"{name} c={level}: {result['throughput_rps']} req/s, p50 {latency['p50']} ms, "
+                          f"p95 {latency['p95']} ms, p99 {latency['p99']} ms, {result['errors']} errors, "
+                          f"peak RSS {result['peak_rss_mb']} MB")
+                    report['results'].append(result)
+            finally:
+                app.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def compare(previous: Dict, current: Dict) -> None:
+    """Print how throughput and tail latency moved against an earlier report"""
+    baseline = {(r['app'], r['concurrency']): r for r in previous['results']}
+    for result in current['results']:
+        before = baseline.get((result['app'], result['concurrency']))
+        if before is None:
+            continue
+        changes = []
+        for label, old, new in (('req/s', before['throughput_rps'], result['throughput_rps']),
+                                ('p50', before['latency_ms']['p50'], result['latency_ms']['p50']),
+                                ('p95', before['latency_ms']['p95'], result['latency_ms']['p95']),
+                                ('p99', before['latency_ms']['p99'], result['latency_ms']['p99'])):
+            if old and new is not None:
+                changes.append(f'{label} {(new - old) / old:+.1%}')
+        print(f"{result['app']} c={result['concurrency']}: {', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test v1 /api/search and v2 /related-work against '
+                                                 'local upstream stand-ins')
+    parser.add_argument('--apps', default='v1,v2', help='comma-separated apps to drive (v1, v2)')
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=32, help='requests sent at each concurrency level')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed requests before the first level')
+    parser.add_argument('--out', default=None, help='JSON report path (default: results/<timestamp>.json)')
+    parser.add_argument('--compare', default=None, help='earlier JSON report to compare against')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    apps = [name.strip() for name in args.apps.split(',')]
+    if any(name not in APPS for name in apps):
+        parser.error(f"--apps must be drawn from {', '.join(APPS)}")
+
+    standins = StandInServer(('127.0.0.1', 0), profiles_from_args(args), recordings=args.recordings)
+    standins.start()
+    try:
+        report = benchmark(apps, [int(level) for level in args.concurrency.split(',')], args.requests,
+                           standins, warmup=args.warmup)
+    finally:
+        standins.shutdown()
+    report['config'] = {key: value for key, value in vars(args).items() if key not in ('out', 'compare')}
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{report['started_at'].replace(':', '')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report -> {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+SERVICES = ('arxiv', 'semantic_scholar', 'openai')
+
+WORDS = ('neural network graph model learning training data language image vision protein structure '
+         'policy reward robot speech audio diffusion sampling attention transformer retrieval kernel '
+         'bayesian inference optimization gradient convex sparse tensor quantum molecule clinical '
+         'benchmark dataset representation contrastive generative adversarial reinforcement').split()
+
+
+def synthetic_text(seed: str, words: int) -> str:
+    rng = random.Random(seed)
+    return ' '.join(rng.choices(WORDS, k=words))
+
+
+def _stable_int(text: str) -> int:
+    return int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+
+
+class UpstreamProfile:
+    """Latency and failure behaviour of one stand-in service"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Local stand-ins for arXiv, Semantic Scholar and OpenAI chat completions.
+
+    Routes mirror the real APIs closely enough for both apps:
+
+    - ``GET /api/query`` returns an arXiv Atom feed
+    - ``GET /graph/v1/paper/search`` returns Semantic Scholar search JSON
+    - ``POST /graph/v1/paper/batch`` returns full records for a list of IDs
+    - ``POST /v1/chat/completions`` answers query-generation and compare
+      prompts with well-formed JSON
+
+    Responses are synthetic and deterministic in the request, or replayed
+    from ``recordings`` (a directory with ``arxiv.xml``,
+    ``semantic_scholar.json`` and/or ``openai.json`` response bodies).
+    Each service sleeps for its profile's latency and fails with a 503 at
+    its error rate, and arXiv reports ``arxiv_total`` results per query.
+    ``GET /_stats`` returns the per-service call, error and response byte
+    counters.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, profiles: Optional[Dict[str, UpstreamProfile]] = None,
+                 recordings: Optional[str] = None, seed: int = 0, arxiv_total: int = 1000):
+        super().__init__(address, _Handler)
+        self.arxiv_total = arxiv_total
+        self.profiles = {name: (profiles or {}).get(name) or UpstreamProfile() for name in SERVICES}
+        self.recordings = {}
+        for name, filename in (('arxiv', 'arxiv.xml'), ('semantic_scholar', 'semantic_scholar.json'),
+                               ('openai', 'openai.json')):
+            path = os.path.join(recordings, filename) if recordings else None
+            if path and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    self.recordings[name] = f.read()
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {name: {'calls': 0, 'errors': 0, 'bytes': 0} for name in SERVICES}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def should_fail(self, service: str) -> bool:
+        profile = self.profiles[service]
+        with self._lock:
+            self.counters[service]['calls'] += 1
+            failed = self.rng.random() < profile.error_rate
+            if failed:
+                self.counters[service]['errors'] += 1
+            delay = max(0.0, profile.latency + self.rng.uniform(-profile.jitter, profile.jitter))
+        if delay:
+            time.sleep(delay)
+        return failed
+
+    def sent(self, service: str, size: int) -> None:
+        with self._lock:
+            self.counters[service]['bytes'] += size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {name: dict(counts) for name, counts in self.counters.items()}
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name='stand-ins', daemon=True)
+        thread.start()
+        return thread
+
+
+def arxiv_feed(query: str, start: int, max_results: int, total: int = 1000) -> bytes:
+    entries = []
+    for n in range(start, min(start + max_results, total)):
+        paper_id = f'{2400 + _stable_int(query) % 100}.{n:05d}v1'
+        entries.append(f"""<entry>
+<id>http://arxiv.org/abs/{paper_id}</id>
+<published>2024-01-01T00:00:00Z</published>
+<title>{escape(synthetic_text(paper_id + 'title', 8))}</title>
+<summary>{escape(synthetic_text(query + paper_id, 150))}</summary>
+<author><name>Author {n}</name></author>
+<link href="http://arxiv.org/abs/{paper_id}" rel="alternate" type="text/html"/>
+</entry>""")
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+<title>arXiv Query: {escape(query)}</title>
+<opensearch:totalResults>{total}</opensearch:totalResults>
+<opensearch:startIndex>{start}</opensearch:startIndex>
+{''.join(entries)}
+</feed>""".encode()
+
+
+S2_FIELDS = 'paperId,title,authors,year,venue,url,abstract'
+
+
+def s2_paper(paper_id: str, fields: str = S2_FIELDS) -> Dict:
+    builders = {
+        'paperId': lambda: paper_id,
+        'title': lambda: synthetic_text(paper_id + 'title', 8),
+        'authors': lambda: [{'name': f'Author {paper_id[:6]}'}],
+        'year': lambda: 2000 + _stable_int(paper_id) % 25,
+        'venue': lambda: 'Synthetic Venue',
+        'url': lambda: f'https://www.semanticscholar.org/paper/{paper_id}',
+        # Like the real index, some papers come without an abstract
+        'abstract': lambda: None if _stable_int(paper_id) % 10 == 0 else synthetic_text(paper_id, 150),
+    }
+    # paperId is always returned, as by the real API
+    return {field: builders[field]() for field in ['paperId'] + fields.split(',') if field in builders}
+
+
+def s2_search(query: str, limit: int, offset: int = 0, fields: str = S2_FIELDS) -> bytes:
+    # Overlapping id ranges across queries, so the apps see duplicate candidates
+    base = _stable_int(query) % 40
+    ids = [hashlib.sha1(f'paper{base + n}'.encode()).hexdigest() for n in range(offset, offset + limit)]
+    return json.dumps({'total': 1000, 'offset': offset,
+                       'data': [s2_paper(paper_id, fields) for paper_id in ids]}).encode()
+
+
+def s2_batch(ids, fields: str = S2_FIELDS) -> bytes:
+    # Unknown IDs (anything not a 40-character hex id here) come back as null
+    return json.dumps([s2_paper(paper_id, fields) if re.fullmatch(r'[0-9a-f]{40}', str(paper_id)) else None
+                       for paper_id in ids]).encode()
+
+
+def _score(text: str) -> int:
+    return _stable_int(text) % 101
+
+
+def chat_completion(body: Dict) -> bytes:
+    messages = body.get('messages', [])
+    system = next((m['content'] for m in messages if m.get('role') == 'system'), '')
+    user = next((m['content'] for m in messages if m.get('role') == 'user'), '')
+    if 'search queries' in system:
+        content = json.dumps([synthetic_text(user + str(n), 6) for n in range(10)])
+    elif 'several candidate papers' in system:
+        content = json.dumps([{'paperId': paper_id, 'score': _score(paper_id), 'note': 'Synthetic score.'}
+                              for paper_id in re.findall(r'^paperId: (\S+)$', user, flags=re.MULTILINE)])
+    else:
+        content = json.dumps({'score': _score(user), 'note': 'Synthetic score.'})
+    return json.dumps({
+        'id': 'chatcmpl-standin',
+        'object': 'chat.completion',
+        'model': body.get('model', ''),
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': len(user) // 4, 'completion_tokens': len(content) // 4,
+                  'total_tokens': (len(user) + len(content)) // 4},
+    }).encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, service: Optional[str] = None) -> None:
+        if service is not None:
+            self.server.sent(service, len(body))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fail(self) -> None:
+        self._send(503, b'{"error": "stand-in injected failure"}', 'application/json')
+
+    def do_GET(self) -> None:
+        server: StandInServer = self.server
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/_stats':
+            self._send(200, json.dumps(server.stats()).encode(), 'application/json')
+        elif url.path == '/api/query':
+            if server.should_fail('arxiv'):
+                return self._fail()
+            body = server.recordings.get('arxiv') or arxiv_feed(
+                params.get('search_query', ''), int(params.get('start', 0)), int(params.get('max_results', 10)),
+                total=server.arxiv_total)
+            self._send(200, body, 'application/atom+xml', 'arxiv')
+        elif url.path == '/graph/v1/paper/search':
+            if server.should_fail('semantic_scholar'):
+                return self._fail()
+            body = server.recordings.get('semantic_scholar') or s2_search(
+                params.get('query', ''), int(params.get('limit', 10)), int(params.get('offset', 0)),
+                params.get('fields', S2_FIELDS))
+            self._send(200, body, 'application/json', 'semantic_scholar')
+        else:
+            self._send(404, b'{"error": "not found"}', 'application/json')
+
+    def do_POST(self) -> None:
+        server: StandInServer = self.server
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if url.path == '/graph/v1/paper/batch':
+            if server.should_fail('semantic_scholar'):
+                return self._fail()
+            fields = parse_qs(url.query).get('fields', [S2_FIELDS])[0]
+            self._send(200, s2_batch(json.loads(body or b'{}').get('ids', []), fields), 'application/json',
+                       'semantic_scholar')
+        elif url.path == '/v1/chat/completions':
+            if server.should_fail('openai'):
+                return self._fail()
+            self._send(200, server.recordings.get('openai') or chat_completion(json.loads(body or b'{}')),
+                       'application/json', 'openai')
+        else:
+            self._send(404, b'{"error": "not found"}', 'application/json')
+
+
+def profiles_from_args(args) -> Dict[str, UpstreamProfile]:
+    return {
+        name: UpstreamProfile(
+            latency=getattr(args, f'{name}_latency') if getattr(args, f'{name}_latency') is not None
+            else args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+        )
+        for name in SERVICES
+    }
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds each stand-in call takes')
+    parser.add_argument('--arxiv-latency', type=float, default=None, help='override --latency for arXiv')
+    parser.add_argument('--semantic-scholar-latency', type=float, default=None,
+                        help='override --latency for Semantic Scholar')
+    parser.add_argument('--openai-latency', type=float, default=None, help='override --latency for OpenAI')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform +/- jitter on every latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answered with a 503')
+    parser.add_argument('--recordings', default=None, help='directory of recorded response bodies to replay')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve local stand-ins for the arXiv, Semantic Scholar '
+                                                 'and OpenAI APIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    server = StandInServer((args.host, args.port), profiles_from_args(args), recordings=args.recordings)
+    print(f"Stand-ins listening on {server.url}")
+    print(f"  RESEARCH_AGENT_ARXIV_API_URL={server.url}/api/query")
+    print(f"  SEMANTIC_SCHOLAR_API_URL={server.url}/graph/v1")
+    print(f"  OPENAI_BASE_URL={server.url}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index over an EmbeddingStore.
+
+    Vectors are clustered with spherical k-means into ``nlist`` lists. A
+    query scans only the ``nprobe`` lists whose centroids are closest, so
+    ``nprobe`` trades recall for latency (``nprobe == nlist`` is exact).
+    Each list's vectors are stored contiguously in float16 and memory-mapped
+    on load. Store rows appended after the index was built are scanned by
+    brute force until the next rebuild, and tombstoned rows are skipped
+    (and left out of the next build). Each build writes a fresh directory
+    that is swapped in as a whole (see publish_index).
+    """
+
+    FILES = ('centroids.npy', 'offsets.npy', 'rows.npy', 'vectors.npy')
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray,
+                 vectors: np.ndarray, store: EmbeddingStore, nprobe: int = 8,
+                 indexed_rows: Optional[int] = None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.vectors = vectors
+        self.store = store
+        self.nprobe = nprobe
+        # Store rows below this were considered by the build (tombstoned ones are left out)
+        self.indexed_rows = len(rows) if indexed_rows is None else indexed_rows
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, store: EmbeddingStore, directory: str, nlist: Optional[int] = None,
+              iterations: int = 10, sample_size: int = 50_000, chunk_size: int = 8192,
+              seed: int = 0) -> 'IVFIndex':
+        """Cluster every vector currently in ``store`` and write the index to ``directory``.
+
+        Memory use is bounded by the k-means sample and ``chunk_size``; the
+        reordered vectors are streamed straight to disk.
+        """
+        total = len(store)
+        live = np.setdiff1d(np.arange(total, dtype=np.int64), store.tombstones())
+        n = len(live)
+        if n == 0:
+            raise ValueError('Cannot build an index over an empty embedding store')
+        if nlist is None:
+            nlist = int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+
+        rng = np.random.default_rng(seed)
+        sample_rows = live[np.sort(rng.choice(n, size=min(n, max(sample_size, nlist)), replace=False))]
+        sample = _normalize(store.get_vectors(sample_rows))
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = _assign(sample, centroids, chunk_size)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            # Re-seed empty clusters so every list stays useful
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+
+        assignment = np.empty(n, dtype=np.int32)
+        for start in range(0, n, chunk_size):
+            assignment[start:start + chunk_size] = _assign(store.get_vectors(live[start:start + chunk_size]),
+                                                           centroids, chunk_size)
+
+        order = live[np.argsort(assignment, kind='stable')]
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=nlist))
+
+        staging = staging_directory(directory)
+        vectors = np.lib.format.open_memmap(os.path.join(staging, 'vectors.npy'), mode='w+',
+                                            dtype=np.float16, shape=(n, store.dim))
+        for start in range(0, n, chunk_size):
+            vectors[start:start + chunk_size] = _normalize(
+                store.get_vectors(order[start:start + chunk_size])
+            ).astype(np.float16)
+        vectors.flush()
+        del vectors
+        for name, array in (('centroids.npy', centroids.astype(np.float32)),
+                            ('offsets.npy', offsets), ('rows.npy', order)):
+            with open(os.path.join(staging, name), 'wb') as f:
+                np.save(f, array)
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump({'nlist': nlist, 'rows': total, 'indexed': n, 'dim': store.dim, 'built_at': time.time()}, f)
+        publish_index(staging, directory)
+
+        return cls.load(directory, store)
+
+    @classmethod
+    def load(cls, directory: str, store: EmbeddingStore, nprobe: int = 8) -> 'IVFIndex':
+        # Resolve the link once so every file comes from the same build
+        directory = os.path.realpath(directory)
+        arrays = [np.load(os.path.join(directory, name), mmap_mode='r') for name in cls.FILES]
+        centroids, offsets, rows, vectors = arrays
+        if vectors.shape[1] != store.dim:
+            raise ValueError(f'Index dimension {vectors.shape[1]} does not match store dimension {store.dim}')
+        indexed_rows = None
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                indexed_rows = json.load(f).get('rows')
+        return cls(np.asarray(centroids), np.asarray(offsets), rows, vectors, store, nprobe=nprobe,
+                   indexed_rows=indexed_rows)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return all(os.path.exists(os.path.join(directory, name)) for name in IVFIndex.FILES)
+
+    def search(self, query: np.ndarray, k: int = 100, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k store rows by cosine similarity to ``query``.
+
+        Returns (rows, similarities), most similar first.
+        """
+        query = _normalize(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probed = np.arange(self.nlist)
+
+        candidate_rows = []
+        candidate_scores = []
+        for list_id in probed:
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            candidate_rows.append(self.rows[start:end])
+            candidate_scores.append(self.vectors[start:end].astype(np.float32) @ query)
+
+        # Rows added to the store since the index was built
+        total = len(self.store)
+        if total > self.indexed_rows:
+            tail = np.arange(self.indexed_rows, total)
+            candidate_rows.append(tail)
+            candidate_scores.append(_normalize(self.store.get_vectors(tail)) @ query)
+
+        if not candidate_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        rows = np.concatenate(candidate_rows)
+        scores = np.concatenate(candidate_scores)
+        tombstones = self.store.tombstones()
+        if len(tombstones):
+            live = ~np.isin(rows, tombstones)
+            rows, scores = rows[live], scores[live]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return np.asarray(rows[order], dtype=np.int64), scores[order]
+
+
+def staging_directory(directory: str) -> str:
+    """Create an empty directory next to ``directory`` to build a new version of an index in"""
+    staging = f'{os.path.abspath(directory)}.building.{time.time_ns()}'
+    os.makedirs(staging)
+    return staging
+
+
+def publish_index(staging: str, directory: str) -> None:
+    """Make the index built in ``staging`` the one at ``directory``, in a single rename.
+
+    ``directory`` is a symlink to the current version, so readers that
+    resolve it once per load see either the old build or the new one,
+    never a mix. The version being replaced is kept for readers still
+    loading it; older ones are deleted. An index directory from before
+    versioning is moved aside first, which briefly leaves no index.
+    """
+    directory = os.path.abspath(directory)
+    version = f'{directory}.{time.time_ns()}'
+    os.rename(staging, version)
+    previous = os.path.realpath(directory) if os.path.islink(directory) else None
+    if os.path.isdir(directory) and not os.path.islink(directory):
+        previous = f'{directory}.{time.time_ns()}'
+        os.rename(directory, previous)
+        previous = os.path.realpath(previous)
+    link = f'{directory}.link'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(version), link)
+    os.replace(link, directory)
+
+    parent, prefix = os.path.split(directory)
+    keep = {os.path.realpath(version), previous}
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if name.startswith(prefix + '.') and name[len(prefix) + 1:].isdigit() and os.path.realpath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int) -> np.ndarray:
+    """Index of the nearest centroid for each vector, computed in chunks"""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        assignment[start:start + chunk_size] = np.argmax(
+            vectors[start:start + chunk_size] @ centroids.T, axis=1
+        )
+    return assignment
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def main():
+    from research_agent import ANN_INDEX_DIR, EMBEDDING_STORE_DIR
+
+    parser = argparse.ArgumentParser(description='Build the ANN index over the local embedding store')
+    parser.add_argument('--store', default=EMBEDDING_STORE_DIR, help='embedding store directory')
+    parser.add_argument('--out', default=ANN_INDEX_DIR, help='index output directory')
+    parser.add_argument('--dim', type=int, default=384, help='embedding dimension')
+    parser.add_argument('--nlist', type=int, default=None, help='number of lists (default 4*sqrt(N))')
+    parser.add_argument('--iterations', type=int, default=10, help='k-means iterations')
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.store, args.dim, read_only=True)
+    print(f"Building index over {len(store)} papers...")
+    start = time.perf_counter()
+    index = IVFIndex.build(store, args.out, nlist=args.nlist, iterations=args.iterations)
+    print(f"Built {index.nlist} lists in {time.perf_counter() - start:.1f}s -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,50 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, g, request, jsonify, render_template_string
 from flask_cors import CORS
-from research_agent import ResearchAgent
+from metrics import cache_samples, collect_timings, registry
+from research_agent import LIVE_QUERIES, ResearchAgent, SOURCES
+from result_cache import ResultCache
 import os
+import time
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize the research agent
-agent = ResearchAgent()
+# Initialize the research agent; the encoder loads in the background so the
+# server can bind immediately. Requests that need it wait for the warm-up.
+_started = time.perf_counter()
+agent = ResearchAgent(lazy=True)
+agent.start_warm_up()
+
+# Upper bound on abstracts accepted by /api/search/batch
+MAX_BATCH_ABSTRACTS = 500
+# Upper bound on focused arXiv queries per abstract
+MAX_QUERIES = 5
+
+# Finished /api/search results, so repeated abstracts skip the whole pipeline
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('RESEARCH_AGENT_RESULT_CACHE_SIZE', '256')),
+    ttl=float(os.environ.get('RESEARCH_AGENT_RESULT_CACHE_TTL', '900'))
+)
+
+registry.stage_histogram('research_agent_stage_seconds', 'Time spent in each pipeline stage')
+REQUEST_SECONDS = registry.histogram('research_agent_request_seconds', 'End-to-end request latency')
+
+def cache_metrics():
+    search_cache = agent.search_cache.stats() if agent.search_cache is not None else None
+    return (cache_samples('research_agent', 'result', result_cache.stats())
+            + cache_samples('research_agent', 'arxiv_search', search_cache))
+
+registry.add_collector(cache_metrics)
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    if request.endpoint and request.endpoint != 'metrics':
+        REQUEST_SECONDS.observe(time.perf_counter() - g.started, endpoint=request.endpoint)
+    return response
 
 @app.route('/')
 def index():
@@ -370,6 +407,31 @@ def index():
 </html>
     """)
 
+@app.route('/api/ready')
+def ready():
+    """Readiness probe: 200 once the encoder is loaded, 503 until then"""
+    if agent.ready:
+        return jsonify({'ready': True, 'startup_seconds': round(agent.startup_seconds, 2)})
+    status = {'ready': False, 'waiting_seconds': round(time.perf_counter() - _started, 2)}
+    if agent.load_error:
+        status['error'] = agent.load_error
+    return jsonify(status), 503
+
+@app.route('/api/stats')
+def stats():
+    """Hit and miss counters for the result and arXiv search caches"""
+    search_cache = agent.search_cache.stats() if agent.search_cache is not None else None
+    return jsonify({'result_cache': result_cache.stats(), 'search_cache': search_cache})
+
+@app.route('/metrics')
+def metrics():
+    """Stage latency histograms, upstream request counts and cache hit rates in Prometheus format"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def page_warnings(errors):
+    """Messages for arXiv pages that failed, so callers know the results may be incomplete"""
+    return [f'arXiv results may be incomplete: {error}' for error in errors]
+
 @app.route('/api/search', methods=['POST'])
 def search_papers():
     try:
@@ -379,25 +441,110 @@ def search_papers():
         if not abstract:
             return jsonify({'success': False, 'error': 'Abstract is required'})
 
-        # Find related papers
-        related_papers = agent.find_related_papers(abstract)
-
-        # Format the results
-        formatted_papers = []
-        for paper, similarity in related_papers:
-            formatted_paper = agent.format_paper_info(paper, similarity)
-            formatted_papers.append(formatted_paper)
-
-        return jsonify({
+        source = data.get('source', 'live')
+        if source not in SOURCES:
+            return jsonify({'success': False, 'error': f"source must be one of {', '.join(SOURCES)}"})
+
+        nprobe = data.get('nprobe')
+        if nprobe is not None and (not isinstance(nprobe, int) or isinstance(nprobe, bool) or nprobe < 1):
+            return jsonify({'success': False, 'error': 'nprobe must be a positive integer'})
+
+        n_queries = data.get('queries', LIVE_QUERIES)
+        if not isinstance(n_queries, int) or isinstance(n_queries, bool) or not 1 <= n_queries <= MAX_QUERIES:
+            return jsonify({'success': False, 'error': f'queries must be an integer between 1 and {MAX_QUERIES}'})
+
+        include_timings = data.get('timings', False)
+        if not isinstance(include_timings, bool):
+            return jsonify({'success': False, 'error': 'timings must be a boolean'})
+
+        def search():
+            # Find related papers
+            errors = []
+            related_papers = agent.find_related_papers(abstract, source=source, nprobe=nprobe,
+                                                       n_queries=n_queries, errors=errors)
+
+            # Format the results
+            formatted_papers = []
+            for paper, similarity in related_papers:
+                formatted_paper = agent.format_paper_info(paper, similarity)
+                formatted_papers.append(formatted_paper)
+            return formatted_papers, page_warnings(errors)
+
+        # Identical requests share one computation, including ones still running; results
+        # missing arXiv pages are not cached so the next request retries them
+        cache_key = ResultCache.make_key(abstract, source=source, nprobe=nprobe, n_queries=n_queries)
+        with collect_timings() as timings:
+            formatted_papers, warnings = result_cache.get_or_compute(cache_key, search,
+                                                                     cacheable=lambda result: not result[1])
+
+        response = {
             'success': True,
             'papers': formatted_papers,
-            'total_found': len(formatted_papers)
-        })
+            'total_found': len(formatted_papers),
+            'warnings': warnings
+        }
+        if include_timings:
+            # Empty stages mean the result came from the result cache
+            response['timings'] = timings.as_dict()
+        return jsonify(response)
 
     except Exception as e:
         print(f"Error in search_papers: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/search/batch', methods=['POST'])
+def search_papers_batch():
+    try:
+        data = request.json
+        abstracts = data.get('abstracts')
+
+        if not isinstance(abstracts, list) or not abstracts \
+                or not all(isinstance(a, str) and a.strip() for a in abstracts):
+            return jsonify({'success': False, 'error': 'abstracts must be a non-empty list of non-empty strings'})
+
+        if len(abstracts) > MAX_BATCH_ABSTRACTS:
+            return jsonify({'success': False, 'error': f'At most {MAX_BATCH_ABSTRACTS} abstracts per request'})
+
+        k = data.get('k', 20)
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            return jsonify({'success': False, 'error': 'k must be a positive integer'})
+
+        threshold = data.get('threshold', 0.3)
+        if not isinstance(threshold, (int, float)) or isinstance(threshold, bool):
+            return jsonify({'success': False, 'error': 'threshold must be a number'})
+
+        source = data.get('source', 'live')
+        if source not in SOURCES:
+            return jsonify({'success': False, 'error': f"source must be one of {', '.join(SOURCES)}"})
+
+        n_queries = data.get('queries', LIVE_QUERIES)
+        if not isinstance(n_queries, int) or isinstance(n_queries, bool) or not 1 <= n_queries <= MAX_QUERIES:
+            return jsonify({'success': False, 'error': f'queries must be an integer between 1 and {MAX_QUERIES}'})
+
+        include_timings = data.get('timings', False)
+        if not isinstance(include_timings, bool):
+            return jsonify({'success': False, 'error': 'timings must be a boolean'})
+
+        errors = []
+        with collect_timings() as timings:
+            batch = agent.find_related_papers_batch([a.strip() for a in abstracts], k=k,
+                                                    threshold=threshold, source=source, n_queries=n_queries,
+                                                    errors=errors)
+
+        results = []
+        for related_papers in batch:
+            formatted_papers = [agent.format_paper_info(paper, similarity) for paper, similarity in related_papers]
+            results.append({'papers': formatted_papers, 'total_found': len(formatted_papers)})
+
+        response = {'success': True, 'results': results, 'warnings': page_warnings(errors)}
+        if include_timings:
+            response['timings'] = timings.as_dict()
+        return jsonify(response)
+
+    except Exception as e:
+        print(f"Error in search_papers_batch: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
 if __name__ == '__main__':
     print("Starting Research Paper Agent...")
     print("Open http://127.0.0.1:5000 in your browser")
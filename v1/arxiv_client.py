@@ -0,0 +1,194 @@
+import contextvars
+import os
+import queue
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import requests
+
+from metrics import count, observe, registry, span
+
+# Overridable to point at a local stand-in (see benchmarks/)
+ARXIV_API_URL = os.environ.get('RESEARCH_AGENT_ARXIV_API_URL', 'http://export.arxiv.org/api/query')
+
+# arXiv asks API clients to leave about three seconds between requests
+ARXIV_REQUEST_INTERVAL = float(os.environ.get('RESEARCH_AGENT_ARXIV_INTERVAL', '3'))
+ARXIV_PAGE_SIZE = int(os.environ.get('RESEARCH_AGENT_ARXIV_PAGE_SIZE', '100'))
+# Pages downloading at once; request starts are still spaced by the interval
+ARXIV_PAGE_WORKERS = int(os.environ.get('RESEARCH_AGENT_ARXIV_PAGE_WORKERS', '4'))
+# Entries a page may parse ahead of the consumer before its download waits, so at most
+# about workers * buffer entries are held however many results are requested
+ARXIV_PAGE_BUFFER = int(os.environ.get('RESEARCH_AGENT_ARXIV_PAGE_BUFFER', '32'))
+ARXIV_TIMEOUT = (5, 30)
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+OPENSEARCH = '{http://a9.com/-/spec/opensearch/1.1/}'
+
+
+class ArxivPageError(Exception):
+    """One page of an arXiv query failed"""
+
+    def __init__(self, start: int, error: Exception):
+        super().__init__(f'results {start}+: {error}')
+        self.start = start
+        self.error = error
+
+
+class RequestSpacer:
+    """Keeps request start times at least ``interval`` seconds apart across threads"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+arxiv_spacer = RequestSpacer(ARXIV_REQUEST_INTERVAL)
+
+UPSTREAM_REQUESTS = registry.counter('research_agent_upstream_requests_total',
+                                     'Requests sent to upstream APIs, by outcome')
+
+
+def upstream_request(service: str, outcome: str) -> None:
+    UPSTREAM_REQUESTS.inc(service=service, outcome=outcome)
+    count(f'{service}_requests')
+
+
+def parse_feed(chunks: Iterable[bytes], on_total=None) -> Iterator[Dict]:
+    """Parse an Atom feed incrementally, yielding each entry as soon as it is complete.
+
+    Entries are raw dicts (title, summary, authors, link, published, id).
+    ``on_total`` is called with the feed's total result count when it is seen.
+    Parsing time, excluding time spent by the consumer and waiting for
+    chunks, is recorded as the ``arxiv_parse`` stage.
+    """
+    parser = ET.XMLPullParser(events=('end',))
+    parsing = 0.0
+    try:
+        for chunk in chunks:
+            started = time.perf_counter()
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                if element.tag == OPENSEARCH + 'totalResults' and on_total is not None:
+                    on_total(int(element.text or 0))
+                elif element.tag == ATOM + 'entry':
+                    link = next((l.get('href') for l in element.findall(ATOM + 'link')
+                                 if l.get('rel', 'alternate') == 'alternate'), '')
+                    entry = {
+                        'title': element.findtext(ATOM + 'title', ''),
+                        'summary': element.findtext(ATOM + 'summary', ''),
+                        'authors': [a.findtext(ATOM + 'name', '') for a in element.findall(ATOM + 'author')],
+                        'link': link,
+                        'published': element.findtext(ATOM + 'published', ''),
+                        'id': element.findtext(ATOM + 'id', ''),
+                    }
+                    element.clear()
+                    parsing += time.perf_counter() - started
+                    yield entry
+                    started = time.perf_counter()
+            parsing += time.perf_counter() - started
+        started = time.perf_counter()
+        parser.close()
+        parsing += time.perf_counter() - started
+    finally:
+        observe('arxiv_parse', parsing)
+
+
+class ArxivFetch:
+    """Results of one arXiv query, fetched as parallel pages.
+
+    Iterating yields entries in rank order while pages are still
+    downloading: page ``n`` is consumed entry by entry as it is parsed,
+    while pages after it download in the background, each until ``buffer``
+    entries are waiting. Failed pages are skipped and recorded in
+    ``errors`` instead of failing the whole query.
+    """
+
+    def __init__(self, query: str, max_results: int, page_size: int = ARXIV_PAGE_SIZE,
+                 workers: int = ARXIV_PAGE_WORKERS, spacer: RequestSpacer = arxiv_spacer,
+                 buffer: int = ARXIV_PAGE_BUFFER):
+        self.query = query
+        self.max_results = max_results
+        self.page_size = page_size
+        self.workers = workers
+        self.spacer = spacer
+        self.buffer = buffer
+        self.errors: List[ArxivPageError] = []
+        self.total: Optional[int] = None
+        self._cancelled = threading.Event()
+
+    def _set_total(self, total: int) -> None:
+        if self.total is None or total < self.total:
+            self.total = total
+
+    def _put(self, out: queue.Queue, item) -> bool:
+        """Wait for room in a page's queue; False if the fetch is cancelled first"""
+        while not self._cancelled.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fetch_page(self, start: int, out: queue.Queue) -> None:
+        try:
+            # Don't spend a request on pages past the end of the results
+            if self._cancelled.is_set() or (self.total is not None and start >= self.total):
+                return
+            self.spacer.wait()
+            if self._cancelled.is_set():
+                return
+            params = {
+                'search_query': f'all:{self.query}',
+                'start': start,
+                'max_results': min(self.page_size, self.max_results - start),
+                'sortBy': 'relevance',
+                'sortOrder': 'descending',
+            }
+            with span('arxiv_page'):
+                with span('arxiv_request'):
+                    response = requests.get(ARXIV_API_URL, params=params, timeout=ARXIV_TIMEOUT, stream=True)
+                with response:
+                    response.raise_for_status()
+                    for entry in parse_feed(response.iter_content(64 * 1024), on_total=self._set_total):
+                        if not self._put(out, entry):
+                            return
+            upstream_request('arxiv', 'ok')
+        except Exception as e:
+            upstream_request('arxiv', 'error')
+            self._put(out, ArxivPageError(start, e))
+        finally:
+            self._put(out, None)
+
+    def __iter__(self) -> Iterator[Dict]:
+        starts = range(0, self.max_results, self.page_size)
+        pages = [queue.Queue(maxsize=max(1, self.buffer)) for _ in starts]
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(pages))))
+        try:
+            for start, page in zip(starts, pages):
+                # Carry the caller's context so page spans land in its request timings
+                executor.submit(contextvars.copy_context().run, self._fetch_page, start, page)
+            for page in pages:
+                while True:
+                    item = page.get()
+                    if item is None:
+                        break
+                    if isinstance(item, ArxivPageError):
+                        self.errors.append(item)
+                    else:
+                        yield item
+        finally:
+            self._cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Dict, Iterator, List
+
+import arxiv_client
+from encoders import BACKENDS
+from research_agent import ENCODER_BACKEND, SCORE_CHUNK_SIZE, ResearchAgent
+
+# The arXiv stand-in lives with the load benchmark at the repository root
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+
+_VOCAB = ('neural network graph model learning training data language image vision protein structure '
+          'policy reward robot speech audio diffusion sampling attention transformer retrieval kernel '
+          'bayesian inference optimization gradient convex sparse tensor quantum molecule clinical').split()
+
+
+class _UncachedAgent(ResearchAgent):
+    """ResearchAgent that keeps candidates out of the embedding store and the search cache"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.search_cache = None
+
+    @property
+    def embedding_store(self):
+        return None
+
+
+class _SyntheticPoolAgent(_UncachedAgent):
+    """Agent whose candidates are a generated pool"""
+
+    def __init__(self, pool_size: int, seed: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.pool_size = pool_size
+        self.seed = seed
+
+    def iter_candidates(self, input_abstract: str, input_embedding, **kwargs) -> Iterator[Dict]:
+        rng = random.Random(self.seed)
+        for i in range(self.pool_size):
+            yield {
+                'title': f'Synthetic paper {i}',
+                'abstract': ' '.join(rng.choices(_VOCAB, k=120)),
+                'authors': [],
+                'url': '',
+                'published': '',
+                'arxiv_id': f'synthetic{i}',
+                'source': 'benchmark',
+            }
+
+
+def _measure(run) -> Dict:
+    """Throughput from a plain run, then peak traced allocations from a second run"""
+    started = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': round(seconds, 3), 'peak_mb': round(peak / (1024 * 1024), 2)}
+
+
+def _start_arxiv_standin(total: int):
+    """Serve arXiv from the local stand-in, with no spacing between page requests"""
+    sys.path.insert(0, BENCHMARKS_DIR)
+    from standins import StandInServer
+
+    server = StandInServer(('127.0.0.1', 0), arxiv_total=total)
+    server.start()
+    arxiv_client.ARXIV_API_URL = f'{server.url}/api/query'
+    arxiv_client.arxiv_spacer.interval = 0
+    return server
+
+
+def benchmark(pool_sizes: List[int], chunk_size: int = SCORE_CHUNK_SIZE, k: int = 20,
+              compare: bool = False, live: bool = False, backend: str = ENCODER_BACKEND,
+              seed: int = 0) -> List[Dict]:
+    """Score synthetic candidate pools of each size with the streaming path (and the batch path if ``compare``).
+
+    With ``live``, pools are also streamed from iter_arxiv against the
+    local arXiv stand-in, covering page download and parsing as well.
+    Peak memory counts Python and NumPy allocations made while scoring
+    (and, for the live path, the in-process stand-in's response bodies),
+    not the encoder's own buffers, which do not depend on the pool size.
+    """
+    rng = random.Random(seed)
+    abstract = ' '.join(rng.choices(_VOCAB, k=150))
+    server = _start_arxiv_standin(max(pool_sizes)) if live else None
+    report = []
+    try:
+        for pool_size in pool_sizes:
+            report += _benchmark_pool(pool_size, abstract, chunk_size, k, compare, live, backend, seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+    return report
+
+
+def _benchmark_pool(pool_size: int, abstract: str, chunk_size: int, k: int, compare: bool, live: bool,
+                    backend: str, seed: int) -> List[Dict]:
+    agent = _SyntheticPoolAgent(pool_size, seed=seed, encoder_backend=backend)
+    embedding = agent.model.encode([abstract], normalize_embeddings=True)[0]
+
+    def streaming():
+        agent.score_candidates(embedding, agent.iter_candidates(abstract, embedding), k=k,
+                               threshold=-1.0, chunk_size=chunk_size)
+
+    runs = {'streaming': streaming}
+    if live:
+        runs['live'] = lambda: agent.score_candidates(
+            embedding, agent.iter_arxiv('neural retrieval', max_results=pool_size), k=k,
+            threshold=-1.0, chunk_size=chunk_size)
+    if compare:
+        runs['batch'] = lambda: agent.find_related_papers_batch([abstract], k=k, threshold=-1.0)
+    report = []
+    for path, run in runs.items():
+        result = _measure(run)
+        result.update(path=path, pool_size=pool_size,
+                      chunk_size=chunk_size if path != 'batch' else None,
+                      candidates_per_second=round(pool_size / result['seconds'], 1)
+                      if result['seconds'] else 0.0)
+        print(f"{path:>9} pool={pool_size}: {result['candidates_per_second']} candidates/s, "
+              f"peak {result['peak_mb']} MB")
+        report.append(result)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure peak memory and throughput of candidate scoring')
+    parser.add_argument('--pool-sizes', default='1000,10000', help='comma-separated candidate pool sizes')
+    parser.add_argument('--chunk-size', type=int, default=SCORE_CHUNK_SIZE, help='candidates scored per step')
+    parser.add_argument('--k', type=int, default=20, help='matches kept')
+    parser.add_argument('--backend', default=ENCODER_BACKEND, choices=BACKENDS, help='encoder backend')
+    parser.add_argument('--compare', action='store_true', help='also run the whole-pool batch path')
+    parser.add_argument('--live', action='store_true',
+                        help='also stream the pool from iter_arxiv against the local arXiv stand-in')
+    parser.add_argument('--out', default=None, help='write the report as JSON to this file')
+    args = parser.parse_args()
+
+    report = benchmark([int(size) for size in args.pool_sizes.split(',')], chunk_size=args.chunk_size,
+                       k=args.k, compare=args.compare, live=args.live, backend=args.backend)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
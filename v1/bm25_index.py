@@ -0,0 +1,214 @@
+import argparse
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from ann_index import publish_index, staging_directory
+from embedding_store import EmbeddingStore
+from keywords import STOPWORDS
+
+# Compound tokens such as "resnet-50", "gpt-4" or "bert_base" are kept whole
+# and also split into their parts, so both spellings match
+_TOKEN = re.compile(r'[a-z0-9]+(?:[-_.+/][a-z0-9]+)*')
+_PART = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) > 1 and token not in STOPWORDS:
+            tokens.append(token)
+        if not token.isalnum():
+            tokens += [part for part in _PART.findall(token) if len(part) > 1 and part not in STOPWORDS]
+    return tokens
+
+
+def paper_text(paper: Dict) -> str:
+    return f"{paper.get('title', '')} {paper.get('abstract', '')}"
+
+
+class BM25Index:
+    """BM25 inverted index over the titles and abstracts in an EmbeddingStore.
+
+    Postings are flat arrays: the documents (store rows) containing term
+    ``t`` are ``docs[offsets[t]:offsets[t + 1]]``, and ``weights`` holds the
+    matching BM25 term-frequency component, precomputed at build time so a
+    query only multiplies by idf and scatter-adds. Arrays are memory-mapped
+    on load, and each build is published as a new version behind a symlink
+    (see publish_index). Like IVFIndex, store rows appended after the build are scored
+    by tokenizing them at query time until the next rebuild, and tombstoned
+    rows are skipped.
+    """
+
+    FILES = ('offsets.npy', 'docs.npy', 'weights.npy', 'doc_lengths.npy')
+
+    def __init__(self, vocab: Dict[str, int], offsets: np.ndarray, docs: np.ndarray, weights: np.ndarray,
+                 doc_lengths: np.ndarray, store: EmbeddingStore, k1: float = 1.2, b: float = 0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.docs = docs
+        self.weights = weights
+        self.doc_lengths = doc_lengths
+        self.store = store
+        self.k1 = k1
+        self.b = b
+        self.indexed_rows = len(doc_lengths)
+        self.avgdl = _average_length(doc_lengths)
+        self._tail: Dict[int, Tuple[Counter, int]] = {}
+
+    @classmethod
+    def build(cls, store: EmbeddingStore, directory: str, chunk_size: int = 5000,
+              k1: float = 1.2, b: float = 0.75) -> 'BM25Index':
+        """Index every paper currently in ``store`` and write the index to ``directory``"""
+        n = len(store)
+        tombstones = set(store.tombstones().tolist())
+        vocab: Dict[str, int] = {}
+        doc_lengths = np.zeros(n, dtype=np.int32)
+        term_chunks, doc_chunks, tf_chunks = [], [], []
+        for start in range(0, n, chunk_size):
+            rows = [row for row in range(start, min(start + chunk_size, n)) if row not in tombstones]
+            term_ids, doc_ids, counts = [], [], []
+            for row, paper in zip(rows, store.get_papers(rows)):
+                tokens = tokenize(paper_text(paper))
+                doc_lengths[row] = len(tokens)
+                for term, tf in Counter(tokens).items():
+                    term_ids.append(vocab.setdefault(term, len(vocab)))
+                    doc_ids.append(row)
+                    counts.append(tf)
+            term_chunks.append(np.asarray(term_ids, dtype=np.int32))
+            doc_chunks.append(np.asarray(doc_ids, dtype=np.int32))
+            tf_chunks.append(np.asarray(counts, dtype=np.float32))
+
+        terms = np.concatenate(term_chunks) if term_chunks else np.empty(0, dtype=np.int32)
+        # Stable sort keeps each posting list in row order
+        order = np.argsort(terms, kind='stable')
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(terms, minlength=len(vocab)))
+        docs = (np.concatenate(doc_chunks) if doc_chunks else np.empty(0, dtype=np.int32))[order]
+        tfs = (np.concatenate(tf_chunks) if tf_chunks else np.empty(0, dtype=np.float32))[order]
+        avgdl = _average_length(doc_lengths)
+        arrays = {
+            'offsets.npy': offsets,
+            'docs.npy': docs,
+            'weights.npy': (tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * doc_lengths[docs] / avgdl))).astype(np.float32),
+            'doc_lengths.npy': doc_lengths,
+        }
+
+        # Built in a staging directory and published with one rename, as for IVFIndex
+        staging = staging_directory(directory)
+        for name, array in arrays.items():
+            with open(os.path.join(staging, name), 'wb') as f:
+                np.save(f, array)
+        with open(os.path.join(staging, 'vocab.json'), 'w') as f:
+            json.dump(vocab, f, separators=(',', ':'))
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump({'rows': n, 'terms': len(vocab), 'postings': len(terms), 'k1': k1, 'b': b,
+                       'built_at': time.time()}, f)
+        publish_index(staging, directory)
+
+        return cls.load(directory, store)
+
+    @classmethod
+    def load(cls, directory: str, store: EmbeddingStore) -> 'BM25Index':
+        # Resolve the link once so every file comes from the same build
+        directory = os.path.realpath(directory)
+        with open(os.path.join(directory, 'vocab.json')) as f:
+            vocab = json.load(f)
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        offsets, docs, weights, doc_lengths = [np.load(os.path.join(directory, name), mmap_mode='r')
+                                               for name in cls.FILES]
+        return cls(vocab, np.asarray(offsets), docs, weights, np.asarray(doc_lengths), store,
+                   k1=meta['k1'], b=meta['b'])
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return all(os.path.exists(os.path.join(directory, name))
+                   for name in BM25Index.FILES + ('vocab.json',))
+
+    def _idf(self, df: int, n: int) -> float:
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _tail_docs(self, total: int) -> Dict[int, Tuple[Counter, int]]:
+        """Term counts for rows added since the build, tokenized once and kept"""
+        missing = [row for row in range(self.indexed_rows, total) if row not in self._tail]
+        if missing:
+            for row, paper in zip(missing, self.store.get_papers(missing)):
+                tokens = tokenize(paper_text(paper))
+                self._tail[row] = (Counter(tokens), len(tokens))
+        return self._tail
+
+    def search(self, query: str, k: int = 100, max_query_terms: int = 32) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k store rows by BM25 score for ``query``; returns (rows, scores), best first.
+
+        Only the ``max_query_terms`` rarest query terms are scored, which
+        bounds the postings read for long queries such as whole abstracts.
+        """
+        total = len(self.store)
+        tail = self._tail_docs(total) if total > self.indexed_rows else {}
+        n = self.indexed_rows + len(tail)
+        if n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query_terms = []
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            df = int(self.offsets[term_id + 1] - self.offsets[term_id]) if term_id is not None else 0
+            df += sum(1 for counts, _ in tail.values() if term in counts)
+            if df:
+                query_terms.append((self._idf(df, n), term, term_id))
+        query_terms.sort(key=lambda item: (-item[0], item[1]))
+        query_terms = query_terms[:max_query_terms]
+
+        scores = np.zeros(n, dtype=np.float32)
+        for idf, term, term_id in query_terms:
+            if term_id is not None:
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                # Each document appears once per posting list, so fancy-index += is safe
+                scores[self.docs[start:end]] += np.float32(idf) * self.weights[start:end]
+            for row, (counts, length) in tail.items():
+                tf = counts.get(term)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * length / self.avgdl)
+                    scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        tombstones = self.store.tombstones()
+        if len(tombstones):
+            scores[tombstones[tombstones < n]] = 0
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        order = matches[np.argsort(-scores[matches], kind='stable')]
+        return order.astype(np.int64), scores[order]
+
+
+def _average_length(doc_lengths: np.ndarray) -> float:
+    """Mean length of the indexed (non-empty) documents"""
+    lengths = doc_lengths[doc_lengths > 0]
+    return max(float(lengths.mean()), 1.0) if len(lengths) else 1.0
+
+
+def main():
+    from research_agent import BM25_INDEX_DIR, EMBEDDING_STORE_DIR
+
+    parser = argparse.ArgumentParser(description='Build the BM25 index over the local embedding store')
+    parser.add_argument('--store', default=EMBEDDING_STORE_DIR, help='embedding store directory')
+    parser.add_argument('--out', default=BM25_INDEX_DIR, help='index output directory')
+    parser.add_argument('--dim', type=int, default=384, help='embedding dimension')
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.store, args.dim, read_only=True)
+    print(f"Indexing {len(store)} papers...")
+    start = time.perf_counter()
+    index = BM25Index.build(store, args.out)
+    print(f"Indexed {len(index.vocab)} terms in {time.perf_counter() - start:.1f}s -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()
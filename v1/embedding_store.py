@@ -0,0 +1,232 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; fall back to in-process locking only
+    fcntl = None
+
+
+class EmbeddingStore:
+    """Persistent paper embeddings keyed by ``arxiv_id``.
+
+    Vectors live in an append-only float16 file that is memory-mapped for
+    reads; paper metadata and the row each paper occupies live in a SQLite
+    table. A row only becomes visible once its metadata is committed, which
+    happens after its vector is on disk, so any number of processes can
+    open the store with ``read_only=True`` while one process appends.
+
+    Rows are never rewritten. When a newer arXiv version of a paper is
+    added, older versions are tombstoned: their rows stay (indexes refer
+    to rows by number) but searches skip them.
+    """
+
+    VECTORS_FILE = 'vectors.f16'
+    META_FILE = 'papers.sqlite3'
+    LOCK_FILE = 'write.lock'
+
+    def __init__(self, directory: str, dim: int, read_only: bool = False):
+        self.directory = directory
+        self.dim = dim
+        self.read_only = read_only
+        self.vectors_path = os.path.join(directory, self.VECTORS_FILE)
+        self.meta_path = os.path.join(directory, self.META_FILE)
+        self._lock = threading.RLock()
+        self._count = -1
+        self._vectors = np.zeros((0, dim), dtype=np.float16)
+        self._tombstone_count = -1
+        self._tombstones = np.empty(0, dtype=np.int64)
+
+        if read_only:
+            self._conn = sqlite3.connect(f'file:{self.meta_path}?mode=ro', uri=True,
+                                         check_same_thread=False)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.meta_path, timeout=30, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS papers (
+                    idx INTEGER PRIMARY KEY,
+                    arxiv_id TEXT NOT NULL UNIQUE,
+                    title TEXT NOT NULL,
+                    abstract TEXT NOT NULL,
+                    authors TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    published TEXT NOT NULL,
+                    source TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS tombstones (
+                    idx INTEGER PRIMARY KEY,
+                    superseded_by TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+            with self._write_lock():
+                self._repair()
+
+        self._refresh()
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers across threads and processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, self.LOCK_FILE), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _committed_rows(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM papers').fetchone()[0]
+
+    def _repair(self) -> None:
+        """Drop vectors left behind by a writer that died before committing"""
+        expected = self._committed_rows() * self.dim * 2
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        if size < expected:
+            raise RuntimeError(f'{self.vectors_path} is shorter than its metadata; the store is corrupt')
+        if size > expected:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(expected)
+
+    def _refresh(self) -> None:
+        """Remap the vector file if other writers have appended rows"""
+        with self._lock:
+            count = self._committed_rows()
+            if count == self._count:
+                return
+            if count:
+                self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r',
+                                          shape=(count, self.dim))
+            self._count = count
+
+    def tombstones(self) -> np.ndarray:
+        """Sorted rows of superseded papers, which searches must skip"""
+        with self._lock:
+            try:
+                count = self._conn.execute('SELECT COUNT(*) FROM tombstones').fetchone()[0]
+            except sqlite3.OperationalError:  # read-only store created before tombstones existed
+                return self._tombstones
+            if count != self._tombstone_count:
+                self._tombstones = np.fromiter(
+                    (idx for (idx,) in self._conn.execute('SELECT idx FROM tombstones ORDER BY idx')),
+                    dtype=np.int64, count=count
+                )
+                self._tombstone_count = count
+            return self._tombstones
+
+    def __len__(self) -> int:
+        self._refresh()
+        return self._count
+
+    def lookup(self, arxiv_ids: Iterable[str]) -> Dict[str, int]:
+        """Map the given arxiv_ids to their rows; unknown ids are omitted"""
+        arxiv_ids = list(dict.fromkeys(arxiv_ids))
+        found = {}
+        with self._lock:
+            for start in range(0, len(arxiv_ids), 500):
+                chunk = arxiv_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                found.update(self._conn.execute(
+                    f'SELECT arxiv_id, idx FROM papers WHERE arxiv_id IN ({placeholders})', chunk
+                ).fetchall())
+        return found
+
+    def get_vectors(self, rows: List[int]) -> np.ndarray:
+        """float32 copies of the vectors at ``rows``"""
+        self._refresh()
+        return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    def get_papers(self, rows: List[int]) -> List[Dict]:
+        """Paper dicts (same shape as ResearchAgent.search_arxiv) for ``rows``"""
+        by_row = {}
+        with self._lock:
+            for start in range(0, len(rows), 500):
+                chunk = [int(r) for r in rows[start:start + 500]]
+                placeholders = ','.join('?' * len(chunk))
+                for idx, arxiv_id, title, abstract, authors, url, published, source in self._conn.execute(
+                        f'SELECT * FROM papers WHERE idx IN ({placeholders})', chunk):
+                    by_row[idx] = {
+                        'title': title,
+                        'abstract': abstract,
+                        'authors': json.loads(authors),
+                        'url': url,
+                        'published': published,
+                        'arxiv_id': arxiv_id,
+                        'source': source
+                    }
+        return [by_row[int(r)] for r in rows]
+
+    def add(self, papers: List[Dict], embeddings: np.ndarray) -> Dict[str, int]:
+        """Append papers not already stored; returns arxiv_id -> row for all of them"""
+        if self.read_only:
+            raise RuntimeError('EmbeddingStore was opened read-only')
+
+        with self._write_lock():
+            rows = self.lookup(p['arxiv_id'] for p in papers)
+            new = []
+            for paper, embedding in zip(papers, embeddings):
+                if paper['arxiv_id'] not in rows:
+                    rows[paper['arxiv_id']] = -1
+                    new.append((paper, embedding))
+            if not new:
+                return rows
+
+            start = self._committed_rows()
+            vectors = np.asarray([e for _, e in new], dtype=np.float16).reshape(len(new), self.dim)
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            records = []
+            for offset, (paper, _) in enumerate(new):
+                rows[paper['arxiv_id']] = start + offset
+                records.append((
+                    start + offset, paper['arxiv_id'], paper.get('title', ''), paper.get('abstract', ''),
+                    json.dumps(paper.get('authors', [])), paper.get('url', ''),
+                    paper.get('published', ''), paper.get('source', 'arXiv')
+                ))
+            with self._conn:
+                self._conn.executemany('INSERT INTO papers VALUES (?, ?, ?, ?, ?, ?, ?, ?)', records)
+                self._supersede(paper['arxiv_id'] for paper, _ in new)
+
+        self._refresh()
+        return rows
+
+    def _supersede(self, arxiv_ids: Iterable[str]) -> None:
+        """Tombstone every version of these papers except the newest one stored"""
+        now = time.time()
+        for base in {_VERSION.sub('', arxiv_id) for arxiv_id in arxiv_ids if _VERSION.search(arxiv_id)}:
+            # Range scan on the arxiv_id index: every "<base>v<n>"
+            versions = self._conn.execute(
+                'SELECT idx, arxiv_id FROM papers WHERE arxiv_id >= ? AND arxiv_id < ?',
+                (base + 'v', base + 'w')
+            ).fetchall()
+            versions = [(idx, arxiv_id) for idx, arxiv_id in versions
+                        if _VERSION.sub('', arxiv_id) == base and _VERSION.search(arxiv_id)]
+            if len(versions) < 2:
+                continue
+            latest = max(versions, key=lambda v: int(_VERSION.search(v[1]).group(1)))
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO tombstones VALUES (?, ?, ?)',
+                [(idx, latest[1], now) for idx, _ in versions if idx != latest[0]]
+            )
+
+
+_VERSION = re.compile(r'v(\d+)$')
@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from encoders import BACKENDS, Encoder, make_encoder
+
+# Frames are a 4-byte big-endian length followed by that many bytes
+_LENGTH = struct.Struct('>I')
+
+
+def _send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('encode service connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return _recv_exact(sock, size)
+
+
+class MicroBatcher:
+    """Coalesces encode requests from many connections into shared batches.
+
+    The first request to arrive opens a window of ``max_wait`` seconds (or
+    until ``max_batch`` texts are queued); everything queued by then is
+    encoded in one call and the rows are handed back to each caller.
+    """
+
+    def __init__(self, encoder: Encoder, max_batch: int = 256, max_wait: float = 0.005):
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self._thread = threading.Thread(target=self._run, name='encode-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+            self._encode(pending)
+
+    def _encode(self, pending: List[Tuple[List[str], Future]]) -> None:
+        texts = [text for batch, _ in pending for text in batch]
+        try:
+            embeddings = np.asarray(self.encoder.encode(texts) if texts else
+                                    np.zeros((0, self.encoder.get_sentence_embedding_dimension())),
+                                    dtype=np.float32)
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        self.requests += len(pending)
+        self.batches += 1
+        self.texts += len(texts)
+        start = 0
+        for batch, future in pending:
+            future.set_result(embeddings[start:start + len(batch)])
+            start += len(batch)
+
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'texts': self.texts,
+            'mean_requests_per_batch': round(self.requests / self.batches, 2) if self.batches else 0.0,
+            'mean_batch_size': round(self.texts / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class EncodeService(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves one encoder to every worker process over a Unix socket.
+
+    Each request frame is JSON: ``{"op": "encode", "texts": [...]}``,
+    ``{"op": "info"}`` or ``{"op": "stats"}``. Replies are a JSON header
+    frame, followed for encodes by a frame of raw float32 rows.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, encoder: Encoder, max_batch: int = 256, max_wait: float = 0.005):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.encoder = encoder
+        self.batcher = MicroBatcher(encoder, max_batch=max_batch, max_wait=max_wait)
+        super().__init__(path, _Handler)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        server = self.server
+        while True:
+            try:
+                message = json.loads(_recv_frame(self.request))
+            except (ConnectionError, ValueError):
+                return
+
+            op = message.get('op')
+            if op == 'encode':
+                try:
+                    embeddings = server.batcher.submit(list(message.get('texts', []))).result()
+                except Exception as e:
+                    _send_frame(self.request, json.dumps({'error': str(e)}).encode())
+                    continue
+                _send_frame(self.request, json.dumps({'rows': len(embeddings)}).encode())
+                _send_frame(self.request, embeddings.tobytes())
+            elif op == 'info':
+                _send_frame(self.request, json.dumps({
+                    'model_name': server.encoder.model_name,
+                    'backend': server.encoder.name,
+                    'dim': server.encoder.get_sentence_embedding_dimension(),
+                }).encode())
+            elif op == 'stats':
+                _send_frame(self.request, json.dumps(server.batcher.stats()).encode())
+            else:
+                _send_frame(self.request, json.dumps({'error': f'unknown op {op!r}'}).encode())
+
+
+class RemoteEncoder(Encoder):
+    """Encoder that forwards to an EncodeService.
+
+    Each thread keeps its own connection, so concurrent requests from one
+    worker are batched by the service just like requests from different
+    workers.
+    """
+
+    name = 'remote'
+
+    def __init__(self, path: str, connect_timeout: float = 60.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+        info, _ = self._call({'op': 'info'})
+        super().__init__(info['model_name'])
+        self.backend = info['backend']
+        self.dim = info['dim']
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            return sock
+        # The service may still be starting up alongside the workers
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f'No encode service listening on {self.path}')
+                time.sleep(0.2)
+        self._local.sock = sock
+        return sock
+
+    def _reset(self) -> None:
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def _call(self, message: Dict, payload: bool = False) -> Tuple[Dict, Optional[bytes]]:
+        """Send one request; returns the reply header and, if ``payload``, the data frame"""
+        # One retry on a fresh connection covers a restarted service
+        for attempt in range(2):
+            sock = self._connection()
+            try:
+                _send_frame(sock, json.dumps(message).encode())
+                header = json.loads(_recv_frame(sock))
+                body = _recv_frame(sock) if payload and 'error' not in header else None
+                break
+            except (ConnectionError, OSError):
+                self._reset()
+                if attempt:
+                    raise
+        if 'error' in header:
+            raise RuntimeError(f"Encode service error: {header['error']}")
+        return header, body
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        header, body = self._call({'op': 'encode', 'texts': list(texts)}, payload=True)
+        embeddings = np.frombuffer(body, dtype=np.float32).reshape(header['rows'], self.dim).copy()
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            embeddings /= norms
+        return embeddings
+
+    def stats(self) -> Dict:
+        return self._call({'op': 'stats'})[0]
+
+
+def main():
+    from research_agent import ENCODE_BATCH_SIZE, ENCODER_BACKEND, ENCODER_THREADS, ENCODE_SERVICE, MODEL_NAME
+
+    parser = argparse.ArgumentParser(description='Serve the sentence encoder to local worker processes')
+    parser.add_argument('--socket', default=ENCODE_SERVICE or '/tmp/research-agent-encoder.sock',
+                        help='Unix socket path')
+    parser.add_argument('--backend', default=ENCODER_BACKEND, choices=BACKENDS, help='encoder backend')
+    parser.add_argument('--threads', type=int, default=ENCODER_THREADS, help='encoder threads')
+    parser.add_argument('--batch-size', type=int, default=ENCODE_BATCH_SIZE, help='encoder batch size')
+    parser.add_argument('--max-batch', type=int, default=256, help='most texts coalesced into one encode call')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help='how long to wait for more requests')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    encoder = make_encoder(args.backend, MODEL_NAME, batch_size=args.batch_size, threads=args.threads)
+    print(f"Encoder {MODEL_NAME} ({args.backend}) loaded in {time.perf_counter() - started:.2f}s")
+
+    with EncodeService(args.socket, encoder, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000) as server:
+        print(f"Encode service listening on {args.socket}")
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    main()
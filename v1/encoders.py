@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:  # the ONNX backend is optional
+    onnxruntime = None
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+# Where ONNX exports of the model are kept
+ONNX_CACHE_DIR = os.environ.get(
+    'RESEARCH_AGENT_ONNX_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx_models')
+)
+
+
+class Encoder(ABC):
+    """Turns texts into sentence embeddings.
+
+    Mirrors the parts of ``SentenceTransformer`` that ResearchAgent uses, so
+    backends are interchangeable.
+    """
+
+    name = 'base'
+
+    def __init__(self, model_name: str, batch_size: int = 64, threads: Optional[int] = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.threads = threads
+
+    @abstractmethod
+    def get_sentence_embedding_dimension(self) -> int:
+        ...
+
+    @abstractmethod
+    def encode(self, texts: List[str], batch_size: Optional[int] = None,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        ...
+
+
+class TorchEncoder(Encoder):
+    """The reference PyTorch SentenceTransformer"""
+
+    name = 'torch'
+
+    def __init__(self, model_name: str, batch_size: int = 64, threads: Optional[int] = None):
+        super().__init__(model_name, batch_size, threads)
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        return self.model.encode(list(texts), batch_size=batch_size or self.batch_size,
+                                 normalize_embeddings=normalize_embeddings,
+                                 show_progress_bar=False, convert_to_numpy=True)
+
+
+class OnnxEncoder(Encoder):
+    """The same model exported to ONNX and run with ONNX Runtime.
+
+    The first use exports the transformer (this step needs PyTorch) and,
+    with ``quantize=True``, applies int8 dynamic quantization to its
+    weights. Exports are cached in ``cache_dir``; later loads need only
+    onnxruntime and the tokenizer, so PyTorch is never imported.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 64, threads: Optional[int] = None,
+                 quantize: bool = False, cache_dir: Optional[str] = None):
+        super().__init__(model_name, batch_size, threads)
+        if onnxruntime is None:
+            raise RuntimeError('The ONNX encoder requires onnxruntime to be installed')
+        from transformers import AutoTokenizer
+
+        self.name = 'onnx-int8' if quantize else 'onnx'
+        self.directory = os.path.join(cache_dir or ONNX_CACHE_DIR, model_name.replace('/', '__'))
+        model_path = os.path.join(self.directory, 'model.int8.onnx' if quantize else 'model.onnx')
+        if not os.path.exists(model_path):
+            export_onnx(model_name, self.directory, quantize=quantize)
+
+        with open(os.path.join(self.directory, 'encoder.json')) as f:
+            meta = json.load(f)
+        self.dim = meta['dim']
+        self.max_seq_length = meta['max_seq_length']
+        self.tokenizer = AutoTokenizer.from_pretrained(self.directory)
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        texts = list(texts)
+        batch_size = batch_size or self.batch_size
+        output = np.empty((len(texts), self.dim), dtype=np.float32)
+        # Sort by length so each batch pads as little as possible
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            tokens = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors='np')
+            feed = {name: tokens[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feed)[0]
+            # Mean pooling over real tokens, as in the model's pooling layer
+            mask = tokens['attention_mask'][..., None].astype(np.float32)
+            output[batch] = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if normalize_embeddings:
+            norms = np.linalg.norm(output, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            output /= norms
+        return output
+
+
+def export_onnx(model_name: str, directory: str, quantize: bool = False) -> str:
+    """Export a SentenceTransformer's transformer to ONNX, optionally int8-quantized"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(directory, exist_ok=True)
+    fp32_path = os.path.join(directory, 'model.onnx')
+    if not os.path.exists(fp32_path):
+        model = SentenceTransformer(model_name, device='cpu')
+        transformer = model[0].auto_model.eval()
+        tokenizer = model.tokenizer
+        sample = tokenizer(['an example sentence'], return_tensors='pt')
+        names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in names}
+        dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+        tokenizer.save_pretrained(directory)
+        with open(os.path.join(directory, 'encoder.json'), 'w') as f:
+            json.dump({'model_name': model_name, 'dim': model.get_sentence_embedding_dimension(),
+                       'max_seq_length': model.max_seq_length}, f)
+        # The model file goes last: its presence means the export is complete
+        tmp_path = fp32_path + '.tmp'
+        with torch.no_grad():
+            torch.onnx.export(transformer, tuple(sample[name] for name in names), tmp_path,
+                              input_names=names, output_names=['last_hidden_state'],
+                              dynamic_axes=dynamic_axes, opset_version=14)
+        os.replace(tmp_path, fp32_path)
+
+    if not quantize:
+        return fp32_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    int8_path = os.path.join(directory, 'model.int8.onnx')
+    quantize_dynamic(fp32_path, int8_path + '.tmp', weight_type=QuantType.QInt8)
+    os.replace(int8_path + '.tmp', int8_path)
+    return int8_path
+
+
+def make_encoder(backend: str, model_name: str, batch_size: int = 64,
+                 threads: Optional[int] = None) -> Encoder:
+    if backend == 'torch':
+        return TorchEncoder(model_name, batch_size=batch_size, threads=threads)
+    if backend in ('onnx', 'onnx-int8'):
+        return OnnxEncoder(model_name, batch_size=batch_size, threads=threads,
+                           quantize=backend == 'onnx-int8')
+    raise ValueError(f"encoder backend must be one of {', '.join(BACKENDS)}")
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _timed_encode(encoder: Encoder, texts: List[str]) -> Tuple[np.ndarray, float]:
+    encoder.encode(texts[:8], normalize_embeddings=True)  # warm-up
+    started = time.perf_counter()
+    embeddings = encoder.encode(texts, normalize_embeddings=True)
+    return embeddings, len(texts) / (time.perf_counter() - started)
+
+
+def parity_check(texts: List[str], candidate: Encoder, reference: Encoder, k: int = 10) -> Dict:
+    """Compare a backend against the reference encoder on ``texts``.
+
+    Reports the cosine between each pair of embeddings and how much of each
+    text's top-k neighbours (among ``texts``) the candidate preserves.
+    """
+    candidate_vectors, candidate_rate = _timed_encode(candidate, texts)
+    reference_vectors, reference_rate = _timed_encode(reference, texts)
+
+    cosines = np.sum(candidate_vectors * reference_vectors, axis=1)
+    k = max(1, min(k, len(texts) - 1))
+    overlaps = []
+    if len(texts) > 1:
+        candidate_sims = candidate_vectors @ candidate_vectors.T
+        reference_sims = reference_vectors @ reference_vectors.T
+        np.fill_diagonal(candidate_sims, -np.inf)
+        np.fill_diagonal(reference_sims, -np.inf)
+        candidate_top = np.argpartition(-candidate_sims, k - 1, axis=1)[:, :k]
+        reference_top = np.argpartition(-reference_sims, k - 1, axis=1)[:, :k]
+        overlaps = [len(set(c) & set(r)) / k for c, r in zip(candidate_top, reference_top)]
+
+    return {
+        'backend': candidate.name,
+        'texts': len(texts),
+        'mean_cosine': round(float(cosines.mean()), 5),
+        'min_cosine': round(float(cosines.min()), 5),
+        f'top{k}_overlap': round(float(np.mean(overlaps)), 4) if overlaps else None,
+        'texts_per_second': round(candidate_rate, 1),
+        'reference_texts_per_second': round(reference_rate, 1),
+    }
+
+
+def main():
+    from research_agent import EMBEDDING_STORE_DIR, MODEL_NAME
+
+    parser = argparse.ArgumentParser(description='Check an encoder backend against the PyTorch reference')
+    parser.add_argument('--backend', default='onnx-int8', choices=BACKENDS, help='backend to check')
+    parser.add_argument('--texts', default=None,
+                        help='file with one text per line (default: abstracts from the embedding store)')
+    parser.add_argument('--dim', type=int, default=384, help='embedding dimension of the store')
+    parser.add_argument('--limit', type=int, default=1000, help='number of texts to compare')
+    parser.add_argument('--batch-size', type=int, default=64, help='encoder batch size')
+    parser.add_argument('--threads', type=int, default=None, help='encoder threads')
+    args = parser.parse_args()
+
+    if args.texts:
+        with open(args.texts) as f:
+            texts = [line.strip() for line in f if line.strip()][:args.limit]
+    else:
+        from embedding_store import EmbeddingStore
+        store = EmbeddingStore(EMBEDDING_STORE_DIR, args.dim, read_only=True)
+        texts = [paper['abstract'] for paper in store.get_papers(list(range(min(args.limit, len(store)))))]
+    if not texts:
+        parser.error('no texts to compare')
+
+    # Load the candidate first so its peak RSS is measured before PyTorch is imported
+    candidate = make_encoder(args.backend, MODEL_NAME, batch_size=args.batch_size, threads=args.threads)
+    candidate.encode(texts[:args.batch_size])
+    candidate_rss = _peak_rss_mb()
+    reference = make_encoder('torch', MODEL_NAME, batch_size=args.batch_size, threads=args.threads)
+
+    report = parity_check(texts, candidate, reference)
+    report['candidate_peak_rss_mb'] = round(candidate_rss, 1)
+    report['peak_rss_mb_with_reference'] = round(_peak_rss_mb(), 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import argparse
+import email.utils
+import gzip
+import json
+import os
+import time
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from embedding_store import EmbeddingStore
+from encoders import BACKENDS, make_encoder
+from research_agent import ENCODER_BACKEND, ENCODER_THREADS, EMBEDDING_STORE_DIR, MODEL_NAME, ResearchAgent
+
+
+def open_snapshot(path: str):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def read_chunks(path: str, chunk_size: int, offset: int = 0) -> Iterator[Tuple[List[bytes], int]]:
+    """Stream a JSONL file in chunks of raw lines, starting at byte ``offset``.
+
+    Yields (lines, offset just past the last line) so callers can checkpoint.
+    """
+    with open_snapshot(path) as f:
+        f.seek(offset)
+        lines = []
+        for line in f:
+            offset += len(line)
+            lines.append(line)
+            if len(lines) >= chunk_size:
+                yield lines, offset
+                lines = []
+        if lines:
+            yield lines, offset
+
+
+def parse_record(line: bytes, categories: Optional[Tuple[str, ...]] = None) -> Optional[Dict]:
+    """Turn one arXiv metadata snapshot record into a paper dict.
+
+    Returns None for blank or malformed lines, records without an abstract
+    and records outside ``categories`` (category prefixes, e.g. ``cs.``).
+    """
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+
+    if categories and not any(category.startswith(categories)
+                              for category in record.get('categories', '').split()):
+        return None
+
+    abstract = ResearchAgent.clean_text(record.get('abstract') or '')
+    if not abstract or not record.get('id'):
+        return None
+
+    versions = record.get('versions') or [{'version': 'v1'}]
+    arxiv_id = f"{record['id']}{versions[-1].get('version', 'v1')}"
+
+    published = ''
+    if versions[0].get('created'):
+        try:
+            published = email.utils.parsedate_to_datetime(versions[0]['created']).strftime('%Y-%m-%dT%H:%M:%SZ')
+        except (TypeError, ValueError):
+            pass
+    if not published and record.get('update_date'):
+        published = record['update_date']
+
+    if record.get('authors_parsed'):
+        authors = [' '.join(part for part in (first, last) if part).strip()
+                   for last, first, *_ in record['authors_parsed']]
+    else:
+        authors = [name.strip() for name in
+                   ResearchAgent.clean_text(record.get('authors', '')).replace(' and ', ', ').split(',')
+                   if name.strip()]
+
+    return {
+        'title': ResearchAgent.clean_text(record.get('title') or ''),
+        'abstract': abstract,
+        'authors': authors,
+        'url': f'http://arxiv.org/abs/{arxiv_id}',
+        'published': published,
+        'arxiv_id': arxiv_id,
+        'source': 'arXiv'
+    }
+
+
+def _parse_chunk(args: Tuple[List[bytes], Optional[Tuple[str, ...]]]) -> List[Dict]:
+    lines, categories = args
+    return [paper for paper in (parse_record(line, categories) for line in lines) if paper]
+
+
+def load_checkpoint(path: str, snapshot: str) -> Dict:
+    if os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('snapshot') == os.path.abspath(snapshot):
+            return checkpoint
+    return {'snapshot': os.path.abspath(snapshot), 'offset': 0, 'records': 0, 'ingested': 0}
+
+
+def save_checkpoint(path: str, checkpoint: Dict) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def ingest(snapshot: str, store_dir: str = EMBEDDING_STORE_DIR, checkpoint_path: Optional[str] = None,
+           chunk_size: int = 8192, batch_size: int = 256, workers: Optional[int] = None,
+           categories: Optional[Tuple[str, ...]] = None, restart: bool = False,
+           backend: str = ENCODER_BACKEND, threads: Optional[int] = ENCODER_THREADS) -> Dict:
+    """Encode every paper in an arXiv metadata snapshot into the embedding store.
+
+    Lines are parsed and cleaned on a process pool one chunk ahead of the
+    encoder, so memory stays bounded by two chunks. After each chunk is
+    committed to the store the byte offset is checkpointed; re-running
+    resumes from there, and papers already in the store are never re-encoded.
+    Adding a newer version of a stored paper tombstones the older one.
+    """
+    if checkpoint_path is None:
+        checkpoint_path = os.path.join(store_dir, f'ingest-{os.path.basename(snapshot)}.checkpoint.json')
+    os.makedirs(store_dir, exist_ok=True)
+    checkpoint = load_checkpoint(checkpoint_path, snapshot)
+    if restart:
+        checkpoint.update(offset=0, records=0, ingested=0)
+    if checkpoint['offset']:
+        print(f"Resuming at byte {checkpoint['offset']} ({checkpoint['ingested']} papers ingested so far)")
+
+    workers = workers or os.cpu_count() or 1
+
+    # Start the workers before the model so they don't fork a loaded encoder
+    with Pool(workers) as pool:
+        model = make_encoder(backend, MODEL_NAME, batch_size=batch_size, threads=threads)
+        store = EmbeddingStore(store_dir, model.get_sentence_embedding_dimension())
+        tombstones = len(store.tombstones())
+
+        started = time.perf_counter()
+        ingested = 0
+        chunks = read_chunks(snapshot, chunk_size, checkpoint['offset'])
+        pending = None
+        for lines, offset in chunks:
+            next_pending = (pool.map_async(_parse_chunk, _split(lines, categories, workers)), len(lines), offset)
+            if pending is not None:
+                ingested += _encode_and_store(pending, model, store, batch_size, checkpoint, checkpoint_path)
+                _report(ingested, checkpoint, started)
+            pending = next_pending
+        if pending is not None:
+            ingested += _encode_and_store(pending, model, store, batch_size, checkpoint, checkpoint_path)
+            _report(ingested, checkpoint, started)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'ingested': ingested,
+        'total_ingested': checkpoint['ingested'],
+        'records_read': checkpoint['records'],
+        'store_size': len(store),
+        'superseded': len(store.tombstones()) - tombstones,
+        'seconds': round(elapsed, 2),
+        'papers_per_second': round(ingested / elapsed, 1) if elapsed else 0.0,
+    }
+    print(f"Done: {ingested} papers in {elapsed:.1f}s ({summary['papers_per_second']} papers/s), "
+          f"store now holds {summary['store_size']}")
+    return summary
+
+
+def _split(lines: List[bytes], categories: Optional[Tuple[str, ...]],
+           parts: int) -> List[Tuple[List[bytes], Optional[Tuple[str, ...]]]]:
+    """Cut a chunk into one slice per worker"""
+    step = -(-len(lines) // parts)
+    return [(lines[i:i + step], categories) for i in range(0, len(lines), step)]
+
+
+def _encode_and_store(pending, model, store: EmbeddingStore, batch_size: int,
+                      checkpoint: Dict, checkpoint_path: str) -> int:
+    result, record_count, offset = pending
+    papers = [paper for part in result.get() for paper in part]
+    known = store.lookup(paper['arxiv_id'] for paper in papers)
+    papers = list({p['arxiv_id']: p for p in papers if p['arxiv_id'] not in known}.values())
+    if papers:
+        embeddings = model.encode([paper['abstract'] for paper in papers], batch_size=batch_size,
+                                  normalize_embeddings=True)
+        store.add(papers, embeddings)
+
+    checkpoint['offset'] = offset
+    checkpoint['records'] += record_count
+    checkpoint['ingested'] += len(papers)
+    save_checkpoint(checkpoint_path, checkpoint)
+    return len(papers)
+
+
+def _report(ingested: int, checkpoint: Dict, started: float) -> None:
+    elapsed = time.perf_counter() - started
+    rate = ingested / elapsed if elapsed else 0.0
+    print(f"{checkpoint['records']} records read, {ingested} papers ingested this run "
+          f"({rate:.1f} papers/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest an arXiv metadata snapshot (JSONL) into the local corpus')
+    parser.add_argument('snapshot', help='path to the snapshot, e.g. arxiv-metadata-oai-snapshot.json[.gz]')
+    parser.add_argument('--store', default=EMBEDDING_STORE_DIR, help='embedding store directory')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: inside the store)')
+    parser.add_argument('--chunk-size', type=int, default=8192, help='records parsed and encoded per step')
+    parser.add_argument('--batch-size', type=int, default=256, help='encoder batch size')
+    parser.add_argument('--backend', default=ENCODER_BACKEND, choices=BACKENDS, help='encoder backend')
+    parser.add_argument('--threads', type=int, default=ENCODER_THREADS, help='encoder threads')
+    parser.add_argument('--workers', type=int, default=None, help='parser processes (default: CPU count)')
+    parser.add_argument('--categories', default=None,
+                        help='comma-separated category prefixes to keep, e.g. cs.CL,cs.LG,stat.ML')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+    args = parser.parse_args()
+
+    categories = tuple(c.strip() for c in args.categories.split(',')) if args.categories else None
+    ingest(args.snapshot, store_dir=args.store, checkpoint_path=args.checkpoint,
+           chunk_size=args.chunk_size, batch_size=args.batch_size, workers=args.workers,
+           categories=categories, restart=args.restart, backend=args.backend, threads=args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import gzip
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+STOPWORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are',
+    'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
+    'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those', 'we', 'they',
+    'i', 'you', 'he', 'she', 'it', 'our', 'their', 'its', 'which', 'from', 'than', 'such', 'also',
+    'not', 'into', 'over', 'using', 'both', 'while', 'when', 'where', 'how', 'what', 'all', 'each',
+    'other', 'more', 'most', 'some', 'any', 'only', 'then', 'there', 'here', 'show', 'shows',
+})
+
+# IDFTable.build drops single-document terms once it counts this many times max_terms
+PRUNE_FACTOR = 4
+
+_WORD = re.compile(r'\b[a-zA-Z]{3,}\b')
+_CLAUSE = re.compile(r'[.,;:!?()\[\]"]')
+
+
+def terms(text: str) -> List[str]:
+    """Unigrams plus adjacent-word bigrams (as "w1 w2") within a clause, skipping stopwords"""
+    unigrams = []
+    bigrams = []
+    for clause in _CLAUSE.split(text.lower()):
+        words = _WORD.findall(clause)
+        unigrams += [w for w in words if w not in STOPWORDS]
+        bigrams += [f'{a} {b}' for a, b in zip(words, words[1:]) if a not in STOPWORDS and b not in STOPWORDS]
+    return unigrams + bigrams
+
+
+class IDFTable:
+    """Document frequencies of unigrams and bigrams over a local abstract corpus.
+
+    Terms seen in fewer than ``min_df`` documents are dropped when saving,
+    which keeps the table small; unseen unigrams score as rare, while
+    unseen bigrams are not treated as phrases at all.
+    """
+
+    def __init__(self, n_docs: int, df: Dict[str, int]):
+        self.n_docs = n_docs
+        self.df = df
+
+    @classmethod
+    def build(cls, abstracts: Iterable[str], min_df: int = 3, max_terms: int = 200_000,
+              prune_every: int = 10_000) -> 'IDFTable':
+        """Count document frequencies, keeping the table bounded on large corpora.
+
+        Every ``prune_every`` documents, once more than ``PRUNE_FACTOR *
+        max_terms`` terms are being counted, terms seen in a single document
+        so far are dropped. Most of them are typos and one-off bigrams; a
+        rare term that recurs later may come out undercounted, which only
+        matters near ``min_df``.
+        """
+        df = Counter()
+        n_docs = 0
+        for abstract in abstracts:
+            df.update(set(terms(abstract)))
+            n_docs += 1
+            if n_docs % prune_every == 0 and len(df) > PRUNE_FACTOR * max_terms:
+                df = Counter({term: count for term, count in df.items() if count > 1})
+        kept = {term: count for term, count in df.most_common(max_terms) if count >= min_df}
+        return cls(n_docs, kept)
+
+    @classmethod
+    def load(cls, path: str) -> 'IDFTable':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['n_docs'], data['df'])
+
+    def save(self, path: str) -> None:
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump({'n_docs': self.n_docs, 'df': self.df}, f, separators=(',', ':'))
+
+    def idf(self, term: str) -> Optional[float]:
+        df = self.df.get(term)
+        if df is None:
+            if ' ' in term:
+                return None
+            df = 0
+        return math.log((self.n_docs + 1) / (df + 1)) + 1
+
+    def keywords(self, text: str, top_n: int = 10) -> List[str]:
+        """Terms of ``text`` ranked by tf-idf, with attested bigrams as phrases.
+
+        Unigrams already covered by a higher-ranked phrase are skipped.
+        """
+        scored = []
+        for term, tf in Counter(terms(text)).items():
+            idf = self.idf(term)
+            if idf is not None:
+                scored.append((tf * idf, term))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+
+        selected = []
+        covered = set()
+        for _, term in scored:
+            words = term.split()
+            if len(words) == 1 and term in covered:
+                continue
+            if len(words) == 2 and all(w in covered for w in words):
+                continue
+            selected.append(term)
+            covered.update(words)
+            if len(selected) >= top_n:
+                break
+        return selected
+
+
+def build_queries(keywords: List[str], n_queries: int = 1, terms_per_query: int = 5) -> List[str]:
+    """arXiv queries from ranked keywords.
+
+    One query uses the top ``terms_per_query`` keywords. Several queries
+    deal the top keywords out round-robin, so each query pairs strong and
+    weaker terms and the queries cover different aspects. Phrases are quoted.
+    """
+    n_queries = max(1, n_queries)
+    per_query = terms_per_query if n_queries == 1 else max(2, min(terms_per_query, len(keywords) // n_queries))
+    pool = keywords[:per_query * n_queries]
+    queries = []
+    for i in range(n_queries):
+        group = pool[i::n_queries]
+        if group:
+            queries.append(' '.join(f'"{term}"' if ' ' in term else term for term in group))
+    return queries
+
+
+def main():
+    from embedding_store import EmbeddingStore
+    from research_agent import EMBEDDING_STORE_DIR, IDF_TABLE_PATH
+
+    parser = argparse.ArgumentParser(description='Build the IDF table used for keyword extraction')
+    parser.add_argument('--store', default=EMBEDDING_STORE_DIR, help='embedding store to read abstracts from')
+    parser.add_argument('--texts', default=None, help='file with one abstract per line instead of the store')
+    parser.add_argument('--dim', type=int, default=384, help='embedding dimension of the store')
+    parser.add_argument('--out', default=IDF_TABLE_PATH, help='output path (.json.gz)')
+    parser.add_argument('--min-df', type=int, default=3, help='drop terms in fewer documents')
+    parser.add_argument('--max-terms', type=int, default=200_000, help='keep at most this many terms')
+    args = parser.parse_args()
+
+    if args.texts:
+        def abstracts():
+            with open(args.texts) as f:
+                for line in f:
+                    if line.strip():
+                        yield line
+    else:
+        store = EmbeddingStore(args.store, args.dim, read_only=True)
+
+        def abstracts():
+            for start in range(0, len(store), 5000):
+                for paper in store.get_papers(list(range(start, min(start + 5000, len(store))))):
+                    yield paper['abstract']
+
+    table = IDFTable.build(abstracts(), min_df=args.min_df, max_terms=args.max_terms)
+    table.save(args.out)
+    print(f"IDF table over {table.n_docs} abstracts with {len(table.df)} terms -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# v1/ and v2/ carry identical copies of this module; change both together. Metrics
+# specific to one app (and the metric names) are registered by that app.
+
+# Seconds; spans range from sub-millisecond cache lookups to minute-long searches and LLM calls
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# (metric name, type, help, labels, value) samples produced at scrape time
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: Dict[Labels, List[float]] = {}  # bucket counts, then sum, then count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, values in series:
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{_format_labels(key, ("le", repr(bound)))} {_format_value(count)}')
+            lines.append(f'{self.name}_bucket{_format_labels(key, ("le", "+Inf"))} {_format_value(values[-1])}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(values[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {_format_value(values[-1])}')
+        return lines
+
+
+class Registry:
+    """Process-wide metrics rendered in the Prometheus text format.
+
+    Counters and histograms are updated as work happens; collectors are
+    called at scrape time for values kept elsewhere (upstream client
+    counters, cache statistics) and return Sample tuples. ``stages`` is
+    the histogram observe() records pipeline stages in, once an app has
+    named it with stage_histogram().
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self.stages: Optional[Histogram] = None
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def stage_histogram(self, name: str, help: str) -> Histogram:
+        self.stages = self.histogram(name, help)
+        return self.stages
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        grouped: Dict[str, Tuple[str, str, List[Tuple[Dict[str, str], float]]]] = {}
+        for collector in self._collectors:
+            for name, kind, help, labels, value in collector():
+                grouped.setdefault(name, (kind, help, []))[2].append((labels, value))
+        for name, (kind, help, samples) in grouped.items():
+            lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+            lines += [f'{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}'
+                      for labels, value in samples]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class Timings:
+    """Per-request breakdown of stage spans and counts; safe to add to from worker threads"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages: Dict[str, List[float]] = {}
+        self._counts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            totals = self._stages.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def as_dict(self) -> Dict:
+        """Stage counts and summed milliseconds; spans running in parallel add up past the wall time"""
+        with self._lock:
+            stages = {stage: {'count': count, 'total_ms': round(seconds * 1000, 2)}
+                      for stage, (count, seconds) in self._stages.items()}
+            counts = dict(self._counts)
+        return {'total_ms': round((time.perf_counter() - self.started) * 1000, 2), 'stages': stages,
+                'counts': counts}
+
+
+_timings: contextvars.ContextVar[Optional[Timings]] = contextvars.ContextVar('timings', default=None)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Timings]:
+    """Record every span in this context (and in threads started with its context) into a Timings"""
+    timings = Timings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def observe(stage: str, seconds: float) -> None:
+    if registry.stages is not None:
+        registry.stages.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+def count(name: str, amount: float = 1) -> None:
+    """Add to a per-request count; process-wide totals are kept by the caller"""
+    timings = _timings.get()
+    if timings is not None:
+        timings.count(name, amount)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block as one ``stage`` observation"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def cache_samples(prefix: str, cache: str, stats: Optional[Dict]) -> List[Sample]:
+    """Hit/miss counters and hit rate for a cache exposing ``stats()`` with hits and misses.
+
+    A cache that reports its own ``hit_rate`` (e.g. counting coalesced
+    requests as hits) is exported as is.
+    """
+    if stats is None:
+        return []
+    labels = {'cache': cache}
+    samples = [(f'{prefix}_cache_hits_total', 'counter', 'Cache lookups answered from the cache',
+                labels, stats['hits']),
+               (f'{prefix}_cache_misses_total', 'counter', 'Cache lookups that had to compute or fetch',
+                labels, stats['misses'])]
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = stats.get('hit_rate', stats['hits'] / lookups if lookups else 0.0)
+    samples.append((f'{prefix}_cache_hit_ratio', 'gauge', 'Share of cache lookups served without recomputing',
+                    labels, hit_rate))
+    if 'entries' in stats:
+        samples.append((f'{prefix}_cache_entries', 'gauge', 'Entries currently cached', labels, stats['entries']))
+    return samples
@@ -1,56 +1,317 @@
+import heapq
 import os
-import requests
-import feedparser
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Tuple
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Tuple, Optional
 import re
+import threading
 import time
 
+from ann_index import IVFIndex
+from arxiv_client import ARXIV_PAGE_SIZE, ArxivFetch, ArxivPageError
+from bm25_index import BM25Index
+from embedding_store import EmbeddingStore
+from encode_service import RemoteEncoder
+from encoders import BACKENDS, Encoder, make_encoder
+from keywords import IDFTable, build_queries
+from metrics import observe, span
+from search_cache import SearchCache
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Encoder backend: 'torch' (SentenceTransformer), 'onnx' or 'onnx-int8' (ONNX Runtime)
+ENCODER_BACKEND = os.environ.get('RESEARCH_AGENT_ENCODER', 'torch')
+ENCODE_BATCH_SIZE = int(os.environ.get('RESEARCH_AGENT_ENCODE_BATCH_SIZE', '64'))
+# Threads the encoder may use; unset lets the backend decide
+ENCODER_THREADS = int(os.environ['RESEARCH_AGENT_ENCODER_THREADS']) \
+    if os.environ.get('RESEARCH_AGENT_ENCODER_THREADS') else None
+# Unix socket of a shared encode service (`python encode_service.py`); when set,
+# workers send texts there instead of loading their own copy of the model
+ENCODE_SERVICE = os.environ.get('RESEARCH_AGENT_ENCODE_SERVICE', '')
+
+# On-disk cache of arXiv search results; set to an empty string to disable
+SEARCH_CACHE_PATH = os.environ.get(
+    'RESEARCH_AGENT_SEARCH_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_cache.sqlite3')
+)
+SEARCH_CACHE_TTL = float(os.environ.get('RESEARCH_AGENT_SEARCH_CACHE_TTL', str(24 * 3600)))
+SEARCH_CACHE_MAX_MB = float(os.environ.get('RESEARCH_AGENT_SEARCH_CACHE_MAX_MB', '256'))
+
+# Answer searches from the cache only (including expired entries), never the network
+SEARCH_CACHE_ONLY = os.environ.get('RESEARCH_AGENT_SEARCH_CACHE_ONLY', '') == '1'
+
+# Directory of the persistent paper embedding store; set to an empty string to disable
+EMBEDDING_STORE_DIR = os.environ.get(
+    'RESEARCH_AGENT_EMBEDDING_STORE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedding_store')
+)
+# Open the store without writing to it, e.g. when another process maintains it
+EMBEDDING_STORE_READ_ONLY = os.environ.get('RESEARCH_AGENT_EMBEDDING_STORE_READ_ONLY', '') == '1'
+
+# ANN index over the embedding store, built with `python ann_index.py`
+ANN_INDEX_DIR = os.environ.get(
+    'RESEARCH_AGENT_ANN_INDEX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ann_index')
+)
+# Lists scanned per query: higher is slower but closer to exact search
+ANN_NPROBE = int(os.environ.get('RESEARCH_AGENT_ANN_NPROBE', '8'))
+# Candidates pulled from the index before thresholding
+ANN_CANDIDATES = 100
+# Candidates pulled from the live arXiv search; above one page they are fetched in parallel
+LIVE_CANDIDATES = int(os.environ.get('RESEARCH_AGENT_LIVE_CANDIDATES', '100'))
+# Focused arXiv queries per abstract; the candidate budget is split between them
+LIVE_QUERIES = int(os.environ.get('RESEARCH_AGENT_LIVE_QUERIES', '1'))
+# Candidates embedded and scored per step; bounds scoring memory regardless of pool size
+SCORE_CHUNK_SIZE = int(os.environ.get('RESEARCH_AGENT_SCORE_CHUNK_SIZE', '512'))
+
+# IDF table for keyword extraction, built with `python keywords.py`; without it
+# keywords fall back to raw term frequency
+IDF_TABLE_PATH = os.environ.get(
+    'RESEARCH_AGENT_IDF_TABLE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'idf_table.json.gz')
+)
+
+# BM25 index over stored titles and abstracts, built with `python bm25_index.py`
+BM25_INDEX_DIR = os.environ.get(
+    'RESEARCH_AGENT_BM25_INDEX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bm25_index')
+)
+# Reciprocal rank fusion constant for the hybrid source
+RRF_K = 60
+# Seconds between checks for rebuilt ANN/BM25 indexes (e.g. after `python update.py --compact`)
+INDEX_RELOAD_INTERVAL = float(os.environ.get('RESEARCH_AGENT_INDEX_RELOAD_INTERVAL', '30'))
+
+# Where find_related_papers gets candidates: live arXiv search, the local index, both,
+# or 'hybrid': the local ANN and BM25 indexes with their rankings fused
+SOURCES = ('live', 'index', 'both', 'hybrid')
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length so dot products are cosine similarities"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
 
 class ResearchAgent:
-    def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.papers_cache = []
-        self.embeddings_cache = []
+    def __init__(self, search_cache: Optional[SearchCache] = None, cache_only: bool = SEARCH_CACHE_ONLY,
+                 embedding_store: Optional[EmbeddingStore] = None, lazy: bool = False,
+                 encoder_backend: str = ENCODER_BACKEND):
+        if encoder_backend not in BACKENDS:
+            raise ValueError(f"encoder_backend must be one of {', '.join(BACKENDS)}")
+        self.encoder_backend = encoder_backend
+        self._model = None
+        self._embedding_store = embedding_store
+        self._ann_index = None
+        self._bm25_index = None
+        self._load_lock = threading.Lock()
+        self._index_versions = (None, None)
+        self._index_checked = 0.0
+        self.startup_seconds = None
+        self.load_error = None
+        if search_cache is None and SEARCH_CACHE_PATH:
+            search_cache = SearchCache(SEARCH_CACHE_PATH, ttl=SEARCH_CACHE_TTL,
+                                       max_bytes=int(SEARCH_CACHE_MAX_MB * 1024 * 1024))
+        self.search_cache = search_cache
+        self.cache_only = cache_only
+        self.idf_table = IDFTable.load(IDF_TABLE_PATH) \
+            if IDF_TABLE_PATH and os.path.exists(IDF_TABLE_PATH) else None
+        if not lazy:
+            self.load()
+
+    def load(self) -> None:
+        """Load the encoder, embedding store and local indexes if not loaded yet.
+
+        Safe to call from many threads: callers that arrive while another
+        thread is loading block until it finishes instead of loading twice.
+        """
+        if self._model is not None:
+            return
+        with self._load_lock:
+            if self._model is not None:
+                return
+            started = time.perf_counter()
+            try:
+                if ENCODE_SERVICE:
+                    model = RemoteEncoder(ENCODE_SERVICE)
+                else:
+                    model = make_encoder(self.encoder_backend, MODEL_NAME, batch_size=ENCODE_BATCH_SIZE,
+                                         threads=ENCODER_THREADS)
+                embedding_store = self._embedding_store
+                if embedding_store is None and EMBEDDING_STORE_DIR:
+                    embedding_store = EmbeddingStore(EMBEDDING_STORE_DIR,
+                                                     model.get_sentence_embedding_dimension(),
+                                                     read_only=EMBEDDING_STORE_READ_ONLY)
+                ann_index, bm25_index = self._load_indexes(embedding_store)
+            except Exception as e:
+                self.load_error = str(e)
+                print(f"Error loading encoder: {e}")
+                raise
 
-    def clean_text(self, text: str) -> str:
+            self._embedding_store = embedding_store
+            self._ann_index = ann_index
+            self._bm25_index = bm25_index
+            self._index_versions = self._current_index_versions()
+            self._index_checked = time.monotonic()
+            self.load_error = None
+            self.startup_seconds = time.perf_counter() - started
+            # Publish the model last; it is what marks the agent as ready
+            self._model = model
+            print(f"Encoder {MODEL_NAME} ({model.name}) loaded in {self.startup_seconds:.2f}s")
+
+    @staticmethod
+    def _load_indexes(embedding_store: Optional[EmbeddingStore]):
+        ann_index = None
+        if embedding_store is not None and IVFIndex.exists(ANN_INDEX_DIR):
+            ann_index = IVFIndex.load(ANN_INDEX_DIR, embedding_store, nprobe=ANN_NPROBE)
+        bm25_index = None
+        if embedding_store is not None and BM25Index.exists(BM25_INDEX_DIR):
+            bm25_index = BM25Index.load(BM25_INDEX_DIR, embedding_store)
+        return ann_index, bm25_index
+
+    @staticmethod
+    def _current_index_versions():
+        """The build each index directory links to, plus its meta file's mtime"""
+        versions = []
+        for directory in (ANN_INDEX_DIR, BM25_INDEX_DIR):
+            try:
+                build = os.path.realpath(directory)
+                versions.append((build, os.path.getmtime(os.path.join(build, 'meta.json'))))
+            except OSError:
+                versions.append(None)
+        return tuple(versions)
+
+    def _reload_indexes(self) -> None:
+        """Swap in indexes rebuilt since they were loaded, checking at most every INDEX_RELOAD_INTERVAL.
+
+        Searches already running keep the index objects they started with.
+        """
+        if INDEX_RELOAD_INTERVAL <= 0 or time.monotonic() - self._index_checked < INDEX_RELOAD_INTERVAL:
+            return
+        with self._load_lock:
+            if time.monotonic() - self._index_checked < INDEX_RELOAD_INTERVAL:
+                return
+            self._index_checked = time.monotonic()
+            versions = self._current_index_versions()
+            if versions == self._index_versions:
+                return
+            try:
+                ann_index, bm25_index = self._load_indexes(self._embedding_store)
+            except Exception as e:
+                # Possibly caught mid-rebuild; keep serving the old indexes and retry next interval
+                print(f"Error reloading indexes: {e}")
+                return
+            self._ann_index = ann_index
+            self._bm25_index = bm25_index
+            self._index_versions = versions
+            print("Reloaded local indexes")
+
+    def start_warm_up(self) -> threading.Thread:
+        """Load in a background thread so the caller (e.g. the web server) can start right away"""
+        def warm_up():
+            try:
+                self.load()
+            except Exception:
+                pass  # already logged; the next request retries the load
+
+        thread = threading.Thread(target=warm_up, name='encoder-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self) -> Encoder:
+        self.load()
+        return self._model
+
+    @property
+    def embedding_store(self) -> Optional[EmbeddingStore]:
+        self.load()
+        return self._embedding_store
+
+    @property
+    def ann_index(self) -> Optional[IVFIndex]:
+        self.load()
+        self._reload_indexes()
+        return self._ann_index
+
+    @property
+    def bm25_index(self) -> Optional[BM25Index]:
+        self.load()
+        self._reload_indexes()
+        return self._bm25_index
+
+    @staticmethod
+    def clean_text(text: str) -> str:
         """Clean and preprocess text"""
         text = re.sub(r'<[^>]+>', '', text)  # Remove HTML tags
         text = re.sub(r'\s+', ' ', text)     # Normalize whitespace
         return text.strip()
 
-    def search_arxiv(self, query: str, max_results: int = 50) -> List[Dict]:
-        """Search arXiv for papers"""
-        base_url = 'http://export.arxiv.org/api/query?'
-        query_encoded = requests.utils.quote(query)
-        url = f"{base_url}search_query=all:{query_encoded}&start=0&max_results={max_results}&sortBy=relevance&sortOrder=descending"
-
-        try:
-            response = requests.get(url, timeout=10)
-            feed = feedparser.parse(response.content)
-
-            papers = []
-            for entry in feed.entries:
-                paper = {
-                    'title': self.clean_text(entry.title),
-                    'abstract': self.clean_text(entry.summary),
-                    'authors': [author.name for author in entry.authors],
-                    'url': entry.link,
-                    'published': entry.published,
-                    'arxiv_id': entry.id.split('/')[-1],
-                    'source': 'arXiv'
-                }
+    def iter_arxiv(self, query: str, max_results: int = 50,
+                   errors: Optional[List[ArxivPageError]] = None) -> Iterator[Dict]:
+        """Stream arXiv results as their pages arrive, going through the search cache.
+
+        Pages are fetched in parallel with polite spacing between requests.
+        A failed page is logged and appended to ``errors`` while the other
+        pages are still returned; if every page fails the search raises.
+        """
+        cache_key = SearchCache.make_key('arxiv', query, max_results=max_results)
+        if self.search_cache is not None:
+            cached = self.search_cache.get(cache_key, allow_stale=self.cache_only)
+            if cached is not None:
+                yield from cached
+                return
+
+        if self.cache_only:
+            print(f"No cached arXiv results for '{query}' (cache-only mode)")
+            return
+
+        fetch = ArxivFetch(query, max_results)
+        # Only kept when they will be cached, so a stream holds no more than its page buffers
+        papers = [] if self.search_cache is not None else None
+        found = 0
+        for entry in fetch:
+            paper = {
+                'title': self.clean_text(entry['title']),
+                'abstract': self.clean_text(entry['summary']),
+                'authors': entry['authors'],
+                'url': entry['link'],
+                'published': entry['published'],
+                'arxiv_id': entry['id'].split('/abs/')[-1],
+                'source': 'arXiv'
+            }
+            found += 1
+            if papers is not None:
                 papers.append(paper)
+            yield paper
 
-            return papers
-        except Exception as e:
-            print(f"Error searching arXiv: {e}")
-            return []
+        for error in fetch.errors:
+            print(f"Error searching arXiv for '{query}', {error}")
+        if errors is not None:
+            errors.extend(fetch.errors)
+        if fetch.errors and not found:
+            raise RuntimeError(f"arXiv search failed: {'; '.join(str(e) for e in fetch.errors)}")
+
+        # Only complete result sets are cached
+        if self.search_cache is not None and not fetch.errors:
+            self.search_cache.set(cache_key, papers)
 
+    def search_arxiv(self, query: str, max_results: int = 50) -> List[Dict]:
+        """Search arXiv for papers, going through the search cache"""
+        return list(self.iter_arxiv(query, max_results))
+
+    @span('extract_keywords')
     def extract_keywords(self, abstract: str) -> List[str]:
         """Extract potential search keywords from abstract"""
+        if self.idf_table is not None:
+            # Rare, specific terms and phrases rank above generic ones like "model" or "results"
+            return self.idf_table.keywords(abstract, top_n=10)
+
         # Remove common stopwords and extract meaningful terms
         stopwords = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those', 'we', 'they', 'i', 'you', 'he', 'she', 'it'}
 
@@ -65,38 +326,270 @@ class ResearchAgent:
 
         return top_keywords
 
-    def find_related_papers(self, input_abstract: str, similarity_threshold: float = 0.3) -> List[Tuple[Dict, float]]:
-        """Find papers related to the input abstract"""
-        # Extract keywords and search for papers
-        keywords = self.extract_keywords(input_abstract)
-        search_query = ' '.join(keywords[:5])  # Use top 5 keywords
+    def encode(self, texts: List[str], normalize_embeddings: bool = False) -> np.ndarray:
+        """Encode texts with the loaded model, timed as the ``encode`` stage"""
+        model = self.model
+        with span('encode'):
+            return model.encode(texts, batch_size=ENCODE_BATCH_SIZE, normalize_embeddings=normalize_embeddings)
+
+    def embed_papers(self, papers: List[Dict]) -> np.ndarray:
+        """Abstract embeddings for papers, encoding only ones missing from the embedding store"""
+        if self.embedding_store is None:
+            return self.encode([paper['abstract'] for paper in papers])
+
+        with span('embedding_store'):
+            rows = self.embedding_store.lookup(paper['arxiv_id'] for paper in papers)
+        missing = list({paper['arxiv_id']: paper for paper in papers if paper['arxiv_id'] not in rows}.values())
+        fresh = {}
+        if missing:
+            embeddings = self.encode([paper['abstract'] for paper in missing], normalize_embeddings=True)
+            if self.embedding_store.read_only:
+                fresh = {paper['arxiv_id']: embedding for paper, embedding in zip(missing, embeddings)}
+            else:
+                with span('embedding_store'):
+                    rows.update(self.embedding_store.add(missing, embeddings))
+
+        stored = [paper['arxiv_id'] for paper in papers if paper['arxiv_id'] in rows]
+        with span('embedding_store'):
+            stored_vectors = dict(zip(stored, self.embedding_store.get_vectors([rows[i] for i in stored])))
+        return np.vstack([
+            fresh[paper['arxiv_id']] if paper['arxiv_id'] in fresh else stored_vectors[paper['arxiv_id']]
+            for paper in papers
+        ]).astype(np.float32)
+
+    @span('ann_search')
+    def search_index(self, input_embedding: np.ndarray, k: int = ANN_CANDIDATES,
+                     nprobe: Optional[int] = None) -> List[Dict]:
+        """Nearest papers to an embedding from the local ANN index"""
+        if self.ann_index is None:
+            raise ValueError('No local paper index available; build one with `python ann_index.py`')
+        rows, _ = self.ann_index.search(input_embedding, k=k, nprobe=nprobe)
+        return self.embedding_store.get_papers(rows.tolist())
+
+    @span('bm25_search')
+    def search_bm25(self, text: str, k: int = ANN_CANDIDATES) -> List[Dict]:
+        """Best BM25 matches for ``text`` among stored papers, best first"""
+        if self.bm25_index is None:
+            raise ValueError('No BM25 index available; build one with `python bm25_index.py`')
+        rows, _ = self.bm25_index.search(text, k=k)
+        return self.embedding_store.get_papers(rows.tolist())
+
+    def gather_candidates(self, input_abstract: str, input_embedding: np.ndarray,
+                          source: str = 'live', nprobe: Optional[int] = None,
+                          embeddings: Optional[Dict[str, np.ndarray]] = None,
+                          n_queries: int = LIVE_QUERIES,
+                          lexical_ranks: Optional[Dict[str, int]] = None,
+                          errors: Optional[List[ArxivPageError]] = None) -> List[Dict]:
+        """Candidate papers for one abstract from the chosen source.
+
+        ``n_queries`` > 1 splits the live search into several focused
+        queries sharing the candidate budget. If ``embeddings`` is given,
+        live results are encoded a page at a time while later pages are
+        still downloading, keyed by arxiv_id. For the hybrid source the
+        BM25 rank (from 1) of each lexical hit is written to ``lexical_ranks``.
+        arXiv pages that failed are appended to ``errors``.
+        """
+        return list(self.iter_candidates(input_abstract, input_embedding, source=source, nprobe=nprobe,
+                                         embeddings=embeddings, n_queries=n_queries,
+                                         lexical_ranks=lexical_ranks, errors=errors))
 
-        print(f"Searching with keywords: {search_query}")
+    def iter_candidates(self, input_abstract: str, input_embedding: np.ndarray,
+                        source: str = 'live', nprobe: Optional[int] = None,
+                        embeddings: Optional[Dict[str, np.ndarray]] = None,
+                        n_queries: int = LIVE_QUERIES,
+                        lexical_ranks: Optional[Dict[str, int]] = None,
+                        errors: Optional[List[ArxivPageError]] = None) -> Iterator[Dict]:
+        """gather_candidates as a stream: live results are yielded while later pages download"""
+        seen = set()
+        if source in ('live', 'both'):
+            # Extract keywords and search for papers
+            keywords = self.extract_keywords(input_abstract)
+            search_queries = build_queries(keywords, n_queries)  # Top 5 keywords per query
+            per_query = max(1, LIVE_CANDIDATES // max(1, len(search_queries)))
 
-        # Search arXiv
-        papers = self.search_arxiv(search_query, max_results=100)
+            for search_query in search_queries:
+                print(f"Searching with keywords: {search_query}")
 
-        if not papers:
+                # Search arXiv
+                page = []
+                for paper in self.iter_arxiv(search_query, max_results=per_query, errors=errors):
+                    if paper['arxiv_id'] in seen:
+                        continue
+                    seen.add(paper['arxiv_id'])
+                    yield paper
+                    if embeddings is not None and paper['arxiv_id'] not in embeddings:
+                        page.append(paper)
+                        if len(page) >= ARXIV_PAGE_SIZE:
+                            embeddings.update(zip([p['arxiv_id'] for p in page], self.embed_papers(page)))
+                            page = []
+
+        if source == 'hybrid':
+            for rank, paper in enumerate(self.search_bm25(input_abstract), 1):
+                if lexical_ranks is not None:
+                    lexical_ranks[paper['arxiv_id']] = rank
+                seen.add(paper['arxiv_id'])
+                yield paper
+
+        if source in ('index', 'both') or (source == 'hybrid' and self.ann_index is not None):
+            for paper in self.search_index(input_embedding, nprobe=nprobe):
+                if paper['arxiv_id'] not in seen:
+                    seen.add(paper['arxiv_id'])
+                    yield paper
+
+    def score_candidates(self, input_embedding: np.ndarray, candidates: Iterable[Dict], k: int = 20,
+                         threshold: float = 0.3,
+                         chunk_size: int = SCORE_CHUNK_SIZE) -> List[Tuple[Dict, float]]:
+        """Top-k candidates by cosine similarity to a normalized embedding, best first.
+
+        Candidates are consumed ``chunk_size`` at a time: each chunk is
+        embedded, scored and merged into a running top-k heap, so memory
+        depends on ``chunk_size`` and ``k`` rather than on the pool size.
+        Ties keep the candidates' original order, as in find_related_papers_batch.
+        """
+        query = np.asarray(input_embedding, dtype=np.float64)
+        # (score, -position, paper): heap[0] is the weakest match kept; positions are unique,
+        # so papers are never compared
+        heap = []
+        position = 0
+        candidates = iter(candidates)
+        while True:
+            chunk = list(islice(candidates, chunk_size))
+            if not chunk:
+                break
+            embeddings = self.embed_papers(chunk)
+            started = time.perf_counter()
+            similarities = normalize_rows(embeddings).astype(np.float64) @ query
+            floor = threshold if len(heap) < k else max(threshold, heap[0][0])
+            for offset in np.flatnonzero(similarities >= floor):
+                item = (float(similarities[offset]), -(position + offset), chunk[offset])
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            position += len(chunk)
+            observe('score', time.perf_counter() - started)
+        return [(paper, score) for score, _, paper in sorted(heap, reverse=True)]
+
+    def find_related_papers(self, input_abstract: str, similarity_threshold: float = 0.3,
+                            source: str = 'live', nprobe: Optional[int] = None,
+                            n_queries: int = LIVE_QUERIES,
+                            errors: Optional[List[ArxivPageError]] = None) -> List[Tuple[Dict, float]]:
+        """Find papers related to the input abstract.
+
+        ``source`` selects the candidates: 'live' searches arXiv by keyword,
+        'index' queries the local ANN index and 'both' merges the two.
+        'hybrid' stays offline: it takes BM25 and ANN hits from the local
+        indexes and orders them by reciprocal rank fusion of the BM25 and
+        cosine rankings. Only candidates above the threshold get a cosine
+        rank, but BM25 hits below it still compete on their BM25 rank.
+        ``nprobe`` overrides the index's recall/latency setting and
+        ``n_queries`` sets how many focused arXiv queries are issued.
+        arXiv pages that failed are appended to ``errors``; the results
+        are then built from the pages that arrived.
+        Except for 'hybrid', which ranks the whole pool, candidates are
+        scored in chunks as they arrive (see score_candidates).
+        """
+        if source not in SOURCES:
+            raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+        if source != 'hybrid':
+            input_embedding = normalize_rows(self.encode([input_abstract]))[0]
+            candidates = self.iter_candidates(input_abstract, input_embedding, source=source, nprobe=nprobe,
+                                              n_queries=n_queries, errors=errors)
+            return self.score_candidates(input_embedding, candidates, k=20, threshold=similarity_threshold)
+        return self.find_related_papers_batch([input_abstract], k=20, threshold=similarity_threshold,
+                                              source=source, nprobe=nprobe, n_queries=n_queries,
+                                              errors=errors)[0]
+
+    def find_related_papers_batch(self, abstracts: List[str], k: int = 20, threshold: float = 0.3,
+                                  source: str = 'live', nprobe: Optional[int] = None,
+                                  n_queries: int = LIVE_QUERIES,
+                                  errors: Optional[List[ArxivPageError]] = None) -> List[List[Tuple[Dict, float]]]:
+        """Find related papers for many abstracts at once.
+
+        All abstracts are encoded in one pass, the union of their candidates
+        is deduplicated and embedded once, and every pair is scored with a
+        single normalized matrix product. Each abstract only ranks its own
+        candidates, so results match calling find_related_papers per abstract.
+        arXiv pages that failed, for any abstract, are appended to ``errors``.
+        """
+        if source not in SOURCES:
+            raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+        if not abstracts:
             return []
 
-        # Create embeddings for all abstracts
-        input_embedding = self.model.encode([input_abstract])
-        paper_abstracts = [paper['abstract'] for paper in papers]
-        paper_embeddings = self.model.encode(paper_abstracts)
+        input_embeddings = normalize_rows(self.encode(list(abstracts)))
+
+        # Union of candidates, plus each candidate's rank within its abstract's own list
+        columns = {}
+        union = []
+        ranks = []
+        lexical = []
+        embedded = {}
+        for abstract, embedding in zip(abstracts, input_embeddings):
+            own = {}
+            lexical_ranks = {}
+            for paper in self.gather_candidates(abstract, embedding, source=source, nprobe=nprobe,
+                                                embeddings=embedded, n_queries=n_queries,
+                                                lexical_ranks=lexical_ranks, errors=errors):
+                column = columns.get(paper['arxiv_id'])
+                if column is None:
+                    column = columns[paper['arxiv_id']] = len(union)
+                    union.append(paper)
+                own.setdefault(column, len(own))
+            ranks.append(own)
+            lexical.append({columns[arxiv_id]: rank for arxiv_id, rank in lexical_ranks.items()})
+
+        if not union:
+            return [[] for _ in abstracts]
+
+        missing = [paper for paper in union if paper['arxiv_id'] not in embedded]
+        if missing:
+            embedded.update(zip([paper['arxiv_id'] for paper in missing], self.embed_papers(missing)))
+        started = time.perf_counter()
+        paper_embeddings = normalize_rows(np.vstack([embedded[paper['arxiv_id']] for paper in union]))
+
+        # float64 keeps the product independent of how many abstracts share the call
+        similarities = input_embeddings.astype(np.float64) @ paper_embeddings.astype(np.float64).T
+
+        not_candidate = len(union)
+        position = np.full(similarities.shape, not_candidate, dtype=np.int64)
+        for row, own in enumerate(ranks):
+            if own:
+                position[row, list(own)] = list(own.values())
+        scores = np.where((position < not_candidate) & (similarities >= threshold), similarities, -np.inf)
 
-        # Calculate similarities
-        similarities = cosine_similarity(input_embedding, paper_embeddings)[0]
+        results = []
+        for row in range(len(abstracts)):
+            row_scores = scores[row]
+            matches = np.flatnonzero(row_scores > -np.inf)
+            if source == 'hybrid':
+                order = self._fuse(matches, row_scores, position[row], lexical[row])[:k]
+                results.append([(union[column], float(similarities[row, column])) for column in order])
+                continue
+            if len(matches) > k:
+                # Keep everything tied with the k-th best so the tie-break below is exact
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                matches = np.flatnonzero(row_scores >= row_scores[top].min())
+            # Highest similarity first; ties keep the candidate's original order
+            order = matches[np.lexsort((position[row, matches], -row_scores[matches]))][:k]
+            results.append([(union[column], float(row_scores[column])) for column in order])
 
-        # Filter by threshold and sort by similarity
-        related_papers = []
-        for i, similarity in enumerate(similarities):
-            if similarity >= similarity_threshold:
-                related_papers.append((papers[i], float(similarity)))
+        observe('score', time.perf_counter() - started)
+        return results
 
-        # Sort by similarity score (descending)
-        related_papers.sort(key=lambda x: x[1], reverse=True)
+    @staticmethod
+    def _fuse(matches: np.ndarray, scores: np.ndarray, position: np.ndarray,
+              lexical_ranks: Dict[int, int]) -> List[int]:
+        """Order the union of cosine ``matches`` and BM25 hits by reciprocal rank fusion.
 
-        return related_papers[:20]  # Return top 20 most similar papers
+        A column missing from one ranking scores on the other alone, so an
+        exact-term hit below the cosine threshold can still make the cut.
+        """
+        semantic = matches[np.lexsort((position[matches], -scores[matches]))]
+        fused = {int(column): 1 / (RRF_K + rank) for rank, column in enumerate(semantic, 1)}
+        for column, rank in lexical_ranks.items():
+            fused[column] = fused.get(column, 0.0) + 1 / (RRF_K + rank)
+        return sorted(fused, key=lambda column: (-fused[column], position[column]))
 
     def format_paper_info(self, paper: Dict, similarity_score: float) -> Dict:
         """Format paper information for display"""
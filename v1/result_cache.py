@@ -0,0 +1,90 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+
+class ResultCache:
+    """In-process LRU + TTL cache of finished search results.
+
+    ``get_or_compute`` also coalesces identical requests: while one caller
+    is computing a key, later callers for the same key wait for its result
+    instead of running the pipeline again. Failures are shared with the
+    waiting callers but never cached, and neither are results that
+    ``cacheable`` rejects (for example ones built from partial upstream data).
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 900):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # key -> (stored at, result), oldest first
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(abstract: str, **params) -> str:
+        """Hash of the case- and whitespace-normalized abstract plus parameters"""
+        normalized = re.sub(r'\s+', ' ', abstract).strip().lower()
+        return hashlib.sha256(json.dumps([normalized, params], sort_keys=True).encode()).hexdigest()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any],
+                       cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+            store = cacheable is None or cacheable(value)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            if store:
+                self._entries[key] = (time.monotonic(), value)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'entries': len(self._entries),
+                'in_flight': len(self._in_flight),
+                # Coalesced requests were served without recomputing, so they count as hits
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                'miss_rate': round(self.misses / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The app's modules import each other by plain name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_store import EmbeddingStore  # noqa: E402
+
+DIM = 8
+
+
+def paper(arxiv_id, title, abstract=''):
+    return {'arxiv_id': arxiv_id, 'title': title, 'abstract': abstract, 'authors': ['A. Author'],
+            'url': f'https://arxiv.org/abs/{arxiv_id}', 'published': '2024-01-01', 'source': 'arXiv'}
+
+
+def unit(*components):
+    """A DIM-dimensional vector with the given leading components"""
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[:len(components)] = components
+    return vector
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / 'store'), DIM)
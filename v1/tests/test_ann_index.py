@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+
+from ann_index import IVFIndex
+from conftest import DIM, paper
+
+
+def fill(store, n=40, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, DIM)).astype(np.float32)
+    store.add([paper(f'2101.{i:05d}v1', f'Paper {i}', f'study number {i}') for i in range(n)], vectors)
+    return vectors
+
+
+def exact_top(vectors, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:k].tolist()
+
+
+def test_ivf_probing_every_list_is_exact(store, tmp_path):
+    vectors = fill(store)
+    index = IVFIndex.build(store, str(tmp_path / 'ann'), nlist=4)
+    query = vectors[7] + 0.1
+    rows, scores = index.search(query, k=5, nprobe=index.nlist)
+    assert rows.tolist() == exact_top(vectors, query, 5)
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_ivf_searches_rows_added_after_the_build_and_skips_tombstones(store, tmp_path):
+    vectors = fill(store)
+    index = IVFIndex.build(store, str(tmp_path / 'ann'), nlist=4)
+    store.add([paper('2101.00007v2', 'Paper 7 revised')], [vectors[7]])
+    rows, _ = index.search(vectors[7], k=40, nprobe=index.nlist)
+    assert rows[0] == 40
+    assert 7 not in rows.tolist()
+    assert len(rows) == len(set(rows.tolist()))
+
+
+def test_ivf_rebuild_swaps_in_a_complete_new_version(store, tmp_path):
+    fill(store)
+    directory = str(tmp_path / 'ann')
+    IVFIndex.build(store, directory, nlist=4)
+    first = os.path.realpath(directory)
+    fill(store, n=45, seed=1)
+    IVFIndex.build(store, directory, nlist=4)
+    IVFIndex.build(store, directory, nlist=4)
+    assert os.path.islink(directory)
+    assert IVFIndex.load(directory, store).indexed_rows == 45
+    assert not os.path.exists(first)
+    versions = [name for name in os.listdir(tmp_path) if name.startswith('ann.')]
+    assert len(versions) == 2
+
+
+def test_ivf_replaces_an_index_directory_from_before_versioning(store, tmp_path):
+    fill(store)
+    directory = str(tmp_path / 'ann')
+    os.makedirs(directory)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        f.write('{}')
+    IVFIndex.build(store, directory, nlist=4)
+    assert os.path.islink(directory)
+    assert IVFIndex.exists(directory)
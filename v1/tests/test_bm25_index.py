@@ -0,0 +1,56 @@
+import os
+
+from bm25_index import BM25Index, tokenize
+from conftest import paper, unit
+
+
+def build(store, directory):
+    store.add([paper('2101.00001v1', 'Protein folding with transformers', 'We fold proteins.'),
+               paper('2101.00002v1', 'Speech recognition', 'Audio models for speech.'),
+               paper('2101.00003v1', 'ResNet-50 on ImageNet', 'Image classification baselines.')],
+              [unit(1), unit(0, 1), unit(0, 0, 1)])
+    return BM25Index.build(store, directory)
+
+
+def test_tokenize_keeps_compound_terms_and_their_parts():
+    tokens = tokenize('ResNet-50 beats the GPT-4 baseline')
+    assert {'resnet-50', 'resnet', '50', 'gpt-4', 'gpt', 'baseline'} <= set(tokens)
+    assert 'the' not in tokens
+
+
+def test_bm25_ranks_exact_terms_first(store, tmp_path):
+    index = build(store, str(tmp_path / 'bm25'))
+    rows, scores = index.search('resnet-50 image classification')
+    assert rows[0] == 2
+    assert list(scores) == sorted(scores, reverse=True)
+    assert len(index.search('quantum chromodynamics')[0]) == 0
+
+
+def test_bm25_index_survives_a_reload(store, tmp_path):
+    directory = str(tmp_path / 'bm25')
+    build(store, directory)
+    assert BM25Index.exists(directory)
+    rows, _ = BM25Index.load(directory, store).search('speech audio')
+    assert rows.tolist() == [1]
+
+
+def test_bm25_scores_rows_added_after_the_build_and_skips_tombstones(store, tmp_path):
+    index = build(store, str(tmp_path / 'bm25'))
+    store.add([paper('2101.00004v1', 'Protein design', 'Designing protein folding pathways.'),
+               paper('2101.00001v2', 'Protein folding with diffusion', 'We fold proteins again.')],
+              [unit(1, 1), unit(1, 0, 1)])
+    rows, _ = index.search('protein folding')
+    assert set(rows.tolist()) == {3, 4}
+
+
+def test_bm25_rebuild_swaps_in_a_complete_new_version(store, tmp_path):
+    directory = str(tmp_path / 'bm25')
+    build(store, directory)
+    first = os.path.realpath(directory)
+    store.add([paper('2101.00004v1', 'Speech synthesis', 'Audio generation.')], [unit(0, 1, 1)])
+    BM25Index.build(store, directory)
+    assert os.path.islink(directory)
+    assert os.path.realpath(directory) != first
+    assert BM25Index.load(directory, store).indexed_rows == 4
+    # The version being replaced stays for agents still loading it
+    assert BM25Index.exists(first)
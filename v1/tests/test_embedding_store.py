@@ -0,0 +1,35 @@
+import numpy as np
+
+from conftest import DIM, paper, unit
+from embedding_store import EmbeddingStore
+
+
+def test_add_skips_papers_already_stored(store):
+    rows = store.add([paper('2101.00001v1', 'A'), paper('2101.00002v1', 'B')], [unit(1), unit(0, 1)])
+    assert rows == {'2101.00001v1': 0, '2101.00002v1': 1}
+    again = store.add([paper('2101.00002v1', 'B'), paper('2101.00003v1', 'C')], [unit(0, 1), unit(0, 0, 1)])
+    assert again == {'2101.00002v1': 1, '2101.00003v1': 2}
+    assert len(store) == 3
+    assert store.get_papers([2])[0]['title'] == 'C'
+    np.testing.assert_allclose(store.get_vectors([1]), [unit(0, 1)])
+
+
+def test_newer_version_tombstones_older_ones(store):
+    store.add([paper('2101.00001v1', 'A v1'), paper('2101.00002v1', 'B')], [unit(1), unit(0, 1)])
+    store.add([paper('2101.00001v2', 'A v2')], [unit(1, 1)])
+    store.add([paper('2101.00001v3', 'A v3')], [unit(1, 0, 1)])
+    assert store.tombstones().tolist() == [0, 2]
+
+
+def test_adding_an_older_version_late_tombstones_it(store):
+    store.add([paper('2101.00001v2', 'A v2')], [unit(1)])
+    store.add([paper('2101.00001v1', 'A v1')], [unit(0, 1)])
+    assert store.tombstones().tolist() == [1]
+
+
+def test_read_only_readers_see_committed_rows(store):
+    reader = EmbeddingStore(store.directory, DIM, read_only=True)
+    assert len(reader) == 0
+    store.add([paper('2101.00001v1', 'A')], [unit(1)])
+    assert len(reader) == 1
+    assert reader.lookup(['2101.00001v1', 'unknown']) == {'2101.00001v1': 0}
@@ -0,0 +1,19 @@
+import numpy as np
+
+from research_agent import ResearchAgent
+
+
+def test_hybrid_fusion_keeps_bm25_hits_below_the_cosine_threshold():
+    # Columns 0-2 passed the cosine threshold; column 3 did not but is the top BM25 hit
+    scores = np.array([0.9, 0.8, 0.7, -np.inf])
+    position = np.arange(4)
+    order = ResearchAgent._fuse(np.array([0, 1, 2]), scores, position, {3: 1, 2: 2})
+    assert sorted(order) == [0, 1, 2, 3]
+    # Ranked second by BM25 and third by cosine, column 2 overtakes both single-list hits
+    assert order[0] == 2
+    assert order.index(3) < order.index(1)
+
+
+def test_hybrid_fusion_without_lexical_hits_is_the_cosine_order():
+    scores = np.array([0.4, 0.9, 0.6])
+    assert ResearchAgent._fuse(np.array([0, 1, 2]), scores, np.arange(3), {}) == [1, 2, 0]
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from result_cache import ResultCache
+
+
+def test_keys_ignore_case_and_spacing():
+    assert ResultCache.make_key(' Graph  Networks', k=5) == ResultCache.make_key('graph networks', k=5)
+    assert ResultCache.make_key('graph networks', k=5) != ResultCache.make_key('graph networks', k=6)
+
+
+def test_hits_until_the_ttl_expires():
+    cache = ResultCache(ttl=60)
+    assert cache.get_or_compute('k', lambda: 1) == 1
+    assert cache.get_or_compute('k', lambda: 2) == 1
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get_or_compute('k', lambda: 3) == 3
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    cache.get_or_compute('a', lambda: 'a')
+    cache.get_or_compute('b', lambda: 'b')
+    cache.get_or_compute('a', lambda: 'stale')
+    cache.get_or_compute('c', lambda: 'c')
+    assert cache.get_or_compute('a', lambda: 'recomputed') == 'a'
+    assert cache.get_or_compute('b', lambda: 'recomputed') == 'recomputed'
+
+
+def test_concurrent_identical_requests_compute_once():
+    cache = ResultCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while cache.coalesced < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ['result'] * 5
+    assert len(calls) == 1
+
+
+def test_failures_reach_waiters_but_are_not_cached():
+    cache = ResultCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('upstream down')
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_compute('k', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    owner = threading.Thread(target=call)
+    owner.start()
+    started.wait(5)
+    waiter = threading.Thread(target=call)
+    waiter.start()
+    while cache.coalesced < 1:
+        time.sleep(0.01)
+    release.set()
+    owner.join()
+    waiter.join()
+    assert errors == ['upstream down'] * 2
+    assert cache.get_or_compute('k', lambda: 'ok') == 'ok'
+
+
+def test_rejected_results_are_returned_but_not_cached():
+    cache = ResultCache()
+    complete = lambda result: not result.endswith('partial')
+    assert cache.get_or_compute('k', lambda: 'partial', cacheable=complete) == 'partial'
+    assert cache.get_or_compute('k', lambda: 'full', cacheable=complete) == 'full'
+    assert cache.get_or_compute('k', lambda: 'partial', cacheable=complete) == 'full'
+    assert (cache.hits, cache.misses) == (1, 2)
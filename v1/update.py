@@ -0,0 +1,112 @@
+import argparse
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from ann_index import IVFIndex
+from bm25_index import BM25Index
+from embedding_store import EmbeddingStore
+from encoders import BACKENDS
+from ingest import ingest
+from research_agent import ANN_INDEX_DIR, BM25_INDEX_DIR, EMBEDDING_STORE_DIR, ENCODER_BACKEND, ENCODER_THREADS
+
+# Suggest compaction once unindexed rows or tombstones pass this share of the store
+COMPACT_THRESHOLD = 0.05
+
+
+def index_status(store: EmbeddingStore, ann_dir: str = ANN_INDEX_DIR,
+                 bm25_dir: str = BM25_INDEX_DIR) -> Dict:
+    """How far the local indexes lag the store: rows added since each build, and tombstones"""
+    total = len(store)
+    status = {'store_size': total, 'tombstones': len(store.tombstones())}
+    if IVFIndex.exists(ann_dir):
+        status['ann_unindexed'] = total - IVFIndex.load(ann_dir, store).indexed_rows
+    if BM25Index.exists(bm25_dir):
+        status['bm25_unindexed'] = total - BM25Index.load(bm25_dir, store).indexed_rows
+    return status
+
+
+def needs_compaction(status: Dict, threshold: float = COMPACT_THRESHOLD) -> bool:
+    limit = threshold * max(status['store_size'], 1)
+    return any(status.get(key, 0) > limit for key in ('tombstones', 'ann_unindexed', 'bm25_unindexed'))
+
+
+def compact(store: EmbeddingStore, ann_dir: str = ANN_INDEX_DIR, bm25_dir: str = BM25_INDEX_DIR) -> None:
+    """Rebuild the existing local indexes so they cover every live row and skip tombstones.
+
+    Store rows are never rewritten, so tombstoned vectors stay on disk; only
+    the indexes drop them. Each build is written to a new version directory
+    and published with a single symlink swap, and running agents switch to
+    the new indexes on their next reload check.
+    """
+    for name, cls, directory in (('ANN', IVFIndex, ann_dir), ('BM25', BM25Index, bm25_dir)):
+        if not cls.exists(directory):
+            continue
+        started = time.perf_counter()
+        cls.build(store, directory)
+        print(f"Rebuilt {name} index in {time.perf_counter() - started:.1f}s -> {directory}")
+
+
+def update(delta: str, store_dir: str = EMBEDDING_STORE_DIR, ann_dir: str = ANN_INDEX_DIR,
+           bm25_dir: str = BM25_INDEX_DIR, dim: int = 384, compact_indexes: bool = False,
+           categories: Optional[Tuple[str, ...]] = None, backend: str = ENCODER_BACKEND,
+           threads: Optional[int] = ENCODER_THREADS, batch_size: int = 256) -> Dict:
+    """Apply a delta of new or revised papers (snapshot-format JSONL) to the local corpus.
+
+    Only papers whose ``id + version`` is not stored yet are encoded; a new
+    version tombstones the older ones. The indexes pick up new rows
+    straight away through their brute-force tail and skip tombstones, so
+    searches keep working throughout; ``compact_indexes`` folds both into
+    rebuilt indexes.
+    """
+    # Delta files are small and often reuse a name, so always read them from the start;
+    # papers stored by an interrupted run are skipped without re-encoding
+    summary = ingest(delta, store_dir=store_dir, batch_size=batch_size, categories=categories,
+                     restart=True, backend=backend, threads=threads)
+    store = EmbeddingStore(store_dir, dim, read_only=True)
+    if compact_indexes:
+        compact(store, ann_dir, bm25_dir)
+    status = index_status(store, ann_dir, bm25_dir)
+    summary.update(status, compaction_suggested=not compact_indexes and needs_compaction(status))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply a delta of new or revised arXiv papers to the local corpus')
+    parser.add_argument('delta', nargs='?', default=None,
+                        help='delta in arXiv snapshot format (JSONL, optionally .gz); omit with --compact')
+    parser.add_argument('--store', default=EMBEDDING_STORE_DIR, help='embedding store directory')
+    parser.add_argument('--ann-index', default=ANN_INDEX_DIR, help='ANN index directory')
+    parser.add_argument('--bm25-index', default=BM25_INDEX_DIR, help='BM25 index directory')
+    parser.add_argument('--dim', type=int, default=384, help='embedding dimension')
+    parser.add_argument('--batch-size', type=int, default=256, help='encoder batch size')
+    parser.add_argument('--backend', default=ENCODER_BACKEND, choices=BACKENDS, help='encoder backend')
+    parser.add_argument('--threads', type=int, default=ENCODER_THREADS, help='encoder threads')
+    parser.add_argument('--categories', default=None,
+                        help='comma-separated category prefixes to keep, e.g. cs.CL,cs.LG,stat.ML')
+    parser.add_argument('--compact', action='store_true', help='rebuild the indexes after applying the delta')
+    args = parser.parse_args()
+
+    if args.delta is None:
+        if not args.compact:
+            parser.error('give a delta file, --compact, or both')
+        if not os.path.exists(args.store):
+            parser.error(f'no embedding store at {args.store}')
+        store = EmbeddingStore(args.store, args.dim, read_only=True)
+        compact(store, args.ann_index, args.bm25_index)
+        print(index_status(store, args.ann_index, args.bm25_index))
+        return
+
+    categories = tuple(c.strip() for c in args.categories.split(',')) if args.categories else None
+    summary = update(args.delta, store_dir=args.store, ann_dir=args.ann_index, bm25_dir=args.bm25_index,
+                     dim=args.dim, compact_indexes=args.compact, categories=categories,
+                     backend=args.backend, threads=args.threads, batch_size=args.batch_size)
+    print(f"Added {summary['ingested']} papers, tombstoned {summary['superseded']} older versions "
+          f"({summary['tombstones']} tombstones in a store of {summary['store_size']})")
+    if summary['compaction_suggested']:
+        print("Indexes lag the store by more than "
+              f"{COMPACT_THRESHOLD:.0%}; run `python update.py --compact` when convenient")
+
+
+if __name__ == '__main__':
+    main()
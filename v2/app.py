@@ -1,88 +1,157 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
-import requests
 import json
 import time
 
+from related_work import (
+    DEFAULT_COMPARE_BATCH_SIZE,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_TWO_PHASE,
+    MAX_COMPARE_BATCH_SIZE,
+    MAX_WORKERS_LIMIT,
+    SCORE_CACHE_PATH,
+    LLMOutputError,
+    search_cache,
+    build_result,
+    generate_queries,
+    iter_search_and_compare,
+    search_and_compare,
+)
+from http_client import upstream_stats
+from jobs import JOB_STORE_PATH, JobRunner, JobStore, job_view
+from metrics import cache_samples, collect_timings, registry
+from scheduler import PRIORITIES
+from score_cache import ScoreCache
+import prefilter
+
 app = Flask(__name__)
 CORS(app)
 
-# LLM Prompt templates
-GEN_QUERIES_SYSTEM = "You generate search queries for literature review."
-
-GEN_QUERIES_USER_TEMPLATE = """Input abstract/idea:
-\"\"\"
-{ABSTRACT}
-\"\"\"
-
-Task: Propose 10 concise, diverse search queries (max 8–12 words each) that best describe potential related work in different aspects (methods, tasks, data, theory, applications).
-
-Respond with ONLY a valid JSON array of strings, no other text or formatting. Example format:
-["query 1", "query 2", "query 3"]"""
-
-COMPARE_SYSTEM = """You are scoring relatedness between a source abstract and a candidate paper.
-Give a score 0–100 (higher = more similar) and a brief reason."""
-
-COMPARE_USER_TEMPLATE = """SOURCE ABSTRACT:
-\"\"\"
-{ABSTRACT}
-\"\"\"
-
-CANDIDATE PAPER:
-Title: {TITLE}
-Authors: {AUTHORS}
-Venue/Year: {VENUE} / {YEAR}
-Abstract:
-\"\"\"
-{PAPER_ABSTRACT}
-\"\"\"
-
-Task: Return ONLY valid JSON with no other text or formatting. Required format:
-{{
-  "score": <0-100 integer>,
-  "note": "<one-sentence reason why it is relevant or irrelevant>"
-}}"""
-
-def openai_chat_complete(api_key, system_prompt, user_prompt):
-    """Make a call to OpenAI Chat Completions API"""
-    headers = {
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
-
-    data = {
-        'model': 'gpt-5',
-        'messages': [
-            {'role': 'system', 'content': system_prompt},
-            {'role': 'user', 'content': user_prompt}
-        ]
-    }
-
-    response = requests.post('https://api.openai.com/v1/chat/completions',
-                           headers=headers, json=data)
-
-    if response.status_code != 200:
-        raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
-
-    return response.json()['choices'][0]['message']['content']
-
-def semantic_scholar_search(query, limit=50):
-    """Search Semantic Scholar for papers"""
-    url = "https://api.semanticscholar.org/graph/v1/paper/search"
-    params = {
-        'query': query,
-        'limit': limit,
-        'fields': 'paperId,title,authors,year,venue,url,abstract'
-    }
-
-    response = requests.get(url, params=params)
-
-    if response.status_code != 200:
-        print(f"Semantic Scholar API error for query '{query}': {response.status_code}")
-        return []
-
-    data = response.json()
-    return data.get('data', [])
+# Comparison scores persist across requests and restarts
+score_cache = ScoreCache(SCORE_CACHE_PATH) if SCORE_CACHE_PATH else None
+
+# Background jobs for long runs, checkpointed so they survive restarts
+job_runner = JobRunner(JobStore(JOB_STORE_PATH), score_cache=score_cache) if JOB_STORE_PATH else None
+
+registry.stage_histogram('related_work_stage_seconds', 'Time spent in each pipeline stage')
+REQUEST_SECONDS = registry.histogram('related_work_request_seconds', 'End-to-end request latency')
+
+# Upstream client counters exported on /metrics: (counter key, metric suffix, help)
+UPSTREAM_METRICS = [
+    ('requests', 'requests_total', 'HTTP requests sent upstream, including retries'),
+    ('retries', 'retries_total', 'Upstream requests retried after a 429, 5xx or connection error'),
+    ('throttled', 'throttled_total', 'Upstream responses with status 429'),
+    ('server_errors', 'server_errors_total', 'Upstream responses with a 5xx status'),
+    ('connection_errors', 'connection_errors_total', 'Upstream requests that failed to connect or timed out'),
+    ('rate_limit_wait_seconds', 'rate_limit_wait_seconds_total', 'Time spent waiting on the local rate limiter'),
+    ('bytes_received', 'received_bytes_total', 'Response body bytes received from upstream'),
+]
+
+def collect_metrics():
+    samples = []
+    for upstream, counters in upstream_stats().items():
+        for key, suffix, help in UPSTREAM_METRICS:
+            samples.append((f'related_work_upstream_{suffix}', 'counter', help,
+                            {'upstream': upstream}, counters[key]))
+    samples += cache_samples('related_work', 'search',
+                             search_cache.stats() if search_cache is not None else None)
+    samples += cache_samples('related_work', 'score',
+                             score_cache.stats() if score_cache is not None else None)
+    return samples
+
+registry.add_collector(collect_metrics)
+
+SCHEDULE_FIELDS = ('priority', 'max_llm_calls', 'max_tokens', 'deadline_seconds', 'target_results')
+
+def parse_request(data):
+    """Validate a /related-work request body.
+
+    Returns (options, None) on success or (None, error message).
+    """
+    if not data:
+        return None, 'No JSON data provided'
+
+    abstract = data.get('abstract', '').strip()
+    openai_api_key = data.get('openai_api_key', '').strip()
+    max_workers = data.get('max_workers', DEFAULT_MAX_WORKERS)
+    compare_batch_size = data.get('compare_batch_size', DEFAULT_COMPARE_BATCH_SIZE)
+    include_timings = data.get('timings', False)
+    two_phase = data.get('two_phase', DEFAULT_TWO_PHASE)
+
+    if not abstract:
+        return None, 'Abstract is required'
+
+    if not openai_api_key:
+        return None, 'OpenAI API key is required'
+
+    if not isinstance(max_workers, int) or isinstance(max_workers, bool) \
+            or not 1 <= max_workers <= MAX_WORKERS_LIMIT:
+        return None, f'max_workers must be an integer between 1 and {MAX_WORKERS_LIMIT}'
+
+    if not isinstance(compare_batch_size, int) or isinstance(compare_batch_size, bool) \
+            or not 1 <= compare_batch_size <= MAX_COMPARE_BATCH_SIZE:
+        return None, f'compare_batch_size must be an integer between 1 and {MAX_COMPARE_BATCH_SIZE}'
+
+    if not isinstance(include_timings, bool):
+        return None, 'timings must be a boolean'
+
+    if not isinstance(two_phase, bool):
+        return None, 'two_phase must be a boolean'
+
+    # Optional embedding cascade in front of LLM scoring
+    min_similarity = data.get('prefilter_min_similarity')
+    top_n = data.get('prefilter_top_n')
+    prefilter_options = None
+    if min_similarity is not None or top_n is not None:
+        if min_similarity is not None and (not isinstance(min_similarity, (int, float))
+                                           or isinstance(min_similarity, bool)
+                                           or not -1 <= min_similarity <= 1):
+            return None, 'prefilter_min_similarity must be a number between -1 and 1'
+        if top_n is not None and (not isinstance(top_n, int) or isinstance(top_n, bool) or top_n < 1):
+            return None, 'prefilter_top_n must be a positive integer'
+        if not prefilter.is_available():
+            return None, 'Embedding prefilter requires sentence-transformers to be installed'
+        prefilter_options = {'min_similarity': min_similarity, 'top_n': top_n}
+
+    # Optional scheduler: priority order, budgets and early stop for the compare stage
+    schedule = {field: data.get(field) for field in SCHEDULE_FIELDS if data.get(field) is not None}
+    for field in ('max_llm_calls', 'max_tokens', 'target_results'):
+        value = schedule.get(field)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+            return None, f'{field} must be a positive integer'
+    deadline = schedule.get('deadline_seconds')
+    if deadline is not None and (not isinstance(deadline, (int, float)) or isinstance(deadline, bool)
+                                 or deadline <= 0):
+        return None, 'deadline_seconds must be a positive number'
+    if schedule.get('priority') is not None and schedule['priority'] not in PRIORITIES:
+        return None, f"priority must be one of {', '.join(PRIORITIES)}"
+
+    return {
+        'abstract': abstract,
+        'openai_api_key': openai_api_key,
+        'max_workers': max_workers,
+        'compare_batch_size': compare_batch_size,
+        'prefilter': prefilter_options,
+        'schedule': schedule or None,
+        'two_phase': two_phase,
+        'timings': include_timings,
+    }, None
+
+def query_generation_error(e):
+    if isinstance(e, LLMOutputError):
+        return f'LLM output parsing error for query generation. Response was: {e.response[:200]}...'
+    return f'Error generating queries: {str(e)}'
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    # The stream records its own latency once the last event is sent
+    if request.endpoint and request.endpoint not in ('metrics', 'stream_related_work'):
+        REQUEST_SECONDS.observe(time.perf_counter() - g.started, endpoint=request.endpoint)
+    return response
 
 @app.route('/')
 def index():
@@ -91,134 +160,157 @@ def index():
 @app.route('/related-work', methods=['POST'])
 def find_related_work():
     try:
-        data = request.get_json()
-
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
-
-        abstract = data.get('abstract', '').strip()
-        openai_api_key = data.get('openai_api_key', '').strip()
+        options, error = parse_request(request.get_json())
+        if error:
+            return jsonify({'error': error}), 400
 
-        if not abstract:
-            return jsonify({'error': 'Abstract is required'}), 400
+        abstract = options['abstract']
+        openai_api_key = options['openai_api_key']
+        # A deadline counts from here, so it covers query generation too
+        started = time.monotonic()
 
-        if not openai_api_key:
-            return jsonify({'error': 'OpenAI API key is required'}), 400
-
-        # Step 1: Generate search queries
-        try:
-            queries_response = openai_chat_complete(
-                api_key=openai_api_key,
-                system_prompt=GEN_QUERIES_SYSTEM,
-                user_prompt=GEN_QUERIES_USER_TEMPLATE.format(ABSTRACT=abstract)
+        with collect_timings() as timings:
+            # Step 1: Generate search queries
+            try:
+                queries = generate_queries(openai_api_key, abstract)
+            except Exception as e:
+                return jsonify({'error': query_generation_error(e)}), 500
+
+            # Step 2: Search all queries and score the candidates concurrently
+            final_results, stats = search_and_compare(
+                openai_api_key, abstract, queries,
+                max_workers=options['max_workers'], score_cache=score_cache,
+                prefilter=options['prefilter'], compare_batch_size=options['compare_batch_size'],
+                schedule=options['schedule'], started=started, two_phase=options['two_phase']
             )
 
-            # Try to extract JSON from the response if it contains extra text
-            queries_response = queries_response.strip()
-            if queries_response.startswith('```json'):
-                queries_response = queries_response.replace('```json', '').replace('```', '').strip()
-            elif queries_response.startswith('```'):
-                queries_response = queries_response.replace('```', '').strip()
-
-            queries = json.loads(queries_response)
+        response = {
+            'input_abstract': abstract,
+            'generated_queries': queries,
+            'results': final_results,
+            'stats': stats
+        }
+        if options['timings']:
+            response['timings'] = timings.as_dict()
+        return jsonify(response)
 
-            if not isinstance(queries, list):
-                raise ValueError("Expected JSON array of queries")
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
 
-            # Ensure we have reasonable queries
-            queries = [q for q in queries if isinstance(q, str) and len(q.strip()) > 0][:10]
+@app.route('/related-work/stream', methods=['POST'])
+def stream_related_work():
+    """Same pipeline as /related-work, streamed as newline-delimited JSON.
 
-            if len(queries) == 0:
-                raise ValueError("No valid queries generated")
+    Emits the generated queries first, then an event per finished search,
+    progress as comparisons return, and each result as soon as it clears
+    the score threshold.
+    """
+    options, error = parse_request(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
 
-        except (json.JSONDecodeError, ValueError) as e:
-            return jsonify({'error': f'LLM output parsing error for query generation. Response was: {queries_response[:200]}...'}), 500
-        except Exception as e:
-            return jsonify({'error': f'Error generating queries: {str(e)}'}), 500
+    abstract = options['abstract']
+    openai_api_key = options['openai_api_key']
+    started = time.monotonic()
 
-        final_results = []
+    def line(event):
+        return json.dumps(event) + '\n'
 
-        # Step 2: For each query, search papers and compare
-        for query in queries:
+    def generate():
+        with collect_timings() as timings:
             try:
-                papers = semantic_scholar_search(query, limit=50)
-
-                for paper in papers:
-                    if not paper.get('abstract'):
-                        continue
-
-                    # Prepare paper data for comparison
-                    authors = [author.get('name', 'Unknown') for author in paper.get('authors', [])]
-                    authors_str = ', '.join(authors)
-                    venue = paper.get('venue', 'Unknown venue')
-                    year = paper.get('year', 'Unknown year')
-
-                    try:
-                        compare_prompt = COMPARE_USER_TEMPLATE.format(
-                            ABSTRACT=abstract,
-                            TITLE=paper.get('title', ''),
-                            AUTHORS=authors_str,
-                            VENUE=venue,
-                            YEAR=year,
-                            PAPER_ABSTRACT=paper.get('abstract', '')
-                        )
-
-                        compare_response = openai_chat_complete(
-                            api_key=openai_api_key,
-                            system_prompt=COMPARE_SYSTEM,
-                            user_prompt=compare_prompt
-                        )
-
-                        # Clean up the response for JSON parsing
-                        compare_response = compare_response.strip()
-                        if compare_response.startswith('```json'):
-                            compare_response = compare_response.replace('```json', '').replace('```', '').strip()
-                        elif compare_response.startswith('```'):
-                            compare_response = compare_response.replace('```', '').strip()
-
-                        comparison = json.loads(compare_response)
-                        score = comparison.get('score', 0)
-                        note = comparison.get('note', '')
-
-                        # Validate score is a number
-                        if not isinstance(score, (int, float)):
-                            score = 0
-
-                        if score > 70:
-                            final_results.append({
-                                'query': query,
-                                'paper': {
-                                    'paperId': paper.get('paperId', ''),
-                                    'title': paper.get('title', ''),
-                                    'authors': authors,
-                                    'year': year,
-                                    'venue': venue,
-                                    'url': paper.get('url', ''),
-                                    'abstract': paper.get('abstract', '')
-                                },
-                                'similarity_score': score,
-                                'note': note
-                            })
-
-                    except (json.JSONDecodeError, ValueError):
-                        print(f"LLM parsing error for paper comparison: {paper.get('title', 'Unknown')}")
-                        continue
-                    except Exception as e:
-                        print(f"Error comparing paper {paper.get('title', 'Unknown')}: {str(e)}")
-                        continue
+                try:
+                    queries = generate_queries(openai_api_key, abstract)
+                except Exception as e:
+                    yield line({'type': 'error', 'error': query_generation_error(e)})
+                    return
+
+                yield line({'type': 'queries', 'queries': queries})
+
+                total_results = 0
+                for kind, payload in iter_search_and_compare(
+                        openai_api_key, abstract, queries,
+                        max_workers=options['max_workers'], score_cache=score_cache,
+                        prefilter=options['prefilter'],
+                        compare_batch_size=options['compare_batch_size'],
+                        schedule=options['schedule'], started=started,
+                        two_phase=options['two_phase']):
+                    if kind == 'result':
+                        total_results += 1
+                        yield line({'type': 'result', 'result': build_result(payload, queries)})
+                    elif kind == 'done':
+                        event = {'type': 'done', 'total_results': total_results, 'stats': payload}
+                        if options['timings']:
+                            event['timings'] = timings.as_dict()
+                        yield line(event)
+                    else:
+                        yield line({'type': kind, **payload})
 
             except Exception as e:
-                print(f"Error processing query '{query}': {str(e)}")
-                continue
-
-        return jsonify({
-            'input_abstract': abstract,
-            'generated_queries': queries,
-            'results': final_results
-        })
-
-    except Exception as e:
-        return jsonify({'error': f'Server error: {str(e)}'}), 500
+                yield line({'type': 'error', 'error': f'Server error: {str(e)}'})
+            finally:
+                REQUEST_SECONDS.observe(time.perf_counter() - timings.started, endpoint='stream_related_work')
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Start /related-work as a background job and return its id at once"""
+    if job_runner is None:
+        return jsonify({'error': 'Job mode is disabled'}), 503
+
+    options, error = parse_request(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+
+    openai_api_key = options.pop('openai_api_key')
+    job_id = job_runner.submit(options, openai_api_key)
+    if job_id is None:
+        return jsonify({'error': 'Job queue is full, try again later'}), 503
+    return jsonify({'job_id': job_id, 'status': 'queued', 'url': f'/jobs/{job_id}'}), 202
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Progress and the results found so far"""
+    if job_runner is None:
+        return jsonify({'error': 'Job mode is disabled'}), 503
+
+    job = job_runner.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_view(job))
+
+@app.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """Continue an interrupted or failed job from its last checkpoint"""
+    if job_runner is None:
+        return jsonify({'error': 'Job mode is disabled'}), 503
+
+    data = request.get_json(silent=True) or {}
+    openai_api_key = data.get('openai_api_key', '').strip()
+    if not openai_api_key:
+        return jsonify({'error': 'OpenAI API key is required'}), 400
+
+    error = job_runner.resume(job_id, openai_api_key)
+    if error == 'Job not found':
+        return jsonify({'error': error}), 404
+    if error:
+        return jsonify({'error': error}), 409
+    return jsonify({'job_id': job_id, 'status': 'queued', 'url': f'/jobs/{job_id}'}), 202
+
+@app.route('/upstream-stats')
+def get_upstream_stats():
+    """Request, retry and throttling counters for each upstream API"""
+    stats = upstream_stats()
+    if search_cache is not None:
+        stats['search_cache'] = search_cache.stats()
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics():
+    """Stage latency histograms, upstream and token counters and cache hit rates in Prometheus format"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,187 @@
+import email.utils
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import count
+
+# Responses worth retrying; anything else is returned to the caller as-is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available.
+
+        Returns the number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+    def defer(self, seconds):
+        """Hold back every caller for ``seconds``, e.g. after a 429"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class UpstreamClient:
+    """Pooled, rate-limited and retrying HTTP client for one upstream API.
+
+    One instance is shared by every request thread so connections are kept
+    alive across calls and the rate budget is enforced process-wide.
+    """
+
+    def __init__(self, name, rate, burst, timeout, max_retries=4,
+                 backoff_base=0.5, backoff_max=30.0, pool_size=32):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self.counters = {
+            'requests': 0,
+            'retries': 0,
+            'throttled': 0,
+            'server_errors': 0,
+            'connection_errors': 0,
+            'rate_limit_waits': 0,
+            'rate_limit_wait_seconds': 0.0,
+            'bytes_received': 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        """Send a request, retrying 429/5xx and connection failures.
+
+        Returns the last response once it succeeds or retries run out;
+        connection errors on the final attempt are raised.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            waited = self.bucket.acquire()
+            if waited:
+                self._count('rate_limit_waits')
+                self._count('rate_limit_wait_seconds', waited)
+
+            self._count('requests')
+            count(f'{self.name}_requests')
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._count('connection_errors')
+                if attempt == self.max_retries:
+                    raise
+                self._count('retries')
+                time.sleep(self._backoff(attempt))
+                continue
+
+            self._count('bytes_received', len(response.content))
+            count(f'{self.name}_bytes', len(response.content))
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                if response.status_code == 429:
+                    self._count('throttled')
+                elif response.status_code >= 500:
+                    self._count('server_errors')
+                return response
+
+            if response.status_code == 429:
+                self._count('throttled')
+            else:
+                self._count('server_errors')
+            self._count('retries')
+
+            delay = self._backoff(attempt)
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                # Honour the server's wait, capped so one call cannot stall for minutes
+                delay = max(delay, min(retry_after, self.backoff_max * 4))
+            if response.status_code == 429:
+                self.bucket.defer(delay)
+            response.close()
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+# Separate budgets per upstream; rates are requests per second
+semantic_scholar_client = UpstreamClient(
+    'semantic_scholar',
+    rate=float(os.environ.get('SEMANTIC_SCHOLAR_RATE', '5')),
+    burst=int(os.environ.get('SEMANTIC_SCHOLAR_BURST', '10')),
+    timeout=(5, 30),
+)
+openai_client = UpstreamClient(
+    'openai',
+    rate=float(os.environ.get('OPENAI_RATE', '20')),
+    burst=int(os.environ.get('OPENAI_BURST', '40')),
+    timeout=(10, 300),
+)
+
+
+def upstream_stats():
+    return {client.name: client.stats() for client in (semantic_scholar_client, openai_client)}
@@ -0,0 +1,382 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import collect_timings
+from related_work import build_result, generate_queries, iter_search_and_compare
+
+# SQLite file holding job state and checkpoints; set to an empty string to disable job mode
+JOB_STORE_PATH = os.environ.get(
+    'RELATED_WORK_JOB_STORE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs.sqlite3')
+)
+
+# Jobs run at once; each still uses up to its own max_workers compare threads
+JOB_WORKERS = int(os.environ.get('RELATED_WORK_JOB_WORKERS', '2'))
+
+# Jobs queued or running before new submissions are refused
+JOB_QUEUE_LIMIT = int(os.environ.get('RELATED_WORK_JOB_QUEUE_LIMIT', '16'))
+
+# Besides after every query, progress is checkpointed at most this often (seconds)
+CHECKPOINT_INTERVAL = 5.0
+
+# A queued or running job whose owner has not renewed its lease for this
+# long (seconds) is treated as abandoned and may be marked interrupted
+JOB_LEASE_SECONDS = float(os.environ.get('RELATED_WORK_JOB_LEASE', '60'))
+
+
+class LeaseLost(Exception):
+    """Raised when another runner has taken over a job this runner was working on"""
+
+
+class JobStore:
+    """SQLite store of related-work jobs and their checkpoints.
+
+    A job row holds the validated request options (never the API key),
+    the generated queries, progress and the results found so far. Every
+    comparison score is kept in ``job_scores`` so a resumed job only pays
+    for candidates it has not scored yet.
+
+    Queued and running jobs are leased: ``owner`` names the runner working
+    on the job and ``heartbeat`` is when it last renewed the lease. Writes
+    made on behalf of an owner only land while it still holds the job, so
+    several processes can share one store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                options TEXT NOT NULL,
+                queries TEXT,
+                progress TEXT NOT NULL,
+                results TEXT NOT NULL,
+                stats TEXT,
+                timings TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                owner TEXT,
+                heartbeat REAL
+            )
+        """)
+        # Stores created before leases were added
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        for column, kind in (('owner', 'TEXT'), ('heartbeat', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_scores (
+                job_id TEXT NOT NULL,
+                paper_id TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                score REAL NOT NULL,
+                note TEXT NOT NULL,
+                PRIMARY KEY (job_id, paper_id, prompt_version)
+            )
+        """)
+        self._conn.commit()
+
+    def create(self, options, owner):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, status, options, progress, results, created_at, updated_at, owner, '
+                'heartbeat) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, 'queued', json.dumps(options), json.dumps({}), json.dumps([]), now, now, owner, now)
+            )
+            self._conn.commit()
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, status, options, queries, progress, results, stats, timings, error, attempts, '
+                'created_at, updated_at, owner, heartbeat FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(('id', 'status', 'options', 'queries', 'progress', 'results', 'stats', 'timings',
+                        'error', 'attempts', 'created_at', 'updated_at', 'owner', 'heartbeat'), row))
+        for field in ('options', 'queries', 'progress', 'results', 'stats', 'timings'):
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    def update(self, job_id, owner, scores=(), **fields):
+        """Write ``fields`` and any new ``scores`` in one transaction, renewing the lease.
+
+        Raises LeaseLost, writing nothing, if ``owner`` no longer holds the job.
+        """
+        for field in ('queries', 'progress', 'results', 'stats', 'timings'):
+            if field in fields:
+                fields[field] = json.dumps(fields[field])
+        fields['updated_at'] = fields['heartbeat'] = time.time()
+        assignments = ', '.join(f'{field} = ?' for field in fields)
+        with self._lock:
+            cursor = self._conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ? AND owner = ?',
+                                        (*fields.values(), job_id, owner))
+            if cursor.rowcount == 0:
+                self._conn.rollback()
+                raise LeaseLost(f'Job {job_id} is no longer held by {owner}')
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO job_scores VALUES (?, ?, ?, ?, ?)',
+                [(job_id, *score) for score in scores]
+            )
+            self._conn.commit()
+
+    def renew(self, job_ids, owner):
+        """Refresh the lease on every job in ``job_ids`` still held by ``owner``"""
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.executemany('UPDATE jobs SET heartbeat = ? WHERE id = ? AND owner = ?',
+                                   [(time.time(), job_id, owner) for job_id in job_ids])
+            self._conn.commit()
+
+    def claim(self, job_id, owner, lease=JOB_LEASE_SECONDS):
+        """Requeue a resumable job under ``owner``; returns whether it was claimed.
+
+        Interrupted and failed jobs can be claimed, as can queued or running
+        jobs whose lease expired. The check and the takeover are one
+        statement, so two runners cannot both claim a job.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', error = NULL, owner = ?, heartbeat = ?, updated_at = ? "
+                "WHERE id = ? AND (status IN ('interrupted', 'failed') "
+                "OR (status IN ('queued', 'running') AND COALESCE(heartbeat, 0) < ?))",
+                (owner, now, now, job_id, now - lease)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def scores(self, job_id):
+        """Checkpointed scores as {(paper_id, prompt_version): (score, note)}"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT paper_id, prompt_version, score, note FROM job_scores WHERE job_id = ?', (job_id,)
+            ).fetchall()
+        return {(paper_id, prompt_version): ((int(score) if float(score).is_integer() else score), note)
+                for paper_id, prompt_version, score, note in rows}
+
+    def mark_interrupted(self, lease=JOB_LEASE_SECONDS):
+        """Flag queued or running jobs whose lease expired; returns how many"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'interrupted', owner = NULL, updated_at = ? "
+                "WHERE status IN ('queued', 'running') AND COALESCE(heartbeat, 0) < ?",
+                (now, now - lease)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+
+class JobScores:
+    """Score-cache adapter that records a job's scores for checkpointing.
+
+    Passed to iter_search_and_compare as its ``score_cache``. Lookups see
+    the job's checkpointed scores first, then the shared score cache;
+    new scores go to both, and are written to the job store at the next
+    checkpoint.
+    """
+
+    def __init__(self, checkpointed, score_cache=None):
+        self.score_cache = score_cache
+        self._scores = dict(checkpointed)
+        self._unsaved = []
+        self._lock = threading.Lock()
+
+    def get(self, abstract_hash, paper_id, prompt_version):
+        with self._lock:
+            scored = self._scores.get((paper_id, prompt_version))
+        if scored is None and self.score_cache is not None:
+            scored = self.score_cache.get(abstract_hash, paper_id, prompt_version)
+            if scored is not None:
+                self._record(paper_id, prompt_version, *scored)
+        return scored
+
+    def put(self, abstract_hash, paper_id, prompt_version, score, note):
+        self._record(paper_id, prompt_version, score, note)
+        if self.score_cache is not None:
+            self.score_cache.put(abstract_hash, paper_id, prompt_version, score, note)
+
+    def _record(self, paper_id, prompt_version, score, note):
+        with self._lock:
+            self._scores[(paper_id, prompt_version)] = (score, note)
+            self._unsaved.append((paper_id, prompt_version, score, note))
+
+    def take_unsaved(self):
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, []
+        return unsaved
+
+
+class JobRunner:
+    """Bounded pool running related-work jobs in the background.
+
+    API keys are held in memory only while a job is queued or running.
+    A background thread renews the lease on this runner's jobs every
+    third of ``lease`` seconds, and marks jobs whose owner stopped
+    renewing (a crashed or restarted process) ``interrupted``. A failed
+    job is marked ``failed``; either can be resumed with the key, which
+    reuses its queries and every checkpointed score.
+    """
+
+    def __init__(self, store, score_cache=None, workers=JOB_WORKERS, queue_limit=JOB_QUEUE_LIMIT,
+                 lease=JOB_LEASE_SECONDS):
+        self.store = store
+        self.score_cache = score_cache
+        self.queue_limit = queue_limit
+        self.lease = lease
+        # Unique per runner, so two runners in one process do not share leases
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='related-work-job')
+        self._active = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        interrupted = store.mark_interrupted(lease)
+        if interrupted:
+            print(f"{interrupted} unfinished job(s) from a previous run marked interrupted")
+        threading.Thread(target=self._keep_leases, name='related-work-job-lease', daemon=True).start()
+
+    def _keep_leases(self):
+        while not self._stopped.wait(self.lease / 3):
+            try:
+                with self._lock:
+                    active = list(self._active)
+                self.store.renew(active, self.owner)
+                interrupted = self.store.mark_interrupted(self.lease)
+                if interrupted:
+                    print(f"{interrupted} job(s) with an expired lease marked interrupted")
+            except sqlite3.Error as e:
+                print(f"Error renewing job leases: {str(e)}")
+
+    def stop(self):
+        """Stop renewing leases; running jobs finish but queued ones are abandoned"""
+        self._stopped.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, options, api_key):
+        """Queue a new job; returns its id, or None if the queue is full"""
+        with self._lock:
+            if len(self._active) >= self.queue_limit:
+                return None
+            job_id = self.store.create(options, self.owner)
+            self._active.add(job_id)
+        self._pool.submit(self._run, job_id, api_key)
+        return job_id
+
+    def resume(self, job_id, api_key):
+        """Requeue an interrupted or failed job; returns an error message or None"""
+        with self._lock:
+            job = self.store.get(job_id)
+            if job is None:
+                return 'Job not found'
+            if job_id in self._active:
+                return f"Job is {job['status']}; only interrupted or failed jobs can be resumed"
+            if len(self._active) >= self.queue_limit:
+                return 'Job queue is full'
+            # Refused while another runner holds a fresh lease on the job
+            if not self.store.claim(job_id, self.owner, self.lease):
+                return f"Job is {job['status']}; only interrupted or failed jobs can be resumed"
+            self._active.add(job_id)
+        self._pool.submit(self._run, job_id, api_key)
+        return None
+
+    def _run(self, job_id, api_key):
+        try:
+            with collect_timings() as timings:
+                self._execute(job_id, api_key, timings)
+        except LeaseLost as e:
+            print(f"Job {job_id} stopped: {str(e)}")
+        except Exception as e:
+            print(f"Job {job_id} failed: {str(e)}")
+            try:
+                self.store.update(job_id, self.owner, status='failed', error=str(e))
+            except LeaseLost:
+                pass
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def _execute(self, job_id, api_key, timings):
+        job = self.store.get(job_id)
+        options = job['options']
+        abstract = options['abstract']
+        # A deadline applies to each attempt separately
+        started = time.monotonic()
+        attempts = job['attempts'] + 1
+        self.store.update(job_id, self.owner, status='running', attempts=attempts)
+
+        queries = job['queries']
+        if queries is None:
+            queries = generate_queries(api_key, abstract)
+            self.store.update(job_id, self.owner, queries=queries)
+
+        checkpointed = self.store.scores(job_id)
+        scores = JobScores(checkpointed, self.score_cache)
+        progress = {'queries': len(queries), 'searches_done': 0, 'scored': 0, 'total': 0,
+                    'resumed_scores': len(checkpointed)}
+        matches = []
+        last_checkpoint = time.monotonic()
+
+        def checkpoint(**fields):
+            matches.sort(key=lambda c: c['rank'])
+            self.store.update(job_id, self.owner, scores=scores.take_unsaved(), progress=progress,
+                              results=[build_result(c, queries) for c in matches], **fields)
+
+        for kind, payload in iter_search_and_compare(
+                api_key, abstract, queries,
+                max_workers=options['max_workers'], score_cache=scores,
+                prefilter=options['prefilter'], compare_batch_size=options['compare_batch_size'],
+                schedule=options.get('schedule'), started=started,
+                two_phase=options.get('two_phase', False)):
+            if kind == 'result':
+                matches.append(payload)
+            elif kind == 'search':
+                progress['searches_done'] += 1
+                checkpoint()
+                last_checkpoint = time.monotonic()
+            elif kind == 'progress':
+                progress.update(payload)
+                if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    checkpoint()
+                    last_checkpoint = time.monotonic()
+            elif kind == 'done':
+                progress['scored'] = progress['total'] = payload['cache_hits'] + payload['llm_comparisons']
+                checkpoint(status='done', stats=payload,
+                           timings=timings.as_dict() if options.get('timings') else None)
+
+
+def job_view(job):
+    """Public JSON shape of a job"""
+    view = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+        'attempts': job['attempts'],
+        'progress': job['progress'],
+        'input_abstract': job['options']['abstract'],
+        'generated_queries': job['queries'] or [],
+        'results': job['results'],
+    }
+    for field in ('stats', 'timings', 'error'):
+        if job[field] is not None:
+            view[field] = job[field]
+    return view
@@ -0,0 +1,62 @@
+import threading
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # optional dependency, only needed for the prefilter
+    np = None
+    SentenceTransformer = None
+
+# Same encoder as the v1 ResearchAgent
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def is_available():
+    return SentenceTransformer is not None
+
+
+def get_model():
+    """Load the sentence encoder on first use and share it across requests"""
+    global _model
+    if _model is None:
+        if not is_available():
+            raise RuntimeError('The embedding prefilter requires sentence-transformers '
+                               '(pip install sentence-transformers)')
+        with _model_lock:
+            if _model is None:
+                _model = SentenceTransformer(EMBEDDING_MODEL)
+    return _model
+
+
+def embedding_prefilter(abstract, candidate_abstracts, min_similarity=None, top_n=None):
+    """Cheap first stage of the scoring cascade.
+
+    Embeds the source abstract and every candidate in a single batch, then
+    drops candidates whose cosine similarity is below ``min_similarity`` and
+    keeps at most the ``top_n`` most similar of the rest.
+
+    Returns (kept indices in their original order, number below the floor,
+    number outside the top N).
+    """
+    if not candidate_abstracts:
+        return [], 0, 0
+
+    embeddings = get_model().encode([abstract] + list(candidate_abstracts),
+                                    batch_size=64, normalize_embeddings=True)
+    similarities = embeddings[1:] @ embeddings[0]
+
+    keep = np.arange(len(candidate_abstracts))
+    if min_similarity is not None:
+        keep = keep[similarities[keep] >= min_similarity]
+    below_floor = len(candidate_abstracts) - len(keep)
+
+    outside_top_n = 0
+    if top_n is not None and len(keep) > top_n:
+        best = np.argpartition(-similarities[keep], top_n - 1)[:top_n]
+        outside_top_n = len(keep) - top_n
+        keep = np.sort(keep[best])
+
+    return keep.tolist(), below_floor, outside_top_n
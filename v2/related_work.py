@@ -0,0 +1,834 @@
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from http_client import openai_client, semantic_scholar_client
+from metrics import count, registry, span
+from prefilter import embedding_prefilter
+from scheduler import DEFAULT_PRIORITY, Budget, priority_key
+from score_cache import abstract_key
+from search_cache import SearchCache
+
+# LLM Prompt templates
+GEN_QUERIES_SYSTEM = "You generate search queries for literature review."
+
+GEN_QUERIES_USER_TEMPLATE = """Input abstract/idea:
+\"\"\"
+{ABSTRACT}
+\"\"\"
+
+Task: Propose 10 concise, diverse search queries (max 8–12 words each) that best describe potential related work in different aspects (methods, tasks, data, theory, applications).
+
+Respond with ONLY a valid JSON array of strings, no other text or formatting. Example format:
+["query 1", "query 2", "query 3"]"""
+
+COMPARE_SYSTEM = """You are scoring relatedness between a source abstract and a candidate paper.
+Give a score 0–100 (higher = more similar) and a brief reason."""
+
+COMPARE_USER_TEMPLATE = """SOURCE ABSTRACT:
+\"\"\"
+{ABSTRACT}
+\"\"\"
+
+CANDIDATE PAPER:
+Title: {TITLE}
+Authors: {AUTHORS}
+Venue/Year: {VENUE} / {YEAR}
+Abstract:
+\"\"\"
+{PAPER_ABSTRACT}
+\"\"\"
+
+Task: Return ONLY valid JSON with no other text or formatting. Required format:
+{{
+  "score": <0-100 integer>,
+  "note": "<one-sentence reason why it is relevant or irrelevant>"
+}}"""
+
+COMPARE_BATCH_SYSTEM = """You are scoring relatedness between a source abstract and several candidate papers.
+Give each candidate a score 0–100 (higher = more similar) and a brief reason."""
+
+COMPARE_BATCH_USER_TEMPLATE = """SOURCE ABSTRACT:
+\"\"\"
+{ABSTRACT}
+\"\"\"
+
+CANDIDATE PAPERS:
+{CANDIDATES}
+
+Task: Score every candidate independently. Return ONLY a valid JSON array with no other text or formatting, one object per candidate, using the exact paperId given above. Required format:
+[
+  {{"paperId": "<paperId>", "score": <0-100 integer>, "note": "<one-sentence reason why it is relevant or irrelevant>"}}
+]"""
+
+COMPARE_BATCH_CANDIDATE_TEMPLATE = """paperId: {PAPER_ID}
+Title: {TITLE}
+Authors: {AUTHORS}
+Venue/Year: {VENUE} / {YEAR}
+Abstract:
+\"\"\"
+{PAPER_ABSTRACT}
+\"\"\"
+"""
+
+OPENAI_MODEL = 'gpt-5'
+
+# Upstream endpoints; overridable to point at local stand-ins (see benchmarks/)
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+SEMANTIC_SCHOLAR_API_URL = os.environ.get(
+    'SEMANTIC_SCHOLAR_API_URL', 'https://api.semanticscholar.org/graph/v1'
+).rstrip('/')
+
+# Identifies the compare prompt and model in the score cache; changes to
+# either invalidate previously cached scores
+COMPARE_PROMPT_VERSION = hashlib.sha256(
+    (OPENAI_MODEL + COMPARE_SYSTEM + COMPARE_USER_TEMPLATE).encode('utf-8')
+).hexdigest()[:16]
+COMPARE_BATCH_PROMPT_VERSION = hashlib.sha256(
+    (OPENAI_MODEL + COMPARE_BATCH_SYSTEM + COMPARE_BATCH_USER_TEMPLATE
+     + COMPARE_BATCH_CANDIDATE_TEMPLATE).encode('utf-8')
+).hexdigest()[:16]
+
+# Papers scoring above this are returned to the user
+SCORE_THRESHOLD = 70
+
+# Number of candidates fetched from Semantic Scholar per query
+PAPERS_PER_QUERY = 50
+
+# Fields requested for candidates, and the light first pass of two-phase retrieval
+PAPER_FIELDS = 'paperId,title,authors,year,venue,url,abstract'
+ID_FIELDS = 'paperId,title'
+
+# Two-phase retrieval: search for IDs and titles only, then fetch full records
+# for the candidates that survive dedup and filtering in batch lookups
+DEFAULT_TWO_PHASE = os.environ.get('RELATED_WORK_TWO_PHASE', '') == '1'
+# First-pass page size, at Semantic Scholar's maximum of 100: ID-only pages are
+# cheap, so the first pass looks deeper for papers several queries agree on.
+# Results past PAPERS_PER_QUERY are kept only when another query also found the paper
+ID_SEARCH_LIMIT = int(os.environ.get('RELATED_WORK_ID_SEARCH_LIMIT', '100'))
+# Semantic Scholar accepts at most 500 IDs per batch lookup
+LOOKUP_BATCH_SIZE = 500
+
+# Rough size of a compare call before it is sent, reserved against token
+# budgets: prompt characters per token, plus completion tokens (reasoning
+# included) per call and per candidate. Once calls return, the tokens they
+# actually used per candidate are reserved instead
+CHARS_PER_TOKEN = 4
+COMPLETION_TOKENS_PER_CALL = 300
+COMPLETION_TOKENS_PER_PAPER = 100
+
+# Maximum number of comparison calls in flight for a single request
+DEFAULT_MAX_WORKERS = int(os.environ.get('RELATED_WORK_MAX_WORKERS', '8'))
+MAX_WORKERS_LIMIT = 64
+
+# Candidates scored per compare call; 1 uses the single-paper prompt
+DEFAULT_COMPARE_BATCH_SIZE = int(os.environ.get('RELATED_WORK_COMPARE_BATCH_SIZE', '1'))
+MAX_COMPARE_BATCH_SIZE = 25
+
+# SQLite file for cached comparison scores; set to an empty string to disable
+SCORE_CACHE_PATH = os.environ.get(
+    'RELATED_WORK_SCORE_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'score_cache.sqlite3')
+)
+
+# SQLite file for cached Semantic Scholar responses; empty string disables it
+SEARCH_CACHE_PATH = os.environ.get(
+    'RELATED_WORK_SEARCH_CACHE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_cache.sqlite3')
+)
+SEARCH_CACHE_TTL = float(os.environ.get('RELATED_WORK_SEARCH_CACHE_TTL', str(24 * 3600)))
+SEARCH_CACHE_MAX_MB = float(os.environ.get('RELATED_WORK_SEARCH_CACHE_MAX_MB', '256'))
+
+# Serve searches from the cache only (including expired entries), never the network
+SEARCH_CACHE_ONLY = os.environ.get('RELATED_WORK_SEARCH_CACHE_ONLY', '') == '1'
+
+search_cache = SearchCache(
+    SEARCH_CACHE_PATH, ttl=SEARCH_CACHE_TTL, max_bytes=int(SEARCH_CACHE_MAX_MB * 1024 * 1024)
+) if SEARCH_CACHE_PATH else None
+
+
+class LLMOutputError(ValueError):
+    """Raised when an LLM response is not the JSON we asked for"""
+
+    def __init__(self, message, response):
+        super().__init__(message)
+        self.response = response
+
+
+class TokenMeter:
+    """Tokens reported by the LLM calls made under it (see metered)"""
+
+    def __init__(self):
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage):
+        tokens = (usage or {}).get('total_tokens')
+        if isinstance(tokens, int):
+            with self._lock:
+                self.total += tokens
+
+
+_token_meter = contextvars.ContextVar('token_meter', default=None)
+
+LLM_TOKENS = registry.counter('related_work_llm_tokens_total',
+                              'Tokens reported by the LLM API, by prompt or completion')
+
+
+def record_tokens(usage):
+    """Count the ``usage`` block of a chat completion response"""
+    for kind in ('prompt', 'completion'):
+        tokens = (usage or {}).get(f'{kind}_tokens')
+        if isinstance(tokens, int):
+            LLM_TOKENS.inc(tokens, kind=kind)
+            count(f'llm_{kind}_tokens', tokens)
+
+
+def metered(meter, fn, *args):
+    """Call ``fn`` with every OpenAI call it makes counted on ``meter``"""
+    token = _token_meter.set(meter)
+    try:
+        return fn(*args)
+    finally:
+        _token_meter.reset(token)
+
+
+def openai_chat_complete(api_key, system_prompt, user_prompt):
+    """Make a call to OpenAI Chat Completions API"""
+    headers = {
+        'Authorization': f'Bearer {api_key}',
+        'Content-Type': 'application/json'
+    }
+
+    data = {
+        'model': OPENAI_MODEL,
+        'messages': [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': user_prompt}
+        ]
+    }
+
+    with span('openai_request'):
+        response = openai_client.post(f'{OPENAI_BASE_URL}/chat/completions',
+                                      headers=headers, json=data)
+
+    if response.status_code != 200:
+        raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
+
+    body = response.json()
+    record_tokens(body.get('usage'))
+    meter = _token_meter.get()
+    if meter is not None:
+        meter.add(body.get('usage'))
+    return body['choices'][0]['message']['content']
+
+def semantic_scholar_search(query, limit=50, fields=PAPER_FIELDS):
+    """Search Semantic Scholar for papers, going through the search cache"""
+    url = f"{SEMANTIC_SCHOLAR_API_URL}/paper/search"
+    params = {
+        'query': query,
+        'limit': limit,
+        'fields': fields
+    }
+
+    cache_key = SearchCache.make_key(url, query, limit=limit, fields=params['fields'])
+    if search_cache is not None:
+        with span('search_cache'):
+            cached = search_cache.get(cache_key, allow_stale=SEARCH_CACHE_ONLY)
+        if cached is not None:
+            return cached
+
+    if SEARCH_CACHE_ONLY:
+        print(f"No cached Semantic Scholar results for query '{query}' (cache-only mode)")
+        return []
+
+    with span('semantic_scholar_request'):
+        response = semantic_scholar_client.get(url, params=params)
+
+    if response.status_code != 200:
+        print(f"Semantic Scholar API error for query '{query}': {response.status_code}")
+        return []
+
+    data = response.json()
+    papers = data.get('data', [])
+    if search_cache is not None:
+        search_cache.set(cache_key, papers)
+    return papers
+
+def semantic_scholar_lookup(paper_ids, fields=PAPER_FIELDS):
+    """Fetch full records for ``paper_ids`` with the batch endpoint.
+
+    Records are cached per paper in the search cache. Returns ({paperId:
+    record}, failed IDs); papers Semantic Scholar does not know are in
+    neither, and papers whose chunk could not be fetched are in the
+    second.
+    """
+    url = f"{SEMANTIC_SCHOLAR_API_URL}/paper/batch"
+    keys = {paper_id: SearchCache.make_key(url, paper_id, fields=fields) for paper_id in paper_ids}
+    papers = {}
+    if search_cache is not None:
+        with span('search_cache'):
+            cached = search_cache.get_many(keys.values(), allow_stale=SEARCH_CACHE_ONLY)
+        papers = {paper_id: cached[key] for paper_id, key in keys.items() if key in cached}
+    missing = [paper_id for paper_id in keys if paper_id not in papers]
+
+    if SEARCH_CACHE_ONLY:
+        if missing:
+            print(f"No cached Semantic Scholar records for {len(missing)} papers (cache-only mode)")
+        return papers, []
+
+    failed = []
+    for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+        chunk = missing[start:start + LOOKUP_BATCH_SIZE]
+        try:
+            with span('semantic_scholar_request'):
+                response = semantic_scholar_client.post(url, params={'fields': fields}, json={'ids': chunk})
+            if response.status_code != 200:
+                print(f"Semantic Scholar batch lookup error for {len(chunk)} papers: {response.status_code}")
+                failed += chunk
+                continue
+            # One entry per requested ID, null where the ID is unknown
+            fetched = {paper_id: paper for paper_id, paper in zip(chunk, response.json()) if paper is not None}
+        except Exception as e:
+            print(f"Error looking up {len(chunk)} papers on Semantic Scholar: {str(e)}")
+            failed += chunk
+            continue
+
+        papers.update(fetched)
+        if search_cache is not None and fetched:
+            search_cache.set_many({keys[paper_id]: paper for paper_id, paper in fetched.items()})
+    return papers, failed
+
+def normalize_title(title):
+    return re.sub(r'[^a-z0-9]+', ' ', (title or '').lower()).strip()
+
+def parse_llm_json(text):
+    """Strip markdown code fences from an LLM response and parse it as JSON"""
+    text = text.strip()
+    if text.startswith('```json'):
+        text = text.replace('```json', '').replace('```', '').strip()
+    elif text.startswith('```'):
+        text = text.replace('```', '').strip()
+    return json.loads(text)
+
+def generate_queries(api_key, abstract):
+    """Ask the LLM for up to 10 search queries describing the abstract"""
+    with span('generate_queries'):
+        queries_response = openai_chat_complete(
+            api_key=api_key,
+            system_prompt=GEN_QUERIES_SYSTEM,
+            user_prompt=GEN_QUERIES_USER_TEMPLATE.format(ABSTRACT=abstract)
+        )
+
+    try:
+        queries = parse_llm_json(queries_response)
+
+        if not isinstance(queries, list):
+            raise ValueError("Expected JSON array of queries")
+
+        # Ensure we have reasonable queries
+        queries = [q for q in queries if isinstance(q, str) and len(q.strip()) > 0][:10]
+
+        if len(queries) == 0:
+            raise ValueError("No valid queries generated")
+    except (json.JSONDecodeError, ValueError) as e:
+        raise LLMOutputError(str(e), queries_response)
+
+    return queries
+
+def format_paper(paper):
+    """Project a Semantic Scholar record onto the fields we return"""
+    return {
+        'paperId': paper.get('paperId', ''),
+        'title': paper.get('title', ''),
+        'authors': [author.get('name', 'Unknown') for author in paper.get('authors', [])],
+        'year': paper.get('year', 'Unknown year'),
+        'venue': paper.get('venue', 'Unknown venue'),
+        'url': paper.get('url', ''),
+        'abstract': paper.get('abstract', '')
+    }
+
+def compare_paper(api_key, abstract, paper):
+    """Score one candidate against the source abstract.
+
+    Returns (score, note), or None if the call or its parsing failed.
+    Failures are logged and treated as a non-match.
+    """
+    info = format_paper(paper)
+
+    try:
+        compare_prompt = COMPARE_USER_TEMPLATE.format(
+            ABSTRACT=abstract,
+            TITLE=info['title'],
+            AUTHORS=', '.join(info['authors']),
+            VENUE=info['venue'],
+            YEAR=info['year'],
+            PAPER_ABSTRACT=info['abstract']
+        )
+
+        with span('compare'):
+            compare_response = openai_chat_complete(
+                api_key=api_key,
+                system_prompt=COMPARE_SYSTEM,
+                user_prompt=compare_prompt
+            )
+
+        comparison = parse_llm_json(compare_response)
+        score = comparison.get('score', 0)
+        note = comparison.get('note', '')
+
+        # Validate score is a number
+        if not isinstance(score, (int, float)):
+            score = 0
+
+    except (json.JSONDecodeError, ValueError):
+        print(f"LLM parsing error for paper comparison: {info['title'] or 'Unknown'}")
+        return None
+    except Exception as e:
+        print(f"Error comparing paper {info['title'] or 'Unknown'}: {str(e)}")
+        return None
+
+    return score, str(note)
+
+def compare_batch(api_key, abstract, papers):
+    """Score several candidates against the source abstract in one call.
+
+    Every paperId in the batch must come back with a numeric score; any
+    that are missing or malformed are re-scored one at a time with
+    compare_paper. Returns (list of (score, note) or None aligned with
+    ``papers``, aligned list of flags marking the individual re-scores).
+    """
+    ids = [paper.get('paperId') or f'candidate-{n}' for n, paper in enumerate(papers)]
+    blocks = []
+    for paper_id, paper in zip(ids, papers):
+        info = format_paper(paper)
+        blocks.append(COMPARE_BATCH_CANDIDATE_TEMPLATE.format(
+            PAPER_ID=paper_id,
+            TITLE=info['title'],
+            AUTHORS=', '.join(info['authors']),
+            VENUE=info['venue'],
+            YEAR=info['year'],
+            PAPER_ABSTRACT=info['abstract']
+        ))
+
+    returned = {}
+    try:
+        with span('compare_batch'):
+            compare_response = openai_chat_complete(
+                api_key=api_key,
+                system_prompt=COMPARE_BATCH_SYSTEM,
+                user_prompt=COMPARE_BATCH_USER_TEMPLATE.format(
+                    ABSTRACT=abstract, CANDIDATES='\n'.join(blocks)
+                )
+            )
+        comparisons = parse_llm_json(compare_response)
+        if not isinstance(comparisons, list):
+            raise ValueError("Expected JSON array of comparisons")
+
+        for comparison in comparisons:
+            if not isinstance(comparison, dict):
+                continue
+            score = comparison.get('score')
+            if not isinstance(score, (int, float)) or isinstance(score, bool):
+                continue
+            returned.setdefault(str(comparison.get('paperId')),
+                                (score, str(comparison.get('note', ''))))
+    except (json.JSONDecodeError, ValueError):
+        print(f"LLM parsing error for batch comparison of {len(papers)} papers")
+    except Exception as e:
+        print(f"Error comparing batch of {len(papers)} papers: {str(e)}")
+
+    results = []
+    fallbacks = []
+    for paper_id, paper in zip(ids, papers):
+        fallbacks.append(paper_id not in returned)
+        if paper_id in returned:
+            results.append(returned[paper_id])
+        else:
+            results.append(compare_paper(api_key, abstract, paper))
+    return results, fallbacks
+
+def compare_and_cache(api_key, abstract, papers, score_cache, abstract_hash, batched):
+    """Score ``papers`` and store successful scores in the cache.
+
+    Scores from the single-paper prompt, including re-scores after a
+    batch call, are cached under that prompt's version. Returns (list of
+    (score, note) or None aligned with ``papers``, number of individual
+    re-scores after a batch call).
+    """
+    if batched:
+        results, fallbacks = compare_batch(api_key, abstract, papers)
+    else:
+        results, fallbacks = [compare_paper(api_key, abstract, papers[0])], [True]
+
+    if score_cache is not None:
+        for paper, scored, single in zip(papers, results, fallbacks):
+            if scored is not None and paper.get('paperId'):
+                prompt_version = COMPARE_PROMPT_VERSION if single else COMPARE_BATCH_PROMPT_VERSION
+                score_cache.put(abstract_hash, paper['paperId'], prompt_version, *scored)
+    return results, sum(fallbacks) if batched else 0
+
+def estimate_compare_tokens(abstract, papers, batched):
+    """Rough token cost of one compare call over ``papers``"""
+    if batched:
+        chars = len(COMPARE_BATCH_SYSTEM) + len(COMPARE_BATCH_USER_TEMPLATE)
+        chars += len(COMPARE_BATCH_CANDIDATE_TEMPLATE) * len(papers)
+    else:
+        chars = len(COMPARE_SYSTEM) + len(COMPARE_USER_TEMPLATE)
+    chars += len(abstract) + sum(len(paper.get('title') or '') + len(paper.get('abstract') or '')
+                                 for paper in papers)
+    return chars // CHARS_PER_TOKEN + COMPLETION_TOKENS_PER_CALL + COMPLETION_TOKENS_PER_PAPER * len(papers)
+
+def build_result(candidate, queries):
+    """Response entry for a scored candidate"""
+    matched = [queries[k] for k in sorted(candidate['queries'])]
+    score, note = candidate['scored']
+    return {
+        'query': matched[0],
+        'queries': matched,
+        'paper': format_paper(candidate['paper']),
+        'similarity_score': score,
+        'note': note
+    }
+
+def lookup_candidates(pool, stats):
+    """Second pass of two-phase retrieval: filter ID-only candidates and fetch their records.
+
+    Returns the candidates worth scoring, with full records; the rest are
+    marked dropped and counted in ``stats``, under ``lookup_errors`` when
+    their batch request failed.
+    """
+    keep = []
+    for candidate in pool:
+        if candidate['best_rank'] >= PAPERS_PER_QUERY and len(candidate['queries']) < 2:
+            candidate['dropped'] = True
+            stats['lookup_filtered'] += 1
+        else:
+            keep.append(candidate)
+
+    with span('semantic_scholar_lookup'):
+        records, failed = semantic_scholar_lookup([c['paper']['paperId'] for c in keep])
+
+    failed = set(failed)
+    survivors = []
+    for candidate in keep:
+        record = records.get(candidate['paper']['paperId'])
+        if candidate['paper']['paperId'] in failed:
+            candidate['dropped'] = True
+            stats['lookup_errors'] += 1
+        elif record is None or not record.get('abstract'):
+            candidate['dropped'] = True
+            stats['missing_abstract'] += 1
+        else:
+            candidate['paper'] = record
+            survivors.append(candidate)
+    return survivors
+
+def iter_search_and_compare(api_key, abstract, queries, max_workers=DEFAULT_MAX_WORKERS,
+                            score_cache=None, prefilter=None,
+                            compare_batch_size=DEFAULT_COMPARE_BATCH_SIZE, schedule=None,
+                            started=None, two_phase=DEFAULT_TWO_PHASE):
+    """Run every query against Semantic Scholar and score the candidates.
+
+    All searches are issued at once. Candidates are merged by paperId as
+    searches return, so a paper found by several queries is scored once.
+    Scores already in ``score_cache`` are reused; the rest are queued on a
+    pool of ``max_workers`` threads.
+
+    With ``compare_batch_size`` above 1, uncached candidates are grouped
+    and scored that many per LLM call (see compare_batch).
+
+    ``prefilter`` enables the embedding cascade: a dict with optional
+    ``min_similarity`` and ``top_n``. Scoring then waits for every search,
+    and only candidates surviving the embedding stage reach the LLM.
+
+    ``schedule`` enables the budgeted scheduler: a dict with optional
+    ``priority`` (see scheduler.priority_key), ``max_llm_calls``,
+    ``max_tokens``, ``deadline_seconds`` (from ``started``, a
+    time.monotonic() value) and ``target_results``. Scoring then waits for
+    every search, sends candidates in priority order with at most
+    ``max_workers`` calls in flight, and stops at the first limit reached.
+    Under ``max_tokens`` each call reserves its estimated cost while in
+    flight, so fewer calls are sent at once as the budget runs out. Once
+    ``target_results`` is reached, further matches from calls already in
+    flight are not reported. Stats report the limit as ``stopped_by``,
+    with the ``unscored`` count.
+
+    With ``two_phase``, searches return only IDs and titles (up to
+    ID_SEARCH_LIMIT per query). Once every search is in, candidates are
+    merged by paperId and normalized title, results past PAPERS_PER_QUERY
+    found by a single query are dropped (``lookup_filtered``), and full
+    records for the rest are fetched with semantic_scholar_lookup.
+    ``missing_abstract`` then counts unique candidates rather than search
+    results.
+
+    Yields ``(kind, payload)`` events as work completes:
+
+    - ``('search', {'query', 'papers'[, 'error']})`` when a search returns
+    - ``('progress', {'scored', 'total'})`` when a compare call returns
+    - ``('result', candidate)`` as soon as a candidate clears the threshold;
+      pass it to build_result (its ``queries`` may still grow)
+    - ``('done', stats)`` once everything has been scored
+    """
+    stats = {
+        'retrieved': 0,
+        'missing_abstract': 0,
+        'duplicates': 0,
+        'unique_candidates': 0,
+        'prefilter_below_floor': 0,
+        'prefilter_outside_top_n': 0,
+        'cache_hits': 0,
+        'llm_comparisons': 0,
+        'llm_calls': 0,
+        'batch_fallbacks': 0,
+        'llm_tokens': 0,
+        'stopped_by': None,
+        'unscored': 0,
+        'lookup_filtered': 0,
+        'lookup_errors': 0,
+    }
+    abstract_hash = abstract_key(abstract)
+    batched = compare_batch_size > 1
+    # Batch calls fall back to the single-paper prompt, whose scores are cached under its own version
+    prompt_versions = ((COMPARE_BATCH_PROMPT_VERSION, COMPARE_PROMPT_VERSION) if batched
+                       else (COMPARE_PROMPT_VERSION,))
+    budget = None
+    if schedule is not None:
+        budget = Budget(max_llm_calls=schedule.get('max_llm_calls'), max_tokens=schedule.get('max_tokens'),
+                        deadline_seconds=schedule.get('deadline_seconds'),
+                        target_results=schedule.get('target_results'), started=started)
+    meter = TokenMeter()
+    candidates = {}
+    titles = {}
+    pending = []
+    ready = []
+    queued = deque()
+    batches = {}
+    outstanding = set()
+    reserved = {}
+    scored_count = 0
+    llm_scored = 0
+    matched = 0
+
+    search_pool = ThreadPoolExecutor(max_workers=len(queries) or 1)
+    compare_pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def flush():
+        if not pending:
+            return
+        # Run in a copy of this context so spans land in the caller's request timings
+        future = compare_pool.submit(
+            contextvars.copy_context().run, metered, meter, compare_and_cache, api_key, abstract,
+            [c['paper'] for c in pending], score_cache, abstract_hash, batched
+        )
+        batches[future] = list(pending)
+        outstanding.add(future)
+        stats['llm_calls'] += 1
+        pending.clear()
+        return future
+
+    def enqueue(candidate):
+        paper_id = candidate['paper'].get('paperId')
+        if paper_id and score_cache is not None:
+            cached = None
+            with span('score_cache'):
+                for prompt_version in prompt_versions:
+                    cached = score_cache.get(abstract_hash, paper_id, prompt_version)
+                    if cached is not None:
+                        break
+            if cached is not None:
+                stats['cache_hits'] += 1
+                candidate['scored'] = cached
+                ready.append(candidate)
+                return
+
+        if budget is not None:
+            queued.append(candidate)
+            return
+        stats['llm_comparisons'] += 1
+        pending.append(candidate)
+        if len(pending) >= compare_batch_size:
+            flush()
+
+    def dispatch():
+        """Send queued candidates in priority order until a limit is reached"""
+        while queued and stats['stopped_by'] is None and len(batches) < max_workers:
+            stats['stopped_by'] = budget.exhausted(stats['llm_calls'] + stats['batch_fallbacks'],
+                                                   meter.total, matched)
+            if stats['stopped_by'] is not None:
+                break
+            batch = [queued[k]['paper'] for k in range(min(compare_batch_size, len(queued)))]
+            if llm_scored:
+                estimate = meter.total * len(batch) // llm_scored
+            else:
+                estimate = estimate_compare_tokens(abstract, batch, batched)
+            if not budget.affords(meter.total, sum(reserved.values()), estimate):
+                # Let the calls in flight settle what is left before giving up
+                if not batches:
+                    stats['stopped_by'] = 'max_tokens'
+                break
+            while queued and len(pending) < compare_batch_size:
+                pending.append(queued.popleft())
+            stats['llm_comparisons'] += len(pending)
+            reserved[flush()] = estimate
+
+    def short_of_target():
+        """Whether another match is still wanted; past target_results they are not reported"""
+        return budget is None or budget.target_results is None or matched < budget.target_results
+
+    def is_match(candidate):
+        return candidate['scored'] is not None and candidate['scored'][0] > SCORE_THRESHOLD
+
+    try:
+        search_futures = {
+            search_pool.submit(contextvars.copy_context().run, semantic_scholar_search, query,
+                               *((ID_SEARCH_LIMIT, ID_FIELDS) if two_phase else (PAPERS_PER_QUERY,))): i
+            for i, query in enumerate(queries)
+        }
+        outstanding.update(search_futures)
+        searches_left = len(search_futures)
+
+        while outstanding or (queued and stats['stopped_by'] is None):
+            if budget is not None:
+                dispatch()
+                if not outstanding:
+                    break
+                timeout = budget.remaining()
+                done, _ = wait(outstanding, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done and timeout is not None:
+                    # Out of time: abandon calls still in flight
+                    stats['stopped_by'] = stats['stopped_by'] or 'deadline'
+                    break
+            else:
+                done, _ = wait(outstanding, return_when=FIRST_COMPLETED)
+            outstanding.difference_update(done)
+
+            for future in done:
+                if future in batches:
+                    batch = batches.pop(future)
+                    reserved.pop(future, None)
+                    results, fallbacks = future.result()
+                    stats['batch_fallbacks'] += fallbacks
+                    llm_scored += len(batch)
+                    for candidate, scored in zip(batch, results):
+                        candidate['scored'] = scored
+                        scored_count += 1
+                        if is_match(candidate) and short_of_target():
+                            matched += 1
+                            yield 'result', candidate
+                    yield 'progress', {
+                        'scored': scored_count,
+                        'total': stats['cache_hits'] + stats['llm_comparisons'] + len(queued)
+                    }
+                    continue
+
+                i = search_futures[future]
+                searches_left -= 1
+                try:
+                    papers = future.result()
+                except Exception as e:
+                    print(f"Error processing query '{queries[i]}': {str(e)}")
+                    yield 'search', {'query': queries[i], 'papers': 0, 'error': str(e)}
+                    papers = []
+                else:
+                    yield 'search', {'query': queries[i], 'papers': len(papers)}
+
+                for rank, paper in enumerate(papers):
+                    stats['retrieved'] += 1
+                    if two_phase:
+                        # Abstracts come with the second pass; IDs are needed to fetch them
+                        if not paper.get('paperId'):
+                            stats['missing_abstract'] += 1
+                            continue
+                    elif not paper.get('abstract'):
+                        stats['missing_abstract'] += 1
+                        continue
+
+                    key = paper.get('paperId') or (i, rank)
+                    candidate = candidates.get(key)
+                    if candidate is None and two_phase and normalize_title(paper.get('title')):
+                        candidate = titles.get(normalize_title(paper.get('title')))
+                    if candidate is not None:
+                        stats['duplicates'] += 1
+                        candidate['queries'].add(i)
+                        candidate['rank'] = min(candidate['rank'], (i, rank))
+                        candidate['best_rank'] = min(candidate['best_rank'], rank)
+                        continue
+
+                    candidate = {'paper': paper, 'queries': {i}, 'rank': (i, rank), 'best_rank': rank}
+                    candidates[key] = candidate
+                    if two_phase and normalize_title(paper.get('title')):
+                        titles.setdefault(normalize_title(paper.get('title')), candidate)
+                    if prefilter is None and budget is None and not two_phase:
+                        enqueue(candidate)
+
+                if searches_left == 0:
+                    pool = list(candidates.values())
+                    if two_phase:
+                        pool = lookup_candidates(pool, stats)
+                    stats['unique_candidates'] = len(pool)
+                    if prefilter is not None:
+                        with span('prefilter'):
+                            keep, below_floor, outside_top_n = embedding_prefilter(
+                                abstract, [c['paper']['abstract'] for c in pool],
+                                min_similarity=prefilter.get('min_similarity'),
+                                top_n=prefilter.get('top_n')
+                            )
+                        stats['prefilter_below_floor'] = below_floor
+                        stats['prefilter_outside_top_n'] = outside_top_n
+                        for dropped in set(range(len(pool))) - set(keep):
+                            pool[dropped]['dropped'] = True
+                        pool = [pool[k] for k in keep]
+                    if budget is not None:
+                        pool.sort(key=priority_key(schedule.get('priority') or DEFAULT_PRIORITY, abstract))
+                    if prefilter is not None or budget is not None or two_phase:
+                        for candidate in pool:
+                            enqueue(candidate)
+                    flush()
+
+            for candidate in ready:
+                scored_count += 1
+                if is_match(candidate) and short_of_target():
+                    matched += 1
+                    yield 'result', candidate
+            ready.clear()
+
+        stats['llm_tokens'] = meter.total
+        if searches_left:
+            # Stopped before the pool was built; report what the searches found so far
+            stats['unique_candidates'] = len(candidates)
+        stats['unscored'] = sum(1 for c in candidates.values() if 'scored' not in c and not c.get('dropped'))
+        yield 'done', stats
+    finally:
+        # Also reached when a streaming client disconnects mid-run
+        search_pool.shutdown(wait=False, cancel_futures=True)
+        compare_pool.shutdown(wait=False, cancel_futures=True)
+
+def search_and_compare(api_key, abstract, queries, max_workers=DEFAULT_MAX_WORKERS,
+                       score_cache=None, prefilter=None,
+                       compare_batch_size=DEFAULT_COMPARE_BATCH_SIZE, schedule=None, started=None,
+                       two_phase=DEFAULT_TWO_PHASE):
+    """Run the whole search and scoring pipeline and return (results, stats).
+
+    Results are ordered by the first query and search rank that surfaced
+    each paper, as in a sequential run.
+    """
+    matches = []
+    stats = {}
+    for kind, payload in iter_search_and_compare(
+            api_key, abstract, queries, max_workers=max_workers,
+            score_cache=score_cache, prefilter=prefilter,
+            compare_batch_size=compare_batch_size, schedule=schedule, started=started,
+            two_phase=two_phase):
+        if kind == 'result':
+            matches.append(payload)
+        elif kind == 'done':
+            stats = payload
+
+    matches.sort(key=lambda c: c['rank'])
+    return [build_result(c, queries) for c in matches], stats
@@ -0,0 +1,78 @@
+import re
+import time
+
+# Cheap signals for ordering candidates before the LLM sees them
+PRIORITIES = ('queries', 'rank', 'lexical')
+DEFAULT_PRIORITY = 'queries'
+
+# Words too common to say anything about overlap with the abstract
+STOPWORDS = frozenset("""
+a an and are as at be by can for from has have in into is it its of on or our over such that the their
+these this to under using we which while with via based new show propose proposed approach method methods
+paper results study work
+""".split())
+
+
+def terms(text):
+    return {word for word in re.findall(r'[a-z0-9]+', text.lower()) if len(word) > 2 and word not in STOPWORDS}
+
+
+def priority_key(priority, abstract):
+    """Sort key putting the candidates most likely to score well first.
+
+    - ``queries``: found by the most queries, then best search rank
+    - ``rank``: best Semantic Scholar rank in any query, then most queries
+    - ``lexical``: largest share of the abstract's terms in the
+      candidate's title and abstract, then best search rank
+    """
+    if priority == 'rank':
+        return lambda c: (c['best_rank'], -len(c['queries']), c['rank'])
+    if priority == 'lexical':
+        source = terms(abstract)
+
+        def overlap(c):
+            paper = c['paper']
+            shared = len(source & terms(f"{paper.get('title') or ''} {paper.get('abstract') or ''}"))
+            return (-shared / (len(source) or 1), c['best_rank'], c['rank'])
+        return overlap
+    return lambda c: (-len(c['queries']), c['best_rank'], c['rank'])
+
+
+class Budget:
+    """Limits on one scoring run; every limit is optional.
+
+    Call and token limits are checked before each compare call is sent.
+    Calls in flight count against the token limit by their estimated cost
+    (see affords). The deadline is measured from ``started`` (a
+    time.monotonic() value).
+    """
+
+    def __init__(self, max_llm_calls=None, max_tokens=None, deadline_seconds=None, target_results=None,
+                 started=None):
+        self.max_llm_calls = max_llm_calls
+        self.max_tokens = max_tokens
+        self.target_results = target_results
+        started = time.monotonic() if started is None else started
+        self.deadline = started + deadline_seconds if deadline_seconds is not None else None
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def affords(self, tokens, reserved, estimate):
+        """Whether a call estimated at ``estimate`` tokens fits next to ``reserved`` tokens in flight"""
+        return self.max_tokens is None or tokens + reserved + estimate <= self.max_tokens
+
+    def exhausted(self, llm_calls, tokens, matches):
+        """Name of the first limit reached, or None"""
+        if self.target_results is not None and matches >= self.target_results:
+            return 'target_results'
+        if self.max_llm_calls is not None and llm_calls >= self.max_llm_calls:
+            return 'max_llm_calls'
+        if self.max_tokens is not None and tokens >= self.max_tokens:
+            return 'max_tokens'
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return 'deadline'
+        return None
@@ -0,0 +1,69 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+
+def abstract_key(abstract):
+    """Hash of the abstract after case and whitespace normalization"""
+    normalized = re.sub(r'\s+', ' ', abstract).strip().lower()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class ScoreCache:
+    """SQLite store of LLM comparison results.
+
+    Entries are keyed on (abstract hash, paperId, prompt version) so a
+    change to the compare prompt or model never serves stale scores.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS scores (
+                abstract_hash TEXT NOT NULL,
+                paper_id TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                score REAL NOT NULL,
+                note TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (abstract_hash, paper_id, prompt_version)
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, abstract_hash, paper_id, prompt_version):
+        """Return the cached (score, note) or None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT score, note FROM scores '
+                'WHERE abstract_hash = ? AND paper_id = ? AND prompt_version = ?',
+                (abstract_hash, paper_id, prompt_version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        score, note = row
+        return (int(score) if float(score).is_integer() else score), note
+
+    def put(self, abstract_hash, paper_id, prompt_version, score, note):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)',
+                (abstract_hash, paper_id, prompt_version, score, note, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
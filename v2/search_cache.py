@@ -0,0 +1,130 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+# v1/ and v2/ carry identical copies of this module; change both together
+
+# Keys per statement in bulk lookups, under SQLite's default variable limit
+BULK_CHUNK = 500
+
+
+class SearchCache:
+    """Disk-backed cache of search results, keyed by normalized query and parameters.
+
+    Entries expire after ``ttl`` seconds and the least recently used ones are
+    evicted once stored payloads exceed ``max_bytes``. Expired entries stay on
+    disk until evicted so that cache-only mode can keep serving them.
+    """
+
+    def __init__(self, path: str, ttl: float = 24 * 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)')
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(source: str, query: str, **params: Any) -> str:
+        """Build a cache key; queries differing only in case or spacing share an entry"""
+        normalized = re.sub(r'\s+', ' ', query).strip().lower()
+        return json.dumps([source, normalized, params], sort_keys=True)
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        """Return the cached value, or None if it is missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or (not allow_stale and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value, evicting LRU entries over the size cap"""
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (key, payload, len(payload), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def get_many(self, keys: Iterable[str], allow_stale: bool = False) -> Dict[str, Any]:
+        """Return {key: value} for the keys that are cached and fresh, one transaction per chunk"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(keys), BULK_CHUNK):
+            chunk = keys[start:start + BULK_CHUNK]
+            now = time.time()
+            marks = ','.join('?' * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f'SELECT key, value, created_at FROM responses WHERE key IN ({marks})', chunk
+                ).fetchall()
+                fresh = [(key, value) for key, value, created_at in rows
+                         if allow_stale or now - created_at <= self.ttl]
+                if fresh:
+                    self._conn.executemany('UPDATE responses SET last_access = ? WHERE key = ?',
+                                           [(now, key) for key, _ in fresh])
+                    self._conn.commit()
+                self.hits += len(fresh)
+                self.misses += len(chunk) - len(fresh)
+            found.update((key, json.loads(value)) for key, value in fresh)
+        return found
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        """Store several values, one transaction per chunk"""
+        items = list(items.items())
+        for start in range(0, len(items), BULK_CHUNK):
+            now = time.time()
+            rows = []
+            for key, value in items[start:start + BULK_CHUNK]:
+                payload = json.dumps(value)
+                rows.append((key, payload, len(payload), now, now))
+            with self._lock:
+                self._conn.executemany('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)', rows)
+                self._evict()
+                self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY last_access'):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', doomed)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
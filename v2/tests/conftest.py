@@ -0,0 +1,87 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import pytest
+
+# The app's modules import each other by plain name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep tests off the on-disk stores; these are read when the modules are imported
+os.environ['RELATED_WORK_SCORE_CACHE'] = ''
+os.environ['RELATED_WORK_SEARCH_CACHE'] = ''
+os.environ['RELATED_WORK_JOB_STORE'] = ''
+
+import related_work  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self._body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self._body
+
+
+class FakeUpstream:
+    """Semantic Scholar search and OpenAI chat completions, answered in process.
+
+    Every query returns ``papers_per_query`` papers, overlapping with the
+    neighbouring queries. A paper scores ``scores[paperId]`` (``default_score``
+    otherwise), and every OpenAI call reports ``tokens`` total tokens.
+    """
+
+    def __init__(self, queries=('query a', 'query b', 'query c'), papers_per_query=10):
+        self.queries = list(queries)
+        self.papers_per_query = papers_per_query
+        self.scores = {}
+        self.default_score = 50
+        self.tokens = 100
+        self.search_delay = {}
+        self.calls = []
+        self.omit_from_batch = set()
+        self._lock = threading.Lock()
+
+    def search(self, query, limit=50, fields=related_work.PAPER_FIELDS):
+        time.sleep(self.search_delay.get(query, 0))
+        start = self.queries.index(query) * self.papers_per_query // 2
+        return [{'paperId': f'p{n}', 'title': f'Paper p{n}', 'abstract': f'Abstract of paper {n}',
+                 'authors': [{'name': 'A. Author'}], 'year': 2024, 'venue': 'Venue', 'url': ''}
+                for n in range(start, start + self.papers_per_query)][:limit]
+
+    def post(self, url, **kwargs):
+        system, user = (message['content'] for message in kwargs['json']['messages'])
+        if system == related_work.GEN_QUERIES_SYSTEM:
+            content, kind = self.queries, 'queries'
+        elif system == related_work.COMPARE_BATCH_SYSTEM:
+            content = [{'paperId': paper_id, 'score': self.score(paper_id), 'note': 'batch'}
+                       for paper_id in re.findall(r'^paperId: (\S+)$', user, re.M)
+                       if paper_id not in self.omit_from_batch]
+            kind = 'compare_batch'
+        else:
+            paper_id = re.search(r'^Title: Paper (\S+)$', user, re.M).group(1)
+            content, kind = {'score': self.score(paper_id), 'note': 'single'}, 'compare'
+        with self._lock:
+            self.calls.append(kind)
+        return FakeResponse({'choices': [{'message': {'content': json.dumps(content)}}],
+                             'usage': {'prompt_tokens': self.tokens // 2, 'completion_tokens': self.tokens // 2,
+                                       'total_tokens': self.tokens}})
+
+    def score(self, paper_id):
+        return self.scores.get(paper_id, self.default_score)
+
+    def count(self, kind):
+        with self._lock:
+            return self.calls.count(kind)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FakeUpstream()
+    monkeypatch.setattr(related_work, 'openai_client', fake)
+    monkeypatch.setattr(related_work, 'semantic_scholar_search', fake.search)
+    return fake
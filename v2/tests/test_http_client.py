@@ -0,0 +1,97 @@
+import email.utils
+import time
+
+import pytest
+import requests
+
+from http_client import TokenBucket, UpstreamClient, parse_retry_after
+
+
+class FakeHTTPResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b'{}'
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """Replays ``outcomes`` (status codes, or exceptions to raise) one per request"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.sent = 0
+
+    def request(self, method, url, **kwargs):
+        self.sent += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def client(outcomes, **kwargs):
+    upstream = UpstreamClient('test', rate=1000, burst=100, timeout=1, backoff_base=0.001, **kwargs)
+    upstream.session = FakeSession(outcomes)
+    return upstream
+
+
+def test_parse_retry_after_seconds_and_dates():
+    assert parse_retry_after('2') == 2.0
+    assert parse_retry_after('-5') == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    in_a_minute = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 <= parse_retry_after(in_a_minute) <= 60
+    assert parse_retry_after(email.utils.formatdate(time.time() - 60, usegmt=True)) == 0.0
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=50, capacity=2)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() > 0.0
+
+
+def test_token_bucket_defer_holds_callers_back():
+    bucket = TokenBucket(rate=1000, capacity=10)
+    bucket.defer(0.05)
+    started = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started >= 0.05
+
+
+def test_retries_server_errors_until_success():
+    upstream = client([FakeHTTPResponse(503), FakeHTTPResponse(500), FakeHTTPResponse(200)])
+    assert upstream.get('http://test').status_code == 200
+    stats = upstream.stats()
+    assert (stats['requests'], stats['retries'], stats['server_errors']) == (3, 2, 2)
+
+
+def test_honours_retry_after_on_429():
+    upstream = client([FakeHTTPResponse(429, {'Retry-After': '0.05'}), FakeHTTPResponse(200)])
+    started = time.monotonic()
+    assert upstream.get('http://test').status_code == 200
+    assert time.monotonic() - started >= 0.05
+    assert upstream.stats()['throttled'] == 1
+
+
+def test_returns_the_last_response_when_retries_run_out():
+    upstream = client([FakeHTTPResponse(503)] * 3, max_retries=2)
+    assert upstream.get('http://test').status_code == 503
+    assert upstream.session.sent == 3
+
+
+def test_client_errors_are_not_retried():
+    upstream = client([FakeHTTPResponse(404)])
+    assert upstream.get('http://test').status_code == 404
+    assert upstream.stats()['retries'] == 0
+
+
+def test_connection_error_on_the_last_attempt_is_raised():
+    upstream = client([requests.ConnectionError('reset')] * 2, max_retries=1)
+    with pytest.raises(requests.ConnectionError):
+        upstream.get('http://test')
+    assert upstream.stats()['connection_errors'] == 2
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+import related_work
+from jobs import JobRunner, JobStore, LeaseLost
+
+OPTIONS = {'abstract': 'graph neural networks', 'max_workers': 4, 'prefilter': None, 'compare_batch_size': 1}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'))
+
+
+def wait_for(store, job_id, statuses=('done', 'failed'), timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job stayed {store.get(job_id)['status']}")
+
+
+def test_fresh_lease_blocks_claim_and_interruption(store):
+    job_id = store.create(OPTIONS, 'runner-a')
+    assert not store.claim(job_id, 'runner-b', lease=60)
+    assert store.mark_interrupted(lease=60) == 0
+    assert store.get(job_id)['status'] == 'queued'
+
+
+def test_expired_lease_can_be_claimed_and_fences_the_old_owner(store):
+    job_id = store.create(OPTIONS, 'runner-a')
+    time.sleep(0.01)
+    assert store.claim(job_id, 'runner-b', lease=0)
+    with pytest.raises(LeaseLost):
+        store.update(job_id, 'runner-a', scores=[('p1', 'v', 90, 'late')], status='done')
+    assert store.get(job_id)['owner'] == 'runner-b'
+    assert store.scores(job_id) == {}
+
+
+def test_expired_leases_are_marked_interrupted(store):
+    job_id = store.create(OPTIONS, 'runner-a')
+    store.update(job_id, 'runner-a', status='running')
+    time.sleep(0.01)
+    assert store.mark_interrupted(lease=0) == 1
+    job = store.get(job_id)
+    assert job['status'] == 'interrupted'
+    assert job['owner'] is None
+
+
+def test_job_runs_to_completion(store, upstream):
+    upstream.scores = {'p4': 95}
+    runner = JobRunner(store)
+    try:
+        job = wait_for(store, runner.submit(dict(OPTIONS), 'key'))
+    finally:
+        runner.stop()
+    assert job['status'] == 'done'
+    assert job['queries'] == upstream.queries
+    assert [r['paper']['paperId'] for r in job['results']] == ['p4']
+    assert len(store.scores(job['id'])) == 20
+
+
+def test_resume_reuses_queries_and_checkpointed_scores(store, upstream):
+    job_id = store.create(dict(OPTIONS), 'crashed-runner')
+    version = related_work.COMPARE_PROMPT_VERSION
+    store.update(job_id, 'crashed-runner', status='running', queries=upstream.queries,
+                 scores=[(f'p{n}', version, 90 if n == 2 else 10, 'checkpointed') for n in range(12)])
+    time.sleep(0.01)
+    store.mark_interrupted(lease=0)
+
+    runner = JobRunner(store)
+    try:
+        assert runner.resume(job_id, 'key') is None
+        job = wait_for(store, job_id)
+    finally:
+        runner.stop()
+    assert job['status'] == 'done'
+    assert job['attempts'] == 1
+    assert job['progress']['resumed_scores'] == 12
+    assert upstream.count('queries') == 0
+    assert upstream.count('compare') == 8
+    assert [r['paper']['paperId'] for r in job['results']] == ['p2']
+
+
+def test_resume_is_refused_while_another_runner_holds_the_job(store, upstream):
+    job_id = store.create(dict(OPTIONS), 'live-runner')
+    runner = JobRunner(store)
+    try:
+        assert runner.resume(job_id, 'key') is not None
+    finally:
+        runner.stop()
+    assert store.get(job_id)['owner'] == 'live-runner'
+    assert upstream.calls == []
+
+
+def test_resume_of_unknown_job(store):
+    runner = JobRunner(store)
+    try:
+        assert runner.resume('missing', 'key') == 'Job not found'
+    finally:
+        runner.stop()
@@ -0,0 +1,87 @@
+import pytest
+
+import related_work
+from conftest import FakeResponse
+from score_cache import ScoreCache
+from search_cache import SearchCache
+
+
+class FakeSemanticScholar:
+    """Batch lookups answered from ``records``; ``fail`` makes every call raise or return that status"""
+
+    def __init__(self, records, fail=None):
+        self.records = records
+        self.fail = fail
+        self.requested = []
+
+    def post(self, url, params=None, json=None):
+        self.requested.append(list(json['ids']))
+        if isinstance(self.fail, Exception):
+            raise self.fail
+        if self.fail is not None:
+            return FakeResponse({'error': 'unavailable'}, status_code=self.fail)
+        return FakeResponse([self.records.get(paper_id) for paper_id in json['ids']])
+
+
+def candidate(paper_id, best_rank=0):
+    return {'paper': {'paperId': paper_id, 'title': f'Paper {paper_id}'}, 'queries': {0}, 'rank': (0, best_rank),
+            'best_rank': best_rank}
+
+
+def test_batch_fallbacks_are_cached_under_the_single_paper_prompt(tmp_path, upstream):
+    upstream.omit_from_batch = {'p3'}
+    score_cache = ScoreCache(str(tmp_path / 'scores.sqlite3'))
+    related_work.search_and_compare('key', 'graph neural networks', upstream.queries[:1],
+                                    score_cache=score_cache, compare_batch_size=5)
+    abstract_hash = related_work.abstract_key('graph neural networks')
+    assert score_cache.get(abstract_hash, 'p3', related_work.COMPARE_BATCH_PROMPT_VERSION) is None
+    assert score_cache.get(abstract_hash, 'p3', related_work.COMPARE_PROMPT_VERSION) == (50, 'single')
+    assert score_cache.get(abstract_hash, 'p4', related_work.COMPARE_BATCH_PROMPT_VERSION) == (50, 'batch')
+
+
+def test_rerun_with_batch_fallbacks_is_answered_from_the_cache(tmp_path, upstream):
+    upstream.omit_from_batch = {'p3'}
+    score_cache = ScoreCache(str(tmp_path / 'scores.sqlite3'))
+    first, _ = related_work.search_and_compare('key', 'graph neural networks', upstream.queries[:1],
+                                               score_cache=score_cache, compare_batch_size=5)
+    upstream.calls.clear()
+    second, stats = related_work.search_and_compare('key', 'graph neural networks', upstream.queries[:1],
+                                                    score_cache=score_cache, compare_batch_size=5)
+    assert upstream.calls == []
+    assert stats['cache_hits'] == 10
+    assert second == first
+
+
+def test_lookup_caches_records_in_bulk(tmp_path, monkeypatch):
+    records = {'a': {'paperId': 'a', 'abstract': 'A'}, 'b': {'paperId': 'b', 'abstract': 'B'}}
+    client = FakeSemanticScholar(records)
+    monkeypatch.setattr(related_work, 'semantic_scholar_client', client)
+    monkeypatch.setattr(related_work, 'search_cache', SearchCache(str(tmp_path / 'search.sqlite3')))
+
+    assert related_work.semantic_scholar_lookup(['a', 'b', 'missing']) == (records, [])
+    assert related_work.semantic_scholar_lookup(['a', 'b']) == (records, [])
+    assert client.requested == [['a', 'b', 'missing']]
+
+
+@pytest.mark.parametrize('fail', [ConnectionError('reset'), 503])
+def test_failed_lookups_are_counted_as_lookup_errors(monkeypatch, fail):
+    monkeypatch.setattr(related_work, 'semantic_scholar_client', FakeSemanticScholar({}, fail=fail))
+    monkeypatch.setattr(related_work, 'search_cache', None)
+    stats = {'lookup_filtered': 0, 'missing_abstract': 0, 'lookup_errors': 0}
+    pool = [candidate('a'), candidate('b')]
+
+    assert related_work.lookup_candidates(pool, stats) == []
+    assert stats == {'lookup_filtered': 0, 'missing_abstract': 0, 'lookup_errors': 2}
+    assert all(c['dropped'] for c in pool)
+
+
+def test_lookup_drops_deep_single_query_results_and_missing_abstracts(monkeypatch):
+    records = {'a': {'paperId': 'a', 'abstract': 'A'}, 'b': {'paperId': 'b', 'abstract': None}}
+    monkeypatch.setattr(related_work, 'semantic_scholar_client', FakeSemanticScholar(records))
+    monkeypatch.setattr(related_work, 'search_cache', None)
+    stats = {'lookup_filtered': 0, 'missing_abstract': 0, 'lookup_errors': 0}
+    pool = [candidate('a'), candidate('b'), candidate('deep', best_rank=related_work.PAPERS_PER_QUERY)]
+
+    survivors = related_work.lookup_candidates(pool, stats)
+    assert [c['paper'] for c in survivors] == [records['a']]
+    assert stats == {'lookup_filtered': 1, 'missing_abstract': 1, 'lookup_errors': 0}
@@ -0,0 +1,100 @@
+import time
+
+import related_work
+from scheduler import Budget, priority_key
+
+
+def run(upstream, **kwargs):
+    kwargs.setdefault('max_workers', 4)
+    return related_work.search_and_compare('key', 'graph neural networks', upstream.queries, **kwargs)
+
+
+def test_budget_reports_the_first_limit_reached():
+    budget = Budget(max_llm_calls=5, max_tokens=1000, target_results=2)
+    assert budget.exhausted(0, 0, 0) is None
+    assert budget.exhausted(5, 0, 0) == 'max_llm_calls'
+    assert budget.exhausted(0, 1000, 0) == 'max_tokens'
+    assert budget.exhausted(5, 1000, 2) == 'target_results'
+
+
+def test_budget_deadline_counts_from_started():
+    budget = Budget(deadline_seconds=10, started=time.monotonic() - 11)
+    assert budget.remaining() == 0.0
+    assert budget.exhausted(0, 0, 0) == 'deadline'
+    assert Budget().remaining() is None
+
+
+def test_budget_affords_counts_reserved_tokens():
+    budget = Budget(max_tokens=1000)
+    assert budget.affords(400, 300, 300)
+    assert not budget.affords(400, 300, 301)
+    assert Budget().affords(10 ** 9, 10 ** 9, 10 ** 9)
+
+
+def test_priority_key_orders_by_queries_then_rank():
+    candidates = [
+        {'paper': {}, 'queries': {0}, 'best_rank': 0, 'rank': (0, 0)},
+        {'paper': {}, 'queries': {0, 1}, 'best_rank': 5, 'rank': (0, 5)},
+        {'paper': {}, 'queries': {1}, 'best_rank': 1, 'rank': (1, 1)},
+    ]
+    by_queries = sorted(candidates, key=priority_key('queries', ''))
+    assert [c['best_rank'] for c in by_queries] == [5, 0, 1]
+    by_rank = sorted(candidates, key=priority_key('rank', ''))
+    assert [c['best_rank'] for c in by_rank] == [0, 1, 5]
+
+
+def test_priority_key_lexical_prefers_shared_terms():
+    candidates = [
+        {'paper': {'title': 'Cooking pasta', 'abstract': ''}, 'queries': {0}, 'best_rank': 0, 'rank': (0, 0)},
+        {'paper': {'title': 'Graph neural networks', 'abstract': ''}, 'queries': {0}, 'best_rank': 1,
+         'rank': (0, 1)},
+    ]
+    ordered = sorted(candidates, key=priority_key('lexical', 'graph neural networks for molecules'))
+    assert ordered[0]['paper']['title'] == 'Graph neural networks'
+
+
+def test_without_a_schedule_every_candidate_is_scored(upstream):
+    upstream.scores = {'p3': 90, 'p12': 80}
+    results, stats = run(upstream)
+    assert stats['unique_candidates'] == 20
+    assert stats['llm_calls'] == 20
+    assert stats['stopped_by'] is None
+    assert stats['unscored'] == 0
+    assert [r['paper']['paperId'] for r in results] == ['p3', 'p12']
+
+
+def test_max_llm_calls_caps_compare_calls(upstream):
+    results, stats = run(upstream, schedule={'max_llm_calls': 5})
+    assert upstream.count('compare') == 5
+    assert stats['stopped_by'] == 'max_llm_calls'
+    assert stats['unscored'] == 15
+
+
+def test_max_tokens_is_never_exceeded(upstream):
+    upstream.tokens = 150
+    results, stats = run(upstream, max_workers=8, schedule={'max_tokens': 1000})
+    assert stats['stopped_by'] == 'max_tokens'
+    assert stats['llm_tokens'] <= 1000
+    assert stats['llm_calls'] >= 1
+
+
+def test_max_tokens_below_one_call_sends_nothing(upstream):
+    results, stats = run(upstream, schedule={'max_tokens': 100})
+    assert upstream.count('compare') == 0
+    assert stats['stopped_by'] == 'max_tokens'
+    assert stats['unscored'] == 20
+
+
+def test_target_results_returns_exactly_the_target(upstream):
+    upstream.default_score = 90
+    results, stats = run(upstream, max_workers=8, schedule={'target_results': 3})
+    assert stats['stopped_by'] == 'target_results'
+    assert len(results) == 3
+
+
+def test_deadline_before_searches_finish_reports_candidates_found(upstream):
+    upstream.search_delay = {'query c': 2}
+    results, stats = run(upstream, schedule={'deadline_seconds': 0.3}, started=time.monotonic())
+    assert stats['stopped_by'] == 'deadline'
+    assert stats['unique_candidates'] == 15
+    assert stats['unscored'] == 15
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from search_cache import SearchCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SearchCache(str(tmp_path / 'search.sqlite3'), ttl=60)
+
+
+def test_keys_ignore_case_and_spacing():
+    assert SearchCache.make_key('s2', '  Graph  Neural ', limit=5) == SearchCache.make_key('s2', 'graph neural', limit=5)
+    assert SearchCache.make_key('s2', 'graph', limit=5) != SearchCache.make_key('s2', 'graph', limit=6)
+
+
+def test_get_and_set(cache):
+    assert cache.get('k') is None
+    cache.set('k', [{'paperId': 'a'}])
+    assert cache.get('k') == [{'paperId': 'a'}]
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+
+def test_expired_entries_are_served_only_when_stale_is_allowed(cache):
+    cache.set('k', 1)
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get('k') is None
+    assert cache.get('k', allow_stale=True) == 1
+    assert cache.get_many(['k']) == {}
+    assert cache.get_many(['k'], allow_stale=True) == {'k': 1}
+
+
+def test_bulk_reads_and_writes_span_chunks(cache):
+    cache.set_many({f'k{n}': n for n in range(1200)})
+    found = cache.get_many([f'k{n}' for n in range(1300)])
+    assert len(found) == 1200
+    assert found['k1199'] == 1199
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1200, 100)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SearchCache(str(tmp_path / 'search.sqlite3'), max_bytes=100)
+    cache.set('old', 'x' * 40)
+    time.sleep(0.01)
+    cache.set('recent', 'x' * 40)
+    time.sleep(0.01)
+    cache.get('old')
+    cache.set_many({'new': 'x' * 40})
+    assert cache.get('recent') is None
+    assert cache.get('old') is not None
+    assert cache.get('new') is not None